@@ -0,0 +1,59 @@
+"""
+Benchmark: per-email vs batched classification.
+
+Classifies a synthetic batch with a stub LLM whose latency has a fixed per-call part and a
+per-prompt-token part, and prints emails/second and LLM calls per email for the per-item
+path and for several batch token budgets. --malformed-rate makes a share of batch answers
+come back truncated to exercise the per-item fallback.
+
+    python -m benchmarks.bench_categorize --emails 100 --budgets 500 1500 4000
+"""
+
+import argparse
+import asyncio
+
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+from tools.metrics import collecting_stats
+
+
+def make_emails(count: int):
+    kinds = ["Weekly digest", "Urgent: server down", "Lunch on Friday?", "Invoice question"]
+    return [
+        {"from": f"sender{i}@example.com", "subject": f"{kinds[i % len(kinds)]} #{i}",
+         "snippet": "Hello, following up on our conversation about the project timeline and budget. " * 2}
+        for i in range(count)
+    ]
+
+
+async def main(count: int, latency: float, token_latency: float, budgets, malformed_rate: float):
+    runs = [("per_item", False, None)] + [(f"batch/{b}", True, b) for b in budgets]
+    reference = None
+    # Without this, every run after the first is answered from the on-disk cache the first one filled.
+    categorize_mail.llm_cache = LLMCache(enabled=False)
+    for label, batch, budget in runs:
+        llm_client.set_llm(StubLLM(latency=latency, prompt_token_latency=token_latency, malformed_rate=malformed_rate))
+        emails = make_emails(count)
+        with collecting_stats() as run_stats:
+            if batch:
+                await categorize_mail.categorize_emails(emails, batch=True, token_budget=budget)
+            else:
+                await categorize_mail.categorize_emails(emails, batch=False)
+        labels = [mail["category"] for mail in emails]
+        reference = reference or labels
+        stats = run_stats["categorize"]
+        print(f"{label:<12} {stats['emails_per_second']:8.1f} emails/s  {stats['llm_calls_per_email']:.3f} calls/email  "
+              f"fallbacks={stats['fallbacks']:<3} same_labels={labels == reference}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="fixed seconds per LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.0002, help="seconds per prompt token")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[500, 1500, 4000])
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.emails, args.latency, args.token_latency, args.budgets, args.malformed_rate))
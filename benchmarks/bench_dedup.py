@@ -0,0 +1,134 @@
+"""
+Benchmark: reply dedup cost as the outbox history grows, and what each dedup key lets through.
+
+For each --sizes history it fills the outbox directly (no drafting), then times is_duplicate() for
+emails already answered (hit), new messages in threads already answered, with the same sender and
+subject (follow-up), and messages starting a new conversation (new):
+  - scan: the old check, comparing sender and subject with every scheduled reply in a list
+    (in memory here; the JSON backend also re-read the file per check),
+  - json: JsonOutbox with its in-memory key sets (file re-read only when it changed),
+  - sqlite: SqliteOutbox, one lookup on the UNIQUE dedup_key index,
+  - sqlite+bloom: the same with the Bloom filter in front (OUTBOX_BLOOM_FILTER).
+Before the timings, a thread of --thread-size messages from one sender with one subject is scheduled
+under both keys, to show how many follow-ups the old sender+subject key dropped.
+
+    python -m benchmarks.bench_dedup --sizes 1000 10000 100000 1000000 --queries 2000
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from tools.outbox import JsonOutbox, SqliteOutbox, legacy_key, reply_key
+from tools.records import EmailRecord, ScheduledMessage, dumps
+
+SEND_TIME = "2030-01-01T00:00:00+00:00"
+
+
+def make_email(i: int) -> EmailRecord:
+    # Senders and subjects repeat, as they do in real mail; Message-IDs never do.
+    return EmailRecord(uid=i, message_id=f"<m{i}@example.com>", sender=f"Sender {i % 500} <s{i % 500}@example.com>",
+                       subject=f"Re: invoice {i % 2000}", snippet="", to=f"s{i % 500}@example.com", draft="Thanks!")
+
+
+def make_reply(i: int) -> ScheduledMessage:
+    mail = make_email(i)
+    return ScheduledMessage(i + 1, mail.to, mail.sender, mail.subject, mail.draft, SEND_TIME,
+                            in_reply_to=mail.message_id, message_id=f"<r{i}@example.org>")
+
+
+def fill_sqlite(path: str, size: int):
+    conn = sqlite3.connect(path)
+    SqliteOutbox(path)  # creates the schema
+    with conn:
+        conn.executemany(
+            "INSERT INTO scheduled_emails (id, to_addr, from_addr, subject, body, scheduled_time, scheduled_ts,"
+            " dedup_key, in_reply_to, message_id) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+            ((reply.id, reply.to, reply.sender, reply.subject, reply.body, reply.scheduled_time,
+              reply_key(reply.in_reply_to, reply.sender, reply.subject), reply.in_reply_to, reply.message_id)
+             for reply in map(make_reply, range(size))),
+        )
+    conn.close()
+
+
+def old_is_duplicate(scheduled, email) -> bool:
+    for reply in scheduled:
+        if reply.sender == email.get("from") and reply.subject == email.get("subject"):
+            return True
+    return False
+
+
+def time_checks(check, queries):
+    """Median microseconds per check, and how many were duplicates."""
+    found, samples = 0, []
+    for email in queries:
+        start = time.perf_counter()
+        found += check(email)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples), found
+
+
+def thread_demo(tmp: str, thread_size: int):
+    box = SqliteOutbox(os.path.join(tmp, "thread.sqlite3"))
+    thread = [EmailRecord(uid=i, message_id=f"<t{i}@example.com>", sender="Ann Lee <ann@example.com>",
+                          subject="Re: invoice", snippet="", to="ann@example.com", draft="Thanks!")
+              for i in range(thread_size)]
+    new_kept = sum(box.add(mail, SEND_TIME) is not None for mail in thread)
+    old_keys = {legacy_key(mail) for mail in thread}
+    print(f"thread of {thread_size} 'Re: invoice' messages from one sender: replies scheduled "
+          f"with sender+subject key={len(old_keys)}, with Message-ID key={new_kept}; "
+          f"re-reading the thread schedules {sum(box.add(mail, SEND_TIME) is not None for mail in thread)} more")
+
+
+def main(args):
+    tmp = tempfile.mkdtemp()
+    thread_demo(tmp, args.thread_size)
+    print(f"{'backend':<13} {'history':>10}  {'hit us':>8}  {'follow-up us':>12}  {'new us':>8}  "
+          f"hits found  follow-ups dropped")
+    for size in args.sizes:
+        hits = [make_email(i) for i in range(0, size, max(1, size // args.queries))][:args.queries]
+        # New mail from the same senders with the same subjects, so only the Message-ID tells it apart.
+        follow_ups = [make_email(size + i) for i in range(len(hits))]
+        for i, email in enumerate(follow_ups):
+            email.sender, email.subject = hits[i].sender, hits[i].subject
+        fresh = [make_email(size + i) for i in range(len(hits))]
+        for email in fresh:
+            email.sender, email.subject = f"Newcomer <new{email.uid}@example.net>", f"Hello {email.uid}"
+        backends = []
+        if size <= args.scan_max:
+            scheduled = [make_reply(i) for i in range(size)]
+            backends.append(("scan", lambda email: old_is_duplicate(scheduled, email), len(hits) // 10 or 1))
+        if size <= args.json_max:
+            json_path = os.path.join(tmp, f"outbox-{size}.json")
+            with open(json_path, "wb") as f:
+                f.write(dumps([make_reply(i) for i in range(size)]))
+            json_box = JsonOutbox(json_path)
+            json_box.is_duplicate(hits[0])  # builds the key sets once
+            backends.append(("json", json_box.is_duplicate, len(hits)))
+        db_path = os.path.join(tmp, f"outbox-{size}.sqlite3")
+        fill_sqlite(db_path, size)
+        backends.append(("sqlite", SqliteOutbox(db_path).is_duplicate, len(hits)))
+        start = time.perf_counter()
+        bloom_box = SqliteOutbox(db_path, bloom_capacity=max(size * 2, 1000))
+        bloom_load = time.perf_counter() - start
+        backends.append(("sqlite+bloom", bloom_box.is_duplicate, len(hits)))
+        for name, check, count in backends:
+            hit_us, found = time_checks(check, hits[:count])
+            follow_up_us, dropped = time_checks(check, follow_ups[:count])
+            new_us, _ = time_checks(check, fresh[:count])
+            print(f"{name:<13} {size:>10,}  {hit_us:8.1f}  {follow_up_us:12.1f}  {new_us:8.1f}  "
+                  f"{found:>5}/{count:<5} {dropped:>5}/{count}")
+        print(f"{'':<13} bloom filter: {bloom_box.bloom.stats()['bytes'] / 2**20:.1f} MiB, loaded in {bloom_load:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=2000, help="checks timed per kind of email and history size")
+    parser.add_argument("--scan-max", type=int, default=100_000, help="largest history for the old linear scan")
+    parser.add_argument("--json-max", type=int, default=100_000, help="largest history for the JSON outbox")
+    parser.add_argument("--thread-size", type=int, default=5)
+    main(parser.parse_args())
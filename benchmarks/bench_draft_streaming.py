@@ -0,0 +1,91 @@
+"""
+Benchmark: blocking vs token-streamed drafting, with and without an early stop.
+
+Drafts --drafts replies one after another through tools.draft_mail with the real OllamaLLM client
+against benchmarks.fake_ollama, which streams a --reply-tokens word reply at --tokens-per-second.
+For each mode it reports, per draft (median):
+  - time to first token: when the caller first sees text (the whole draft, for blocking calls),
+  - total time until the draft is final,
+  - tokens the server generated (an early stop closes the stream, so generation stops with it),
+  - draft length in characters.
+
+    python -m benchmarks.bench_draft_streaming --drafts 10 --reply-tokens 300 --tokens-per-second 50 --max-chars 400 1000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_ollama.llms import OllamaLLM
+
+from benchmarks.fake_ollama import FakeOllama
+from config import OLLAMA_MODEL
+from tools import draft_mail
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+
+FILLER = ("I have gone through the points you raised and will follow up on each of them in turn, "
+          "starting with the schedule and then the open questions on the budget. ")
+
+
+def make_reply(tokens: int) -> str:
+    words = "Dear Sender,\n\nThank you for your email. ".split(" ")
+    filler = FILLER.split(" ")
+    while len(words) < tokens - 3:
+        words.extend(filler)
+    return " ".join(words[:tokens - 3]).rstrip() + "\n\nBest regards,\nSridhar Prajwal"
+
+
+def make_email(i: int):
+    return {"from": f"Sender {i} <sender{i}@example.com>", "subject": f"Question #{i}", "snippet": "Can we meet tomorrow?"}
+
+
+async def draft_once(server: FakeOllama, i: int, streaming: bool, max_chars: int):
+    first = None
+    start = time.perf_counter()
+
+    def on_partial(text: str, done: bool):
+        nonlocal first
+        if first is None and text:
+            first = time.perf_counter() - start
+
+    tokens_before = server.tokens_generated
+    draft = await draft_mail.draft_email_response(make_email(i), "polite", on_partial, streaming=streaming, max_chars=max_chars)
+    total = time.perf_counter() - start
+    assert draft.startswith("Dear "), draft
+    return first, total, server.tokens_generated - tokens_before, len(draft)
+
+
+async def run_mode(server: FakeOllama, label: str, count: int, streaming: bool, max_chars: int):
+    results = [await draft_once(server, i, streaming, max_chars) for i in range(count)]
+    first, total, tokens, chars = (statistics.median(column) for column in zip(*results))
+    print(f"{label:<22} first token={first * 1000:7.0f} ms  total={total * 1000:7.0f} ms  "
+          f"tokens generated={tokens:5.0f}  draft={chars:5.0f} chars")
+
+
+async def main(args):
+    server = await FakeOllama(load_seconds=0.0, tokens_per_second=args.tokens_per_second,
+                              prompt_token_latency=args.prompt_token_latency, reply=make_reply(args.reply_tokens)).start()
+    llm_client.set_llm(OllamaLLM(model=OLLAMA_MODEL, base_url=server.base_url, keep_alive=-1))
+    # Every mode drafts the same emails; without this the later ones would be cache hits.
+    draft_mail.llm_cache = LLMCache(enabled=False)
+    print(f"{args.drafts} drafts, {args.reply_tokens}-token replies at {args.tokens_per_second:g} tokens/s, "
+          f"prompt evaluation {args.prompt_token_latency * 1000:g} ms/token")
+    try:
+        await run_mode(server, "blocking", args.drafts, streaming=False, max_chars=0)
+        await run_mode(server, "streaming", args.drafts, streaming=True, max_chars=0)
+        for max_chars in args.max_chars:
+            await run_mode(server, f"streaming, stop@{max_chars}", args.drafts, streaming=True, max_chars=max_chars)
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drafts", type=int, default=10)
+    parser.add_argument("--reply-tokens", type=int, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.002)
+    parser.add_argument("--max-chars", type=int, nargs="+", default=[400, 1000])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,60 @@
+"""
+Benchmark: serial vs bounded-parallel reply drafting.
+
+Drafts replies for a batch of emails with a stub LLM that sleeps for a fixed latency
+per generation, and prints wall time and speedup for each max-in-flight limit.
+
+    python -m benchmarks.bench_drafting --emails 50 --latency 0.2 --limits 1 2 4 8 16
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.stub_llm import StubLLM
+from tools import draft_mail
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+
+
+def make_emails(count: int):
+    return [
+        {"from": f"Sender {i} <sender{i}@example.com>", "subject": f"Question #{i}", "snippet": "Can we meet tomorrow?"}
+        for i in range(count)
+    ]
+
+
+async def run(count: int, limit: int) -> float:
+    emails = make_emails(count)
+    drafts = [None] * count
+    start = time.perf_counter()
+    async for index, draft in draft_mail.draft_email_responses(emails, "polite", max_concurrency=limit, timeout=60):
+        drafts[index] = draft
+    elapsed = time.perf_counter() - start
+    assert all(d and d.startswith("Dear ") for d in drafts)
+    return elapsed
+
+
+async def main(count: int, latency: float, limits):
+    stub = StubLLM(latency=latency)
+    llm_client.set_llm(stub)
+    # Lift the process-wide LLM_MAX_CONCURRENCY cap so the per-run limit is the one being measured.
+    llm_client.max_concurrency = max(limits)
+    # Without this, every limit after the first is answered from the on-disk cache the first one filled.
+    draft_mail.llm_cache = LLMCache(enabled=False)
+    baseline = None
+    print(f"{count} emails, stub LLM latency {latency * 1000:.0f} ms")
+    for limit in limits:
+        stub.max_in_flight = 0
+        elapsed = await run(count, limit)
+        baseline = baseline or elapsed
+        print(f"max_in_flight={limit:<3} wall={elapsed:7.2f}s  speedup={baseline / elapsed:5.1f}x  observed_in_flight={stub.max_in_flight}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+    asyncio.run(main(args.emails, args.latency, args.limits))
@@ -0,0 +1,158 @@
+"""
+Benchmark: one workflow run across many accounts and folders.
+
+Starts --accounts fake IMAP servers, one account each with --folders folders of --emails messages.
+The first account's server answers every command after --slow-latency seconds instead of
+--imap-latency. All servers listen on 127.0.0.1, so they count as a single provider for the
+IMAP/SMTP caps. Categories and drafts come from a stub LLM.
+
+Three modes run over the same mailboxes:
+  - sequential: run_workflow on one mailbox after another, as one server per account would,
+  - fan-out, timeout: run_mailboxes_workflow on all of them at once with --timeout, so the slow
+    mailbox is reported instead of awaited,
+  - fan-out: the same without a timeout.
+Each mode reports wall time and when the last fast mailbox finished. It also reports the highest
+concurrency seen against each cap: LLM calls in flight and IMAP connections to the provider. After the
+fan-out, the scheduled replies are sent from their own accounts, and the SMTP connections seen are reported.
+
+    python -m benchmarks.bench_fanout --accounts 6 --folders 2 --emails 5 --slow-latency 0.3 --llm-cap 4 --imap-cap 4 --smtp-cap 2
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import langgraph_flow
+from benchmarks.corpus import make_plain
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.fake_smtp import SmtpSink
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail, outbox, read_mail
+from tools.accounts import Account, select_mailboxes
+from tools.coordination import imap_provider_limits, smtp_provider_limits
+from tools.imap_pool import imap_pool
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+from tools.rate_limit import smtp_limiter
+from tools.smtp_dispatch import dispatch_due_emails
+import tools.llm_cache
+
+# Due immediately, so the send pass after the fan-out has every reply to send.
+SEND_TIME = "2000-01-01T00:00:00+00:00"
+HOST = "127.0.0.1"
+
+
+async def start_accounts(args, sink: SmtpSink):
+    rng = random.Random(7)
+    servers, accounts = [], []
+    folders = ("Inbox",) + tuple(f"Shared{number}" for number in range(1, args.folders))
+    for number in range(args.accounts):
+        server = await FakeImapServer(latency=args.slow_latency if number == 0 else args.imap_latency).start()
+        for position, folder in enumerate(folders):
+            for index in range(args.emails):
+                # Distinct senders and subjects everywhere, so no reply is dropped as a duplicate.
+                server.deliver(make_plain(rng, (number * len(folders) + position) * 1000 + index), folder)
+        servers.append(server)
+        accounts.append(Account(f"shared{number}@example.com", "secret", server.address, sink.address, folders))
+    return servers, accounts
+
+
+def reset(stub: StubLLM, tmp: str, label: str):
+    outbox.set_outbox(outbox.SqliteOutbox(os.path.join(tmp, f"outbox-{label}.sqlite3")))
+    stub.max_in_flight = 0
+    imap_provider_limits.max_in_use.clear()
+
+
+def report(label: str, elapsed: float, emails: int, fast_done: float, slow: str, stub: StubLLM):
+    print(f"{label:<18} wall={elapsed:6.2f}s  fast mailboxes done={fast_done:6.2f}s  slow mailbox: {slow:<16} "
+          f"emails={emails:<4} LLM in flight max={stub.max_in_flight:<3} "
+          f"IMAP connections max={imap_provider_limits.max_in_use.get(HOST, 0)}")
+
+
+async def sequential(mailboxes, slow_account: str, stub: StubLLM):
+    emails, fast_done, slow = 0, 0.0, ""
+    start = time.perf_counter()
+    for account, folder in mailboxes:
+        result = await langgraph_flow.run_workflow(account.imap_server, account.smtp_server, account.email, account.password,
+                                                   SEND_TIME, mailbox=folder)
+        emails += len(result)
+        if account.email == slow_account:
+            slow = f"ok @ {time.perf_counter() - start:.2f}s"
+        else:
+            fast_done = time.perf_counter() - start
+    report("sequential", time.perf_counter() - start, emails, fast_done, slow, stub)
+
+
+async def fanout(label: str, mailboxes, slow_account: str, stub: StubLLM, timeout: float):
+    finished = {}
+    start = time.perf_counter()
+
+    def progress(event):
+        if event["type"] == "mailbox":
+            finished[(event["account"], event["mailbox"])] = (time.perf_counter() - start, event["status"])
+
+    result = await langgraph_flow.run_mailboxes_workflow(mailboxes, SEND_TIME, progress=progress, timeout=timeout)
+    elapsed = time.perf_counter() - start
+    fast_done = max(at for (account, _), (at, _) in finished.items() if account != slow_account)
+    slow = [f"{status} @ {at:.2f}s" for (account, _), (at, status) in finished.items() if account == slow_account]
+    report(label, elapsed, len(result["emails"]), fast_done, slow[-1], stub)
+    assert len(result["mailboxes"]) == len(mailboxes)
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    read_mail.SYNC_STATE_FILE = os.path.join(tmp, "imap_sync_state.json")
+    tools.llm_cache.llm_cache = categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+    stub = StubLLM(latency=args.latency)
+    llm_client.max_concurrency = args.llm_cap
+    llm_client.set_llm(stub)
+    imap_provider_limits.max_connections = args.imap_cap
+    smtp_provider_limits.max_connections = args.smtp_cap
+    # SMTP_SENDS_PER_MINUTE pacing would dominate the send phase; bench_rate_limit measures it.
+    smtp_limiter.bucket.rate_per_minute = 0
+    sink = SmtpSink().start()
+    servers, accounts = await start_accounts(args, sink)
+    mailboxes = select_mailboxes(accounts=accounts)
+    slow_account = accounts[0].email
+    print(f"{len(mailboxes)} mailboxes ({args.accounts} accounts x {args.folders} folders), {args.emails} emails each; "
+          f"slow account {args.slow_latency * 1000:g} ms/command, others {args.imap_latency * 1000:g} ms; "
+          f"caps: LLM {args.llm_cap}, IMAP {args.imap_cap}, SMTP {args.smtp_cap} per provider")
+    try:
+        reset(stub, tmp, "sequential")
+        await sequential(mailboxes, slow_account, stub)
+        await imap_pool.close()
+
+        reset(stub, tmp, "timeout")
+        await fanout(f"fan-out, {args.timeout:g}s cap", mailboxes, slow_account, stub, args.timeout)
+        await imap_pool.close()
+
+        reset(stub, tmp, "fanout")
+        await fanout("fan-out", mailboxes, slow_account, stub, 0)
+        await imap_pool.close()
+
+        store = outbox.get_outbox()
+        stats = await dispatch_due_emails(sink.address, "default@example.com", "", outbox=store, accounts=accounts)
+        print(f"send pass          sent={stats['sent']:<4} failed={stats['failed']:<3} accounts={stats.get('accounts', 1):<3} "
+              f"SMTP connections max={smtp_provider_limits.max_in_use.get(HOST, 0)}")
+    finally:
+        for server in servers:
+            await server.stop()
+        sink.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=6)
+    parser.add_argument("--folders", type=int, default=2)
+    parser.add_argument("--emails", type=int, default=5, help="messages per folder")
+    parser.add_argument("--imap-latency", type=float, default=0.005, help="seconds per IMAP command")
+    parser.add_argument("--slow-latency", type=float, default=0.3, help="seconds per IMAP command for the slow account")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per LLM call")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-mailbox timeout for the timeout mode")
+    parser.add_argument("--llm-cap", type=int, default=4)
+    parser.add_argument("--imap-cap", type=int, default=4)
+    parser.add_argument("--smtp-cap", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,168 @@
+"""
+Benchmark: arrival-to-scheduled latency with IMAP IDLE push (tools/idle_watch.py) vs polling.
+
+A local fake IMAP server holds --existing old messages (already seen: neither mode may answer them)
+and receives --messages new ones at random (Poisson) times, --rate per second on average. Halfway
+through, every connection is dropped and a few messages arrive while the clients reconnect.
+  - poll: an incremental run_workflow every --poll-interval seconds, as a cron job calling
+    /call_tool would do,
+  - idle: one MailboxWatcher, micro-batches debounced by --debounce (at most --max-delay).
+For each mode it reports the delay from delivery to the reply being in the outbox (p50/p99/max),
+replies scheduled (each new message exactly once), workflow runs and IMAP commands sent.
+
+    python -m benchmarks.bench_idle --messages 60 --rate 2 --poll-interval 30 --llm-latency 0.1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import langgraph_flow
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail, outbox, read_mail
+from tools.accounts import Account
+from tools.idle_watch import IdleWatcher, process_new_mail
+from tools.imap_pool import imap_pool
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+
+ACCOUNT = "bench@example.com"
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Run:
+    """One mode's mailbox, outbox and timings."""
+
+    def __init__(self, args, label: str, corpus):
+        self.args = args
+        self.label = label
+        self.corpus = corpus
+        self.arrivals = {}
+        self.latencies = {}
+        self.runs = 0
+        self.tmp = tempfile.mkdtemp()
+
+    async def setup(self):
+        read_mail.SYNC_STATE_FILE = os.path.join(self.tmp, "imap_sync_state.json")
+        self.box = outbox.SqliteOutbox(os.path.join(self.tmp, "outbox.sqlite3"))
+        outbox.set_outbox(self.box)
+        self.server = await FakeImapServer().start()
+        for raw in self.corpus[:self.args.existing]:
+            self.server.deliver(raw)
+        self.account = Account(ACCOUNT, "secret", self.server.address, "smtp.invalid", ("Inbox",))
+        # Both modes start from the same sync state: everything already in the mailbox has been seen.
+        key = read_mail.sync_state_key(self.server.address, ACCOUNT, "Inbox")
+        read_mail.save_sync_state({key: {"uidvalidity": 1, "last_uid": self.args.existing}})
+
+    def record(self, emails):
+        now = time.perf_counter()
+        self.runs += 1
+        for mail in emails:
+            if mail.scheduled and mail.message_id in self.arrivals:
+                self.latencies.setdefault(mail.message_id, now - self.arrivals[mail.message_id])
+
+    async def deliver_all(self):
+        rng = random.Random(7)
+        new = self.corpus[self.args.existing:]
+        for index, raw in enumerate(new):
+            await asyncio.sleep(rng.expovariate(self.args.rate))
+            if index == len(new) // 2:
+                # Mail keeps arriving while every client reconnects.
+                self.server.drop_connections()
+            message_id = raw.split(b"Message-ID: ", 1)[1].split(b"\r\n", 1)[0].decode()
+            self.arrivals[message_id] = time.perf_counter()
+            self.server.deliver(raw)
+
+    async def wait_done(self):
+        deadline = time.perf_counter() + self.args.timeout
+        while len(self.latencies) < len(self.arrivals) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+    def report(self):
+        latencies = list(self.latencies.values())
+        scheduled = self.box.count()
+        print(f"{self.label:<6} scheduled={scheduled:>3}/{len(self.arrivals):<3} "
+              f"p50={statistics.median(latencies):6.2f} s  p99={percentile(latencies, 0.99):6.2f} s  "
+              f"max={max(latencies):6.2f} s  workflow_runs={self.runs:<4} imap_commands={self.server.commands:<5} "
+              f"connections={self.server.connections}")
+
+    async def teardown(self):
+        await imap_pool.close()
+        await self.server.stop()
+
+
+async def poll(args, corpus):
+    run = Run(args, "poll", corpus)
+    await run.setup()
+    delivery = asyncio.ensure_future(run.deliver_all())
+
+    async def poller():
+        while True:
+            await asyncio.sleep(args.poll_interval)
+            emails = await langgraph_flow.run_workflow(run.server.address, "smtp.invalid", ACCOUNT, "secret",
+                                                       max_emails=args.messages, incremental=True)
+            run.record(emails)
+
+    polling = asyncio.ensure_future(poller())
+    await delivery
+    await run.wait_done()
+    polling.cancel()
+    run.report()
+    await run.teardown()
+
+
+async def idle(args, corpus):
+    run = Run(args, "idle", corpus)
+    await run.setup()
+
+    async def on_batch(account, folder, emails):
+        run.record(await process_new_mail(account, folder, emails))
+
+    watcher = IdleWatcher(on_batch)
+    mailbox_watcher, = watcher.start([(run.account, "Inbox")], debounce_seconds=args.debounce,
+                                     max_delay_seconds=args.max_delay)
+    # Notice the dropped connection quickly; the default check is every few seconds.
+    mailbox_watcher.check_seconds = 0.2
+    await asyncio.sleep(0.2)
+    await run.deliver_all()
+    await run.wait_done()
+    run.report()
+    stats = mailbox_watcher.stats()
+    print(f"       pushes={stats['pushes']} fetches={stats['fetches']} batches={stats['batches']} "
+          f"reconnects={stats['reconnects']}")
+    await watcher.stop()
+    await run.teardown()
+
+
+async def main(args):
+    llm_client.set_llm(StubLLM(latency=args.llm_latency))
+    categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+    corpus = build_corpus(args.existing + args.messages, attachment_ratio=0, newsletter_ratio=0)
+    print(f"{args.messages} new messages at {args.rate:g}/s on top of {args.existing} old ones; "
+          f"LLM {args.llm_latency * 1000:g} ms per call; poll every {args.poll_interval:g}s; "
+          f"IDLE debounce {args.debounce:g}s, max delay {args.max_delay:g}s")
+    await poll(args, corpus)
+    await idle(args, corpus)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=60)
+    parser.add_argument("--existing", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=2.0, help="new messages per second")
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    parser.add_argument("--debounce", type=float, default=0.3)
+    parser.add_argument("--max-delay", type=float, default=2.0)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for the last replies")
+    asyncio.run(main(parser.parse_args()))
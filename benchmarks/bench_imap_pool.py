@@ -0,0 +1,68 @@
+"""
+Benchmark: fresh IMAP connection per run vs the shared session pool.
+
+Fires concurrent reads at a fake IMAP server with per-command latency (standing in for
+the TLS handshake and LOGIN round trips) and prints wall time, connections opened and
+the pool's hit/miss/wait counters. Halfway through, the server drops every connection
+to show transparent reconnects.
+
+    python -m benchmarks.bench_imap_pool --runs 40 --concurrency 8 --max-sessions 4
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from tools.imap_pool import ImapPool
+from tools import imap_pool as imap_pool_module
+from tools import read_mail
+from tools.read_mail import read_inbox_emails, read_inbox_emails_pooled
+
+
+async def fire(read, server: FakeImapServer, runs: int, concurrency: int) -> float:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            await read(server.address, "bench@example.com", "secret", 5, incremental=True)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(runs)))
+    return time.perf_counter() - start
+
+
+async def main(runs: int, concurrency: int, max_sessions: int, latency: float):
+    read_mail.SYNC_STATE_FILE = os.path.join(tempfile.mkdtemp(), "imap_sync_state.json")
+    server = await FakeImapServer(latency=latency).start()
+    for raw in build_corpus(200, attachment_ratio=0.0):
+        server.deliver(raw)
+
+    elapsed = await fire(read_inbox_emails, server, runs, concurrency)
+    print(f"fresh connection per run: {elapsed:6.2f}s  connections={server.connections} commands={server.commands}")
+
+    server.reset_counters()
+    imap_pool_module.imap_pool = ImapPool(max_sessions=max_sessions)
+    elapsed = await fire(read_inbox_emails_pooled, server, runs // 2, concurrency)
+    # Simulate the provider dropping idle sessions between bursts.
+    for session_list in imap_pool_module.imap_pool._idle.values():
+        for session in session_list:
+            session.client.protocol.transport.close()
+    elapsed += await fire(read_inbox_emails_pooled, server, runs - runs // 2, concurrency)
+    print(f"pooled (max {max_sessions}/account): {elapsed:6.2f}s  connections={server.connections} commands={server.commands}")
+    print("pool stats:", imap_pool_module.imap_pool.stats())
+    await imap_pool_module.imap_pool.close()
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-sessions", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds of server latency per command")
+    args = parser.parse_args()
+    asyncio.run(main(args.runs, args.concurrency, args.max_sessions, args.latency))
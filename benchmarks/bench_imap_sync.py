@@ -0,0 +1,66 @@
+"""
+Benchmark: legacy SEARCH ALL + per-message RFC822 fetch vs incremental UID sync.
+
+Runs read_inbox_emails against a local fake IMAP server and reports IMAP round trips
+and bytes moved per run. The incremental mode is measured on a cold start (no sync
+state), a warm run with a few new messages, and a warm run with nothing new.
+
+    python -m benchmarks.bench_imap_sync --messages 5000 --max-emails 10
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from tools import read_mail
+
+
+async def measure(server: FakeImapServer, label: str, **kwargs) -> dict:
+    server.reset_counters()
+    start = time.perf_counter()
+    emails = await read_mail.read_inbox_emails(server.address, "bench@example.com", "secret", **kwargs)
+    elapsed = time.perf_counter() - start
+    row = {
+        "run": label,
+        "emails": len(emails),
+        "round_trips": server.commands,
+        "bytes_down": server.bytes_sent,
+        "bytes_up": server.bytes_received,
+        "seconds": elapsed,
+    }
+    print(f"{label:<28} emails={row['emails']:<4} round_trips={row['round_trips']:<5} "
+          f"bytes_down={row['bytes_down']:<11,} bytes_up={row['bytes_up']:<7,} {elapsed * 1000:8.1f} ms")
+    return row
+
+
+async def main(messages: int, max_emails: int, new_messages: int, attachment_kb: int):
+    corpus = build_corpus(messages + new_messages, attachment_bytes=attachment_kb * 1024)
+    server = await FakeImapServer().start()
+    for raw in corpus[:messages]:
+        server.deliver(raw)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        read_mail.SYNC_STATE_FILE = os.path.join(tmp, "imap_sync_state.json")
+        print(f"Mailbox: {messages:,} messages, max_emails={max_emails}")
+        await measure(server, "legacy (SEARCH ALL + RFC822)", max_emails=max_emails)
+        await measure(server, "incremental, cold start", max_emails=max_emails, incremental=True)
+        for raw in corpus[messages:]:
+            server.deliver(raw)
+        await measure(server, f"legacy, +{new_messages} new", max_emails=max_emails)
+        await measure(server, f"incremental, +{new_messages} new", max_emails=max_emails, incremental=True)
+        await measure(server, "incremental, next run", max_emails=max_emails, incremental=True)
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--max-emails", type=int, default=10)
+    parser.add_argument("--new-messages", type=int, default=3)
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.max_emails, args.new_messages, args.attachment_kb))
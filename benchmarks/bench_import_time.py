@@ -0,0 +1,86 @@
+"""
+Import-time budget for the entry points: exits with status 1 when startup regresses.
+
+Imports each entry point in a fresh interpreter under `python -X importtime`, --runs times, and
+compares the median cumulative import time with its budget. It also fails when an entry point pulls
+in a module that is meant to load on first use only (LangGraph, langchain_ollama, APScheduler), which
+is how most regressions show up. An entry point that fails to import fails its check too, and the
+others are still measured. The slowest imports of the last run are listed for each entry point.
+This is the startup check to run before merging (see Testing in README.md).
+
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --budget mcp_server=800 --runs 7
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Milliseconds; several times the measured cost, so only a real regression (not machine noise) trips them.
+DEFAULT_BUDGETS_MS = {"mcp_server": 1200, "main": 400, "visualize_workflow": 400}
+
+# Top-level packages no entry point may import at startup.
+DEFERRED = ("langgraph", "langchain_ollama", "langchain_core", "ollama", "apscheduler")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Cumulative milliseconds to import module, and (name, self us, cumulative us) for every import."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        error = "\n".join(line for line in result.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"importing {module} failed:\n{error}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    total = next(cumulative for name, _, cumulative in reversed(imports) if name == module)
+    return total / 1000, imports
+
+
+def check(module: str, budget_ms: float, runs: int, top: int) -> bool:
+    times = []
+    try:
+        for _ in range(runs):
+            elapsed, imports = import_time(module)
+            times.append(elapsed)
+    except RuntimeError as e:
+        print(f"{module:<20} FAIL\n  {e}")
+        return False
+    median = statistics.median(times)
+    deferred = sorted({name.split(".")[0] for name, _, _ in imports} & set(DEFERRED))
+    ok = median <= budget_ms and not deferred
+    print(f"{module:<20} median={median:7.1f} ms  budget={budget_ms:6.0f} ms  {'OK' if ok else 'FAIL'}")
+    if deferred:
+        print(f"  imported at startup, should be deferred: {', '.join(deferred)}")
+    # Package-level names only (submodules are inside their package's time), slowest first.
+    top_level = [(name, cumulative) for name, _, cumulative in imports if "." not in name and name != module]
+    for name, cumulative in sorted(top_level, key=lambda item: -item[1])[:top]:
+        print(f"  {cumulative / 1000:7.1f} ms  {name}")
+    return ok
+
+
+def parse_budgets(values: List[str]) -> Dict[str, float]:
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for value in values:
+        module, _, ms = value.partition("=")
+        budgets[module] = float(ms)
+    return budgets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", nargs="*", default=[], metavar="MODULE=MS",
+                        help="override or add a budget, e.g. mcp_server=800")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="slowest top-level imports to list per entry point")
+    args = parser.parse_args()
+    results = [check(module, budget, args.runs, args.top) for module, budget in parse_budgets(args.budget).items()]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,114 @@
+"""
+Benchmark: blocking /call_tool vs the background job API.
+
+Serves mcp_server with uvicorn against a fake IMAP server and a stub LLM, then
+  - times a blocking /call_tool request,
+  - submits --jobs jobs via POST /jobs and times the submit round trip,
+  - follows the first job's SSE stream (/jobs/{id}/events), timing the first per-email event,
+  - cancels the last job and checks the others complete within the JOBS_MAX_CONCURRENCY limit.
+
+    python -m benchmarks.bench_jobs --emails 10 --jobs 4 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+import mcp_server
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail, outbox, read_mail
+from tools.accounts import Account, set_accounts
+from tools import imap_pool as imap_pool_module
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+import tools.llm_cache
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def follow(client: httpx.AsyncClient, job_id: str, start: float):
+    first_email = None
+    events = 0
+    async with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            events += 1
+            if event["type"] == "email" and first_email is None:
+                first_email = time.perf_counter() - start
+    return first_email, events
+
+
+async def main(count: int, jobs: int, latency: float):
+    tmp = tempfile.mkdtemp()
+    read_mail.SYNC_STATE_FILE = os.path.join(tmp, "imap_sync_state.json")
+    outbox.set_outbox(outbox.SqliteOutbox(os.path.join(tmp, "outbox.sqlite3")))
+    tools.llm_cache.llm_cache = categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+    llm_client.set_llm(StubLLM(latency=latency))
+    imap = await FakeImapServer().start()
+    for raw in build_corpus(count * 2, attachment_ratio=0.0):
+        imap.deliver(raw)
+    mcp_server.EMAIL_IMAP_SERVER = imap.address
+    mcp_server.EMAIL_SMTP_SERVER = "smtp://127.0.0.1:1"
+    set_accounts([Account("bench@example.com", "secret", imap.address, "smtp://127.0.0.1:1", ("Inbox",))])
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(mcp_server.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    serve = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    arguments = {"max_emails": count, "schedule_time": "2030-01-01T09:00:00+00:00"}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+        start = time.perf_counter()
+        await client.post("/call_tool", json={"name": "run_email_automation_workflow", "arguments": arguments})
+        print(f"blocking /call_tool: response after {time.perf_counter() - start:6.3f}s")
+
+        start = time.perf_counter()
+        submitted = []
+        for _ in range(jobs):
+            response = await client.post("/jobs", json={"name": "run_email_automation_workflow", "arguments": arguments})
+            submitted.append(response.json()["job_id"])
+        submit = (time.perf_counter() - start) / jobs
+        print(f"POST /jobs: {submit * 1000:6.2f} ms per submit (job id returned immediately)")
+
+        follower = asyncio.ensure_future(follow(client, submitted[0], start))
+        cancelled = (await client.delete(f"/jobs/{submitted[-1]}")).json()["status"]
+        first_email, events = await follower
+        print(f"SSE: first per-email event after {first_email:6.3f}s, {events} events for job {submitted[0]}")
+        print(f"DELETE /jobs/{submitted[-1]}: {cancelled}")
+
+        for job_id in submitted:
+            while (await client.get(f"/jobs/{job_id}")).json()["status"] not in ("succeeded", "failed", "cancelled"):
+                await asyncio.sleep(0.05)
+        print(f"all jobs finished after {time.perf_counter() - start:6.3f}s:", (await client.get("/jobs")).json()["stats"])
+        result = (await client.get(f"/jobs/{submitted[0]}/result")).json()
+        print(f"result of {submitted[0]}: {len(result['emails'])} emails, status={result['status']}")
+
+    server.should_exit = True
+    await serve
+    await imap_pool_module.imap_pool.close()
+    await imap.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(main(args.emails, args.jobs, args.latency))
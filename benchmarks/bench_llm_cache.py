@@ -0,0 +1,56 @@
+"""
+Benchmark: LLM calls and wall time for a first vs repeated run over the same inbox.
+
+Categorizes and drafts a batch of emails twice with a stub LLM, using a throwaway cache
+file, and prints the LLM calls made and cache hit rate for each run. A repeat run over
+an unchanged inbox should make zero LLM calls.
+
+    python -m benchmarks.bench_llm_cache --emails 50 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+import tools.llm_cache
+
+
+def make_emails(count: int):
+    return [
+        {"from": f"Sender {i} <sender{i}@example.com>", "subject": f"Question #{i}", "snippet": f"Can we meet on day {i}?"}
+        for i in range(count)
+    ]
+
+
+async def one_run(count: int, stub: StubLLM) -> tuple:
+    calls_before = stub.calls
+    start = time.perf_counter()
+    emails = await categorize_mail.categorize_emails(make_emails(count))
+    async for index, draft in draft_mail.draft_email_responses(emails, "polite", max_concurrency=4):
+        emails[index]["draft"] = draft
+    return stub.calls - calls_before, time.perf_counter() - start
+
+
+async def main(count: int, latency: float):
+    cache = LLMCache(path=os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite3"), enabled=True)
+    # Both tool modules imported the shared instance by name; point them at the throwaway cache.
+    tools.llm_cache.llm_cache = categorize_mail.llm_cache = draft_mail.llm_cache = cache
+    stub = StubLLM(latency=latency)
+    llm_client.set_llm(stub)
+    for label in ("first run", "repeat run"):
+        calls, elapsed = await one_run(count, stub)
+        print(f"{label:<11} llm_calls={calls:<4} wall={elapsed:6.2f}s  cache={cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.emails, args.latency))
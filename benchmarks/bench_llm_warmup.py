@@ -0,0 +1,104 @@
+"""
+Benchmark: cold- vs warm-start LLM latency, and threads held by in-flight calls.
+
+Drives the real OllamaLLM client (through tools.llm_client.LLMClient) against benchmarks.fake_ollama,
+which charges --load seconds whenever the model is not loaded and unloads it after keep_alive idle time.
+
+  - cold: no warm-up and no keep_alive (Ollama's default applies, scaled down to --default-keep-alive
+    seconds here): the first request pays the load, and so does the first one after an idle gap.
+  - warm: warm_up() at startup and the configured OLLAMA_KEEP_ALIVE: the load happens before the
+    first request and the model survives the idle gap.
+  - concurrency: --concurrent drafts in flight via the native async path vs the executor path
+    with --workers threads; reports wall time and the peak number of threads in the process.
+
+    python -m benchmarks.bench_llm_warmup --load 2 --idle 3 --default-keep-alive 2 --concurrent 16 --workers 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from benchmarks.fake_ollama import FakeOllama
+from config import OLLAMA_KEEP_ALIVE, OLLAMA_MODEL
+from tools.llm_client import LLMClient
+
+PROMPT = ("Draft a polite reply to the following email. Use the sender's actual name 'Alex' in the greeting.\n"
+          "From: Alex <alex@example.com>\nSubject: Invoice #42\nBody: Could you confirm the payment schedule?\n"
+          "Important: Start the reply with 'Dear Alex,' and end with 'Best regards,' followed by 'Sridhar Prajwal'.")
+
+
+async def timed_call(client: LLMClient) -> float:
+    start = time.perf_counter()
+    await client.ainvoke(PROMPT, "draft")
+    return time.perf_counter() - start
+
+
+async def lifecycle(label: str, args, warm_up: bool, keep_alive):
+    server = await FakeOllama(load_seconds=args.load, tokens_per_second=args.tokens_per_second,
+                              default_keep_alive=args.default_keep_alive).start()
+    client = LLMClient(model=OLLAMA_MODEL, base_url=server.base_url, keep_alive=keep_alive)
+    try:
+        warmup = await client.warm_up() if warm_up else None
+        first = await timed_call(client)
+        steady = statistics.median([await timed_call(client) for _ in range(args.repeats)])
+        await asyncio.sleep(args.idle)
+        after_idle = await timed_call(client)
+    finally:
+        client.shutdown()
+        await server.stop()
+    warmup_text = f"{warmup:6.2f}s" if warmup is not None else "     -"
+    print(f"{label:<6} keep_alive={str(keep_alive):<5} warm-up={warmup_text}  first={first:6.2f}s  "
+          f"steady={steady:6.3f}s  after {args.idle:g}s idle={after_idle:6.2f}s  model loads={server.loads}")
+
+
+async def concurrency(label: str, args, native_async: bool):
+    server = await FakeOllama(load_seconds=0.0, tokens_per_second=args.tokens_per_second).start()
+    client = LLMClient(model=OLLAMA_MODEL, base_url=server.base_url, keep_alive=-1,
+                       native_async=native_async, executor_workers=args.workers, max_concurrency=args.concurrent)
+    peak_threads = threading.active_count()
+    done = False
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    try:
+        await client.warm_up()
+        threads_before = threading.active_count()
+        sampler = asyncio.create_task(sample_threads())
+        start = time.perf_counter()
+        await asyncio.gather(*(client.ainvoke(PROMPT, "draft") for _ in range(args.concurrent)))
+        elapsed = time.perf_counter() - start
+        done = True
+        await sampler
+    finally:
+        client.shutdown()
+        await server.stop()
+    print(f"{label:<9} {args.concurrent} calls  wall={elapsed:6.2f}s  server in-flight max={server.max_in_flight:<3} "
+          f"threads: {threads_before} before, peak {peak_threads}")
+
+
+async def main(args):
+    print(f"fake Ollama: load {args.load:g}s, {args.tokens_per_second:g} tokens/s, "
+          f"default keep_alive {args.default_keep_alive:g}s; idle gap {args.idle:g}s")
+    await lifecycle("cold", args, warm_up=False, keep_alive=None)
+    await lifecycle("warm", args, warm_up=True, keep_alive=OLLAMA_KEEP_ALIVE)
+    await concurrency("native", args, native_async=True)
+    await concurrency("executor", args, native_async=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load", type=float, default=2.0, help="model load time in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--default-keep-alive", type=float, default=2.0,
+                        help="seconds the fake server keeps the model when the client sends no keep_alive")
+    parser.add_argument("--idle", type=float, default=3.0, help="pause between requests in the lifecycle runs")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--concurrent", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="executor threads for the executor path")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+"""
+Benchmark: the drafting context index (tools/mail_index.py) at up to a million messages.
+
+Fills a fresh index in a temporary directory with synthetic mail (Zipf-distributed words from a
+--vocabulary word list, threads of a few messages), --batch messages per add() as a large fetch would.
+At each --sizes checkpoint it reports:
+  - update throughput over the messages added since the previous checkpoint,
+  - search and context_for latency (p50/p99 over --queries lookups),
+  - recall@k: how often a message is found from its subject plus half of its words,
+  - size of the vectors file and of the SQLite metadata.
+
+    python -m benchmarks.bench_mail_index --sizes 10000 100000 1000000 --dim 256 --queries 50
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from tools.mail_index import MailIndex
+
+SYLLABLES = "ba be bi bo bu ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu".split()
+
+
+class Corpus:
+    """Deterministic synthetic messages: message i belongs to thread i // thread_size."""
+
+    def __init__(self, vocabulary: int, words: int, thread_size: int, seed: int = 3):
+        rng = random.Random(seed)
+        self.vocabulary = [
+            "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(vocabulary)
+        ]
+        self.words = words
+        self.thread_size = thread_size
+        self.seed = seed
+
+    def _words(self, index: int, count: int):
+        # Seeded per message, so a query can rebuild any message's body.
+        ranks = np.minimum(np.random.default_rng((self.seed, index)).zipf(1.2, count), len(self.vocabulary)) - 1
+        return [self.vocabulary[rank] for rank in ranks]
+
+    def message(self, index: int):
+        thread = index // self.thread_size
+        topic = random.Random(thread)
+        subject = " ".join(topic.choice(self.vocabulary) for _ in range(4)) + f" {thread}"
+        return {
+            "message_id": f"<m{index}@bench>",
+            # Every message answers the first of its thread, as its References header would say.
+            "thread": f"<m{thread * self.thread_size}@bench>",
+            "kind": "received",
+            "account": "bench@example.com",
+            "sender": f"Sender {thread % 997} <s{thread % 997}@example.com>",
+            "subject": ("Re: " if index % self.thread_size else "") + subject,
+            "text": " ".join(self._words(index, self.words)),
+        }
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure_queries(index: MailIndex, corpus: Corpus, size: int, queries: int, k: int):
+    rng = random.Random(size)
+    search_ms, context_ms, found = [], [], 0
+    for _ in range(queries):
+        target = corpus.message(rng.randrange(size))
+        words = target["text"].split()
+        partial = " ".join(rng.sample(words, len(words) // 2))
+        start = time.perf_counter()
+        hits = index.search(f"{target['subject']}\n{partial}", k, account="bench@example.com")
+        search_ms.append((time.perf_counter() - start) * 1000)
+        found += any(hit["message_id"] == target["message_id"] for hit in hits)
+        start = time.perf_counter()
+        index.context_for({"message_id": target["message_id"], "references": target["thread"], "subject": target["subject"],
+                           "snippet": partial, "account": "bench@example.com"}, k)
+        context_ms.append((time.perf_counter() - start) * 1000)
+    return search_ms, context_ms, found / queries
+
+
+def main(args):
+    tmp = tempfile.mkdtemp()
+    index = MailIndex(os.path.join(tmp, "index"), dim=args.dim)
+    corpus = Corpus(args.vocabulary, args.words, args.thread_size)
+    print(f"dim={args.dim}, {args.words} words per message from a {args.vocabulary}-word vocabulary, "
+          f"threads of {args.thread_size}, batches of {args.batch}")
+    added = 0
+    for size in sorted(args.sizes):
+        update_seconds, previous = 0.0, added
+        while added < size:
+            batch = [corpus.message(added + offset) for offset in range(min(args.batch, size - added))]
+            # Only add() is timed, not generating the synthetic mail.
+            start = time.perf_counter()
+            index.add(batch)
+            update_seconds += time.perf_counter() - start
+            added += len(batch)
+        search_ms, context_ms, recall = measure_queries(index, corpus, size, args.queries, args.k)
+        stats = index.stats()
+        meta_bytes = sum(os.path.getsize(os.path.join(index.path, name))
+                         for name in os.listdir(index.path) if name.startswith("meta.sqlite3"))
+        print(f"n={size:>9,}  update={(size - previous) / update_seconds:8,.0f} msg/s  "
+              f"search p50={statistics.median(search_ms):7.2f} ms p99={percentile(search_ms, 0.99):7.2f} ms  "
+              f"context p50={statistics.median(context_ms):7.2f} ms  recall@{args.k}={recall:4.0%}  "
+              f"vectors={stats['bytes'] / 2**20:7.1f} MiB  meta={meta_bytes / 2**20:6.1f} MiB")
+    index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=1000, help="messages per add() call")
+    parser.add_argument("--words", type=int, default=40, help="words per message body")
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--thread-size", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=3)
+    main(parser.parse_args())
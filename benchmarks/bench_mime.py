@@ -0,0 +1,95 @@
+"""
+Benchmark: peak memory of reading an inbox with large attachments, full RFC822 fetch vs streaming MIME extraction.
+
+Serves a synthetic inbox (--emails messages, --large of them carrying an --attachment-mb attachment)
+from a fake IMAP server, then reads it in a fresh child process per mode so peak RSS is not shared.
+Prints the child's peak RSS, the Python allocation peak (tracemalloc), bytes sent by the server and wall time.
+
+    python -m benchmarks.bench_mime --emails 10 --large 4 --attachment-mb 25
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.corpus import make_plain, make_with_attachment
+from benchmarks.fake_imap import FakeImapServer
+
+
+def peak_rss() -> int:
+    # ru_maxrss survives fork + exec, so it would report the parent's peak; VmHWM belongs to this process only.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def child(address: str, emails: int, streaming: bool):
+    from tools import read_mail
+
+    read_mail.MIME_STREAMING = streaming
+    tracemalloc.start()
+    start = time.perf_counter()
+    client = read_mail.connect_imap(address)
+    await client.wait_hello_from_server()
+    await client.login("bench@example.com", "secret")
+    result = await read_mail.fetch_latest_emails(client, emails)
+    await client.logout()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({
+        "emails": len(result),
+        "seconds": elapsed,
+        "tracemalloc_peak": peak,
+        "peak_rss": peak_rss(),
+        "snippets": [mail["snippet"][:40] for mail in result],
+    }))
+
+
+async def main(emails: int, large: int, attachment_mb: float):
+    rng = random.Random(7)
+    server = await FakeImapServer().start()
+    for index in range(emails):
+        if index < large:
+            server.deliver(make_with_attachment(rng, index, int(attachment_mb * 1024 * 1024)))
+        else:
+            server.deliver(make_plain(rng, index))
+
+    snippets = {}
+    for label, streaming in (("rfc822", False), ("streaming", True)):
+        server.reset_counters()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "benchmarks.bench_mime", "--child", server.address, "--emails", str(emails),
+            *(["--streaming"] if streaming else []), stdout=subprocess.PIPE)
+        stdout, _ = await process.communicate()
+        stats = json.loads(stdout.decode().strip().splitlines()[-1])
+        snippets[label] = stats["snippets"]
+        print(f"{label:<10} emails={stats['emails']:<3} peak_rss={stats['peak_rss'] / 2**20:7.1f} MiB  "
+              f"python_peak={stats['tracemalloc_peak'] / 2**20:7.1f} MiB  server_sent={server.bytes_sent / 2**20:7.1f} MiB  "
+              f"wall={stats['seconds']:6.2f}s")
+    print(f"same snippets: {snippets['rfc822'] == snippets['streaming']}")
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=10)
+    parser.add_argument("--large", type=int, default=4, help="messages carrying a large attachment")
+    parser.add_argument("--attachment-mb", type=float, default=25)
+    parser.add_argument("--child", metavar="ADDRESS", help=argparse.SUPPRESS)
+    parser.add_argument("--streaming", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child(args.child, args.emails, args.streaming))
+    else:
+        asyncio.run(main(args.emails, args.large, args.attachment_mb))
@@ -0,0 +1,67 @@
+"""
+Benchmark: outbox operations at scale, JSON file vs SQLite (WAL) backend.
+
+Schedules N replies one by one (each with its dedup check), then times a duplicate
+check, the due-query and an atomic claim-and-mark-sent of the due messages. The JSON
+backend rewrites the whole file per operation, so it is measured at a smaller size
+(--json-size) and its per-operation cost is what to compare.
+
+    python -m benchmarks.bench_outbox --size 100000 --json-size 2000
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from tools.outbox import JsonOutbox, SqliteOutbox
+
+
+def make_email(i: int) -> dict:
+    return {"to": f"sender{i}@example.com", "from": f"Sender {i} <sender{i}@example.com>",
+            "subject": f"Question #{i}", "draft": "Dear Sender,\n\nThanks!\n\nBest regards,\nSridhar Prajwal"}
+
+
+def send_time(i: int, due_every: int) -> str:
+    # Every due_every-th message is due now, the rest are an hour out.
+    offset = -60 if i % due_every == 0 else 3600
+    return (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=offset)).replace(microsecond=0).isoformat()
+
+
+def bench(name: str, outbox, size: int, due_every: int):
+    start = time.perf_counter()
+    for i in range(size):
+        outbox.add(make_email(i), send_time(i, due_every))
+    schedule = time.perf_counter() - start
+
+    start = time.perf_counter()
+    duplicates = sum(outbox.is_duplicate(make_email(i)) for i in range(0, size, max(1, size // 100)))
+    dedup = (time.perf_counter() - start) / max(1, duplicates)
+
+    start = time.perf_counter()
+    due = outbox.due()
+    due_query = time.perf_counter() - start
+
+    start = time.perf_counter()
+    claimed = outbox.claim_due()
+    outbox.mark_sent([email["id"] for email in claimed])
+    claim = time.perf_counter() - start
+
+    print(f"{name:<7} n={size:<7,} schedule={schedule / size * 1e6:9.1f} us/email  dedup={dedup * 1e6:9.1f} us/check  "
+          f"due_query={due_query * 1e3:8.2f} ms ({len(due)} due)  claim+mark_sent={claim * 1e3:8.2f} ms")
+
+
+def main(size: int, json_size: int, due_every: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        bench("json", JsonOutbox(os.path.join(tmp, "scheduled_emails.json")), json_size, due_every)
+        bench("sqlite", SqliteOutbox(os.path.join(tmp, "outbox.sqlite3")), size, due_every)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--json-size", type=int, default=2000)
+    parser.add_argument("--due-every", type=int, default=100, help="one in N messages is due")
+    args = parser.parse_args()
+    main(args.size, args.json_size, args.due_every)
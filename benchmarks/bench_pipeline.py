@@ -0,0 +1,76 @@
+"""
+Benchmark: stage-at-a-time LangGraph run vs the streaming per-email pipeline.
+
+Runs the whole workflow (legacy RFC822 fetch from a fake IMAP server with per-command
+latency, stub LLM for categorize and draft, throwaway SQLite outbox) once per mode and
+prints wall time, time to the first scheduled reply, and whether both modes returned
+identical results.
+
+    python -m benchmarks.bench_pipeline --emails 20 --imap-latency 0.02 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import tempfile
+import time
+
+import langgraph_flow
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail, outbox, schedule_mail
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+from tools.pipeline import EmailPipeline
+import tools.llm_cache
+
+first_scheduled = {}
+
+
+def on_schedule(scheduled_ts: float):
+    first_scheduled.setdefault("at", time.perf_counter())
+
+
+async def one_run(server: FakeImapServer, count: int, streaming: bool, tmp: str):
+    outbox.set_outbox(outbox.SqliteOutbox(os.path.join(tmp, f"outbox-{streaming}.sqlite3")))
+    first_scheduled.clear()
+    start = time.perf_counter()
+    emails = await langgraph_flow.run_workflow(server.address, "smtp://127.0.0.1:1", "bench@example.com", "secret",
+                                               send_time="2030-01-01T09:00:00+00:00", max_emails=count, streaming=streaming)
+    elapsed = time.perf_counter() - start
+    return emails, elapsed, first_scheduled.get("at", start) - start
+
+
+async def main(count: int, imap_latency: float, latency: float, categorize_workers: int, draft_workers: int):
+    langgraph_flow.EmailPipeline = functools.partial(EmailPipeline, categorize_workers=categorize_workers, draft_workers=draft_workers)
+    tmp = tempfile.mkdtemp()
+    # No cache, so the second mode cannot reuse the first mode's LLM results.
+    tools.llm_cache.llm_cache = categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+    llm_client.set_llm(StubLLM(latency=latency))
+    langgraph_flow.IMAP_POOL_ENABLED = False
+    schedule_mail.add_schedule_listener(on_schedule)
+    server = await FakeImapServer(latency=imap_latency).start()
+    for raw in build_corpus(count * 2, attachment_ratio=0.1):
+        server.deliver(raw)
+
+    results = {}
+    for streaming in (False, True):
+        emails, elapsed, first = await one_run(server, count, streaming, tmp)
+        results[streaming] = emails
+        print(f"{'streaming' if streaming else 'batch':<10} emails={len(emails):<4} wall={elapsed:6.2f}s  "
+              f"first_scheduled={first:6.2f}s")
+    print(f"identical results: {results[False] == results[True]}")
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=20)
+    parser.add_argument("--imap-latency", type=float, default=0.02, help="seconds per IMAP command")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per LLM call")
+    parser.add_argument("--categorize-workers", type=int, default=2)
+    parser.add_argument("--draft-workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.emails, args.imap_latency, args.latency, args.categorize_workers, args.draft_workers))
@@ -0,0 +1,214 @@
+"""
+Benchmark: LLM prompt size and latency with and without prompt preprocessing (tools/preprocess_mail.py).
+
+A local fake IMAP server holds --messages emails written the way real ones arrive: a few new lines on
+top of quoted history ("On ... wrote:" with ">" lines, or an Outlook "Original Message" block), a
+signature with a sign-off, phone number and "Sent from my iPhone", tracking links, a legal disclaimer,
+and some newsletters full of links and unsubscribe footers. Each mode runs the whole workflow on it:
+  - before: the first 200 bytes of text as they are, and the previous (v1) prompt templates,
+  - after: preprocessing on (PROMPT_PREPROCESS, PROMPT_BODY_TOKENS) and the current templates.
+The stub LLM charges --prompt-token-latency per prompt token, as prompt evaluation does on a local model.
+Reports prompt tokens per email and per call for categorizing and drafting, mean and p99 LLM call
+latency, total LLM time and run time, and whether both modes labelled and greeted every email alike.
+
+    python -m benchmarks.bench_prompt_size --messages 200 --llm-latency 0.05 --prompt-token-latency 0.0005
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from email.mime.text import MIMEText
+
+import langgraph_flow
+from benchmarks.corpus import WORDS, _sentence
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail, mime_stream, outbox, pipeline, read_mail
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+
+ACCOUNT = "bench@example.com"
+NAMES = ("Alex Morgan", "Priya Shah", "Tom Becker", "Lena Fischer", "Omar Haddad", "Julia Costa")
+
+CURRENT_SINGLE_PROMPT = categorize_mail.SINGLE_PROMPT
+CURRENT_BATCH_PROMPT_HEADER = categorize_mail.BATCH_PROMPT_HEADER
+CURRENT_DRAFT_TEMPLATE = draft_mail.draft_template
+# The prompts before preprocessing, as categorize-v1 and draft-v1 rendered them.
+V1_SINGLE_PROMPT = (
+    "Classify the following email into one of these categories: urgent, newsletter, normal, spam, social, promotion.\n"
+    "Subject: {subject}\n"
+    "Body: {body}\n"
+    "Return only the category name."
+)
+V1_BATCH_PROMPT_HEADER = (
+    f"Classify each of the following emails into one of these categories: {', '.join(categorize_mail.CATEGORIES)}.\n"
+    f"Return only a JSON array of category names, one per email, in the same order as the emails.\n"
+)
+
+
+def v1_draft_template(tone: str = "polite") -> str:
+    tone = tone.replace('{', '{{').replace('}', '}}')
+    return (
+        f"Draft a {tone} reply to the following email. Use the sender's actual name '{{name}}' in the greeting "
+        f"instead of generic placeholders like [Your Name] or [Sender's Name].\n"
+        "From: {sender}\n"
+        "Subject: {subject}\n"
+        "Body: {body}\n"
+        "{context}"
+        "Important: Start the reply with 'Dear {name},' and end with 'Best regards,' followed by 'Sridhar Prajwal' (not [Your Name])."
+    )
+
+
+def tracking_link(rng: random.Random) -> str:
+    token = "".join(rng.choice("abcdef0123456789") for _ in range(32))
+    return f"https://click.mail.example-crm.com/ls/click?upn={token}&utm_source=email&utm_campaign=q{rng.randint(1, 4)}"
+
+
+def make_reply(rng: random.Random, index: int) -> bytes:
+    name = rng.choice(NAMES)
+    first = name.split()[0]
+    lines = ["Hi Sridhar,", ""] + [_sentence(rng, rng.randint(8, 16)) for _ in range(rng.randint(1, 3))]
+    if rng.random() < 0.5:
+        lines.append(f"Details are here: {tracking_link(rng)}")
+    lines += ["", rng.choice(("Best regards,", "Thanks,", "Cheers,", "Kind regards,")), name,
+              f"Senior {rng.choice(WORDS).title()} Manager | Example Corp",
+              f"Tel: +1 555 {rng.randint(100, 999)} {rng.randint(1000, 9999)}"]
+    if rng.random() < 0.3:
+        lines += ["", "Sent from my iPhone"]
+    if rng.random() < 0.4:
+        lines += ["", "CONFIDENTIALITY NOTICE: This e-mail and any attachments are confidential and may be privileged. "
+                      "If you are not the intended recipient, please notify the sender and delete this message."]
+    history = [_sentence(rng, 14) for _ in range(rng.randint(8, 30))]
+    if rng.random() < 0.6:
+        lines += ["", f"On Mon, 3 Jun 2024 at 09:{rng.randint(10, 59)}, Sridhar Prajwal <me@example.com> wrote:"]
+        lines += [f"> {line}" for line in history]
+    else:
+        lines += ["", "-----Original Message-----", "From: Sridhar Prajwal <me@example.com>",
+                  "Sent: Monday, June 3, 2024 9:14 AM", f"To: {name} <{first.lower()}@example.org>", ""] + history
+    msg = MIMEText("\n".join(lines))
+    msg["From"] = f"{name} <{first.lower()}{index}@example.org>"
+    msg["To"] = "me@example.com"
+    subject = f"{rng.choice(WORDS).title()} #{index}"
+    msg["Subject"] = ("Urgent: " if rng.random() < 0.2 else "Re: ") + subject
+    msg["Message-ID"] = f"<reply-{index}@example.org>"
+    return msg.as_bytes().replace(b"\n", b"\r\n")
+
+
+def make_newsletter(rng: random.Random, index: int) -> bytes:
+    lines = ["View this email in your browser: " + tracking_link(rng), "\u200c\u200b" * 40, "[image: Example Corp logo]"]
+    for _ in range(12):
+        lines += [_sentence(rng, 18), f"Read more: {tracking_link(rng)}"]
+    lines += ["You are receiving this email because you signed up at example-crm.com.",
+              f"Unsubscribe: {tracking_link(rng)} | Update your preferences: {tracking_link(rng)}"]
+    msg = MIMEText("\n".join(lines))
+    msg["From"] = "Example Corp <news@example-crm.com>"
+    msg["To"] = "me@example.com"
+    msg["Subject"] = f"Your weekly newsletter #{index}"
+    msg["Message-ID"] = f"<news-{index}@example-crm.com>"
+    return msg.as_bytes().replace(b"\n", b"\r\n")
+
+
+def build_corpus(size: int, newsletter_ratio: float, seed: int = 11):
+    rng = random.Random(seed)
+    return [make_newsletter(rng, index) if rng.random() < newsletter_ratio else make_reply(rng, index)
+            for index in range(size)]
+
+
+class RecordingLLM(StubLLM):
+    """StubLLM that keeps prompt tokens and call latency apart for categorizing and drafting."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tokens = {"categorize": [], "draft": []}
+        self.latencies = {"categorize": [], "draft": []}
+
+    async def ainvoke(self, prompt: str, *args, **kwargs) -> str:
+        kind = "categorize" if prompt.startswith("Classify") else "draft"
+        start = time.perf_counter()
+        try:
+            return await super().ainvoke(prompt, *args, **kwargs)
+        finally:
+            self.tokens[kind].append(len(prompt) // 4 + 1)
+            self.latencies[kind].append(time.perf_counter() - start)
+
+    async def astream(self, prompt: str, *args, **kwargs):
+        # Streamed drafts (DRAFT_STREAMING): latency up to the last token.
+        start = time.perf_counter()
+        try:
+            async for token in super().astream(prompt, *args, **kwargs):
+                yield token
+        finally:
+            self.tokens["draft"].append(len(prompt) // 4 + 1)
+            self.latencies["draft"].append(time.perf_counter() - start)
+
+
+def configure(preprocess: bool):
+    """Switches the prompt path between the old behaviour (before) and the current one (after)."""
+    snippet_bytes = mime_stream.PROMPT_RAW_TEXT_BYTES if preprocess else 200
+    mime_stream.SNIPPET_BYTES = read_mail.SNIPPET_BYTES = snippet_bytes
+    read_mail.SNIPPET_FETCH_BYTES = max(2048, 2 * snippet_bytes)
+    langgraph_flow.PROMPT_PREPROCESS = pipeline.PROMPT_PREPROCESS = preprocess
+    categorize_mail.SINGLE_PROMPT = CURRENT_SINGLE_PROMPT if preprocess else V1_SINGLE_PROMPT
+    categorize_mail.BATCH_PROMPT_HEADER = CURRENT_BATCH_PROMPT_HEADER if preprocess else V1_BATCH_PROMPT_HEADER
+    draft_mail.draft_template = pipeline.draft_template = CURRENT_DRAFT_TEMPLATE if preprocess else v1_draft_template
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+async def run(args, corpus, label: str, preprocess: bool):
+    configure(preprocess)
+    llm = RecordingLLM(latency=args.llm_latency, prompt_token_latency=args.prompt_token_latency)
+    llm_client.set_llm(llm)
+    tmp = tempfile.mkdtemp()
+    outbox.set_outbox(outbox.SqliteOutbox(os.path.join(tmp, "outbox.sqlite3")))
+    server = await FakeImapServer().start()
+    for raw in corpus:
+        server.deliver(raw)
+    start = time.perf_counter()
+    try:
+        emails = await langgraph_flow.run_workflow(server.address, "smtp.invalid", ACCOUNT, "secret",
+                                                   max_emails=len(corpus), streaming=args.streaming)
+    finally:
+        await server.stop()
+    elapsed = time.perf_counter() - start
+
+    emailed = max(1, len(emails))
+    llm_seconds = sum(sum(values) for values in llm.latencies.values())
+    print(f"{label:<7} run {elapsed:6.2f} s  LLM calls={llm.calls:<4} LLM time={llm_seconds:7.2f} s  "
+          f"prompt tokens/email={llm.prompt_tokens / emailed:6.1f}")
+    for kind in ("categorize", "draft"):
+        tokens, latencies = llm.tokens[kind], llm.latencies[kind]
+        if not tokens:
+            continue
+        print(f"        {kind:<10} calls={len(tokens):<4} tokens/call mean={statistics.mean(tokens):6.1f} "
+              f"max={max(tokens):<5} latency mean={statistics.mean(latencies) * 1000:6.1f} ms "
+              f"p99={percentile(latencies, 0.99) * 1000:6.1f} ms")
+    return {mail.message_id: (mail.category, (mail.draft or "").split("\n", 1)[0]) for mail in emails}
+
+
+async def main(args):
+    categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+    corpus = build_corpus(args.messages, args.newsletter_ratio)
+    print(f"{args.messages} emails ({args.newsletter_ratio:.0%} newsletters); LLM {args.llm_latency * 1000:g} ms per call "
+          f"+ {args.prompt_token_latency * 1000:g} ms per prompt token; {'streaming' if args.streaming else 'graph'} mode")
+    before = await run(args, corpus, "before", False)
+    after = await run(args, corpus, "after", True)
+    same = sum(before.get(message_id) == outcome for message_id, outcome in after.items())
+    print(f"same category and greeting: {same}/{len(after)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--newsletter-ratio", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fixed seconds per LLM call")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0005, help="seconds per prompt token")
+    parser.add_argument("--streaming", action="store_true", help="run the per-email pipeline instead of the graph")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,181 @@
+"""
+Benchmark: rate limits and adaptive concurrency (tools/rate_limit.py) against overloaded dependencies.
+
+llm: an LLM server that runs --capacity calls at a time (--service seconds each), queues up to
+--queue more and rejects the rest, as Ollama does past OLLAMA_NUM_PARALLEL and OLLAMA_MAX_QUEUE.
+--callers tasks share --calls requests through one LLMClient, retrying a rejected call after --retry-after:
+  - unlimited: no concurrency limit,
+  - static: the limit fixed at --max-concurrency (LLM_MAX_CONCURRENCY),
+  - adaptive: the same starting limit, halved on errors and on calls slower than --latency-target.
+Reports rejected calls, p50/p99 latency at the server (queue plus service) and as the caller sees it
+(limiter wait and retries included), throughput and the final limit.
+
+smtp: a sink that answers 421 to every message over --smtp-rate per second, as providers throttle
+fast senders. SmtpDispatcher sends --messages replies over --connections connections:
+  - unpaced: no rate limit and a fixed concurrency,
+  - adaptive: no rate limit, concurrency halved on each 421,
+  - paced: the token bucket at --smtp-rate * 60 per minute (SMTP_SENDS_PER_MINUTE) with a burst of
+    --smtp-burst (SMTP_SEND_BURST); the sink counts over a sliding second, so pacing at exactly its
+    rate still draws a few 421s from timing jitter.
+Reports 421 replies, retries, failed sends and total time.
+
+    python -m benchmarks.bench_rate_limit --calls 400 --callers 32 --capacity 4 --messages 200 --smtp-rate 20
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_smtp import SmtpSink
+from benchmarks.stub_llm import StubLLM
+from tools import smtp_dispatch
+from tools.llm_client import LLMClient
+from tools.outbox import SqliteOutbox
+from tools.rate_limit import Limiter
+
+PROMPT = "Draft a polite reply to the following email.\nFrom: Alex <alex@example.com>\nSubject: Invoice #42"
+
+
+class OverloadedError(Exception):
+    pass
+
+
+class OverloadedLLM(StubLLM):
+    """capacity calls run at once and up to queue more wait for a slot; any further call is rejected."""
+
+    def __init__(self, capacity: int, queue: int, service: float):
+        super().__init__(latency=service)
+        self.capacity = capacity
+        self.queue = queue
+        self.rejected = 0
+        self.latencies = []
+        self._slots = None
+
+    async def ainvoke(self, prompt: str, *args, **kwargs) -> str:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.capacity)
+        if self.in_flight >= self.capacity + self.queue:
+            self.rejected += 1
+            # Rejected at once, as a full server queue answers 503.
+            await asyncio.sleep(0)
+            raise OverloadedError("server busy")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            async with self._slots:
+                self.calls += 1
+                await asyncio.sleep(self.latency)
+                return self._respond(prompt)
+        finally:
+            self.in_flight -= 1
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+async def llm_run(args, max_concurrency: int, adaptive: bool):
+    server = OverloadedLLM(args.capacity, args.queue, args.service)
+    client = LLMClient(max_concurrency=max_concurrency)
+    client.set_llm(server)
+    client.limiter.adaptive = adaptive
+    client.limiter.latency_target = args.latency_target
+    client.limiter.bucket.rate_per_minute = 0
+    remaining = iter(range(args.calls))
+    latencies = []
+
+    async def caller():
+        for _ in remaining:
+            start = time.perf_counter()
+            while True:
+                try:
+                    await client.ainvoke(PROMPT, "draft")
+                    break
+                except OverloadedError:
+                    await asyncio.sleep(args.retry_after)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(args.callers)))
+    elapsed = time.perf_counter() - start
+    return elapsed, latencies, server, client.limiter.stats()
+
+
+def bench_llm(args):
+    print(f"llm: {args.calls} calls from {args.callers} callers; server runs {args.capacity} at a time "
+          f"({args.service * 1000:g} ms each) and queues {args.queue}; latency target {args.latency_target * 1000:g} ms")
+    for label, max_concurrency, adaptive in (("unlimited", 0, False), ("static", args.max_concurrency, False),
+                                             ("adaptive", args.max_concurrency, True)):
+        elapsed, latencies, server, stats = asyncio.run(llm_run(args, max_concurrency, adaptive))
+        print(f"  {label:<10} {elapsed:6.2f} s  {len(latencies) / elapsed:6.1f} calls/s  rejected={server.rejected:<6} "
+              f"server p50={statistics.median(server.latencies) * 1000:6.1f} ms p99={percentile(server.latencies, 0.99) * 1000:6.1f} ms  "
+              f"caller p50={statistics.median(latencies) * 1000:6.1f} ms p99={percentile(latencies, 0.99) * 1000:6.1f} ms  "
+              f"limit={stats['limit'] if max_concurrency else '-'} decreases={stats['decreases']}")
+
+
+def fill_outbox(path: str, messages: int) -> SqliteOutbox:
+    outbox = SqliteOutbox(path)
+    due = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)).isoformat()
+    for i in range(messages):
+        outbox.add({"to": f"user{i}@example.com", "subject": f"Re: Question #{i}", "draft": "Thanks!\n\nBest regards"}, due)
+    return outbox
+
+
+def bench_smtp(args):
+    sink = SmtpSink(args.connect_latency, args.data_latency, max_per_second=args.smtp_rate).start()
+    handler = sink.handler
+    print(f"smtp: {args.messages} messages over {args.connections} connections; the sink accepts "
+          f"{args.smtp_rate:g} per second and answers 421 past that")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, rate_per_minute, adaptive in (("unpaced", 0, False), ("adaptive", 0, True),
+                                                     ("paced", args.smtp_rate * 60, True)):
+                handler.reset()
+                # The dispatcher uses the module's limiter; each run gets a fresh one.
+                smtp_dispatch.smtp_limiter = Limiter("smtp", rate_per_minute, args.smtp_burst, args.connections,
+                                                     adaptive=adaptive)
+                outbox = fill_outbox(os.path.join(tmp, f"{label}.sqlite3"), args.messages)
+                dispatcher = smtp_dispatch.SmtpDispatcher(sink.address, "me@example.com", "", connections=args.connections,
+                                                          max_retries=args.max_retries, backoff_seconds=args.backoff,
+                                                          outbox=outbox)
+                start = time.perf_counter()
+                stats = asyncio.run(dispatcher.dispatch(outbox.claim_due()))
+                elapsed = time.perf_counter() - start
+                print(f"  {label:<10} {elapsed:7.2f} s  delivered={handler.delivered:<5} 421s={handler.rate_limited:<5} "
+                      f"retries={stats['retries']:<5} failed={stats['failed']:<5} "
+                      f"smtp_sessions={handler.connections}")
+    finally:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--callers", type=int, default=32, help="concurrent tasks issuing LLM calls")
+    parser.add_argument("--capacity", type=int, default=4, help="LLM calls the server runs at once")
+    parser.add_argument("--queue", type=int, default=4, help="LLM calls the server queues before rejecting")
+    parser.add_argument("--service", type=float, default=0.05, help="seconds per LLM call")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="seconds before retrying a rejected LLM call")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="starting (and maximum) LLM concurrency limit")
+    parser.add_argument("--latency-target", type=float, default=0.15, help="LLM calls slower than this cut the limit")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--smtp-rate", type=float, default=20, help="messages per second the sink accepts")
+    parser.add_argument("--smtp-burst", type=int, default=1, help="token bucket burst for the paced run")
+    parser.add_argument("--connect-latency", type=float, default=0.02)
+    parser.add_argument("--data-latency", type=float, default=0.005)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.2, help="SMTP retry backoff base, in seconds")
+    parser.add_argument("--only", choices=("llm", "smtp"))
+    args = parser.parse_args()
+    if args.only != "smtp":
+        bench_llm(args)
+    if args.only != "llm":
+        bench_smtp(args)
@@ -0,0 +1,100 @@
+"""
+Benchmark: memory and serialization cost of the workflow's email records, plain dicts vs slotted EmailRecord.
+
+Builds --size fully processed emails (read, categorized, drafted, scheduled) both as the dicts the
+workflow used to pass around and as tools.records.EmailRecord, then reports:
+  - memory per email (tracemalloc), for the container alone (field strings shared) and including the strings,
+  - serializing the whole list: json.dumps(indent=2) as the outbox did vs tools.records.dumps,
+  - serializing one email at a time, as each SSE progress event does,
+  - loading the list back, and copying every email as single-flight callers get.
+
+    python -m benchmarks.bench_records --size 100000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from tools import records
+from tools.records import EmailRecord
+
+
+def fields(i: int) -> dict:
+    return {
+        "uid": 100000 + i,
+        "message_id": f"<msg-{i}@example.com>",
+        "from": f"Sender {i} <sender{i}@example.com>",
+        "subject": f"Question about invoice #{i}",
+        "snippet": f"Hi, could you confirm the payment schedule for invoice {i} before Friday? Thanks",
+        "category": "normal",
+        "action": "draft",
+        "draft": f"Dear Sender,\n\nThank you for your email about invoice {i}.\n\nBest regards,\nSridhar Prajwal",
+        "to": f"Sender {i} <sender{i}@example.com>",
+        "scheduled": True,
+    }
+
+
+def as_dict(data: dict) -> dict:
+    return dict(data)
+
+
+def as_record(data: dict) -> EmailRecord:
+    return EmailRecord(data["uid"], data["message_id"], data["from"], data["subject"], data["snippet"],
+                       category=data["category"], action=data["action"], draft=data["draft"],
+                       to=data["to"], scheduled=data["scheduled"])
+
+
+def measure_memory(source, build) -> float:
+    """Bytes allocated per email while building one container per entry of source."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = [build(data) for data in source]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del built
+    return allocated / len(source)
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(size: int):
+    source = [fields(i) for i in range(size)]
+    print(f"{size:,} emails, serializer: {'orjson' if records.orjson is not None else 'json (orjson not installed)'}")
+
+    container = {"dict": measure_memory(source, as_dict), "record": measure_memory(source, as_record)}
+    # Including the strings: a fresh copy of every field value, as a real fetch would allocate.
+    total = {
+        "dict": measure_memory(range(size), lambda i: as_dict(fields(i))),
+        "record": measure_memory(range(size), lambda i: as_record(fields(i))),
+    }
+    for name in ("dict", "record"):
+        print(f"{name:<7} memory/email: container={container[name]:6.0f} B  with strings={total[name]:6.0f} B")
+
+    dicts = [as_dict(data) for data in source]
+    recs = [as_record(data) for data in source]
+    results = {
+        "dump list": (timed(lambda: json.dumps(dicts, indent=2, default=str)), timed(lambda: records.dumps(recs))),
+        "dump each": (timed(lambda: [json.dumps(mail, default=str) for mail in dicts]),
+                      timed(lambda: [records.dumps(mail) for mail in recs])),
+    }
+    dumped_json = json.dumps(dicts, indent=2, default=str)
+    dumped_records = records.dumps(recs)
+    results["load list"] = (timed(lambda: json.loads(dumped_json)),
+                            timed(lambda: [EmailRecord.from_dict(data) for data in records.loads(dumped_records)]))
+    results["copy each"] = (timed(lambda: [dict(mail) for mail in dicts]), timed(lambda: [mail.copy() for mail in recs]))
+    for name, (before, after) in results.items():
+        print(f"{name:<10} dict+json={before * 1e6 / size:7.2f} us/email  record={after * 1e6 / size:7.2f} us/email  "
+              f"({before / after:4.1f}x)")
+    print(f"size on disk: json indent=2 {len(dumped_json) / size:5.0f} B/email  records.dumps {len(dumped_records) / size:5.0f} B/email")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.size)
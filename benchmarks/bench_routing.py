@@ -0,0 +1,66 @@
+"""
+Benchmark: LLM calls per run with and without category routing.
+
+Runs the workflow over a fake inbox where --newsletter-ratio of the mail carries
+List-Unsubscribe / Precedence: bulk headers, once with every email drafted (no header
+rules, empty policy) and once with the default CATEGORY_POLICY and header rules.
+Prints LLM calls, replies scheduled, wall time and the share of calls avoided.
+
+    python -m benchmarks.bench_routing --emails 40 --newsletter-ratio 0.4 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import langgraph_flow
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail, outbox, route_mail
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+from tools.metrics import collecting_stats
+import tools.llm_cache
+
+
+async def one_run(server: FakeImapServer, count: int, stub: StubLLM, tmp: str, label: str):
+    outbox.set_outbox(outbox.SqliteOutbox(os.path.join(tmp, f"outbox-{label}.sqlite3")))
+    calls_before = stub.calls
+    start = time.perf_counter()
+    with collecting_stats() as stats:
+        emails = await langgraph_flow.run_workflow(server.address, "smtp://127.0.0.1:1", "bench@example.com", "secret",
+                                                   send_time="2030-01-01T09:00:00+00:00", max_emails=count)
+    elapsed = time.perf_counter() - start
+    scheduled = sum(1 for mail in emails if mail.get("scheduled"))
+    print(f"{label:<10} llm_calls={stub.calls - calls_before:<4} scheduled={scheduled:<4} wall={elapsed:6.2f}s  "
+          f"avoided={stats.get('routing', {}).get('llm_calls_avoided_share', 0):.0%}")
+
+
+async def main(count: int, newsletter_ratio: float, latency: float):
+    tmp = tempfile.mkdtemp()
+    tools.llm_cache.llm_cache = categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+    stub = StubLLM(latency=latency)
+    llm_client.set_llm(stub)
+    langgraph_flow.IMAP_POOL_ENABLED = False
+    server = await FakeImapServer().start()
+    for raw in build_corpus(count, attachment_ratio=0.0, newsletter_ratio=newsletter_ratio):
+        server.deliver(raw)
+
+    policy, rules = route_mail.CATEGORY_POLICY, categorize_mail.BULK_HEADER_RULES
+    route_mail.CATEGORY_POLICY, route_mail.BULK_HEADER_RULES, categorize_mail.BULK_HEADER_RULES = {}, False, False
+    await one_run(server, count, stub, tmp, "draft all")
+    route_mail.CATEGORY_POLICY, route_mail.BULK_HEADER_RULES, categorize_mail.BULK_HEADER_RULES = policy, rules, rules
+    await one_run(server, count, stub, tmp, "routed")
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=40)
+    parser.add_argument("--newsletter-ratio", type=float, default=0.4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.emails, args.newsletter_ratio, args.latency))
@@ -0,0 +1,96 @@
+"""
+Benchmark: interval polling vs the due queue for scheduled sends.
+
+Fills a SQLite outbox with --history already-sent messages, then schedules --messages
+replies at random times over the next --window seconds and lets each engine "send" them
+(claim + mark sent, no SMTP). Prints send lag (time past the scheduled time), number of
+wake-ups and time spent inside send passes.
+
+    python -m benchmarks.bench_scheduler --history 100000 --messages 20 --window 10 --interval 5
+"""
+
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from tools.due_queue import DueQueueScheduler
+from tools.outbox import SqliteOutbox
+
+
+def iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+def fill_history(outbox: SqliteOutbox, history: int):
+    conn = outbox._conn()
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO scheduled_emails (to_addr, from_addr, subject, body, scheduled_time, scheduled_ts, sent, dedup_key)"
+        " VALUES (?, ?, ?, ?, ?, ?, 1, ?)",
+        [(f"old{i}@example.com", f"old{i}@example.com", f"Old #{i}", "body", iso(0), 0.0, f"old-{i}") for i in range(history)],
+    )
+    conn.execute("COMMIT")
+
+
+def run_engine(mode: str, db_path: str, history: int, messages: int, window: float, interval: float, seed: int):
+    outbox = SqliteOutbox(db_path)
+    fill_history(outbox, history)
+    lags = []
+    pass_seconds = []
+    done = threading.Event()
+
+    def send_due():
+        start = time.perf_counter()
+        claimed = outbox.claim_due()
+        now = time.time()
+        for email in claimed:
+            lags.append(now - datetime.datetime.fromisoformat(email["scheduled_time"]).timestamp())
+        outbox.mark_sent([email["id"] for email in claimed])
+        pass_seconds.append(time.perf_counter() - start)
+        if len(lags) >= messages:
+            done.set()
+
+    if mode == "queue":
+        engine = DueQueueScheduler(send_due, outbox)
+        engine.start()
+    else:
+        engine = BackgroundScheduler()
+        engine.add_job(send_due, "interval", seconds=interval)
+        engine.start()
+
+    rng = random.Random(seed)
+    start = time.time()
+    for i in range(messages):
+        ts = start + rng.uniform(0.5, window)
+        outbox.add({"to": f"r{i}@example.com", "from": f"r{i}@example.com", "subject": f"Re #{i}", "draft": "hi"}, iso(ts))
+        if mode == "queue":
+            engine.notify(ts)
+    done.wait(window + interval + 5)
+    engine.shutdown(wait=False)
+    print(f"{mode:<8} sent={len(lags)}/{messages}  lag mean={statistics.mean(lags) * 1000:8.1f} ms  "
+          f"max={max(lags) * 1000:8.1f} ms  wakeups={len(pass_seconds):<4} "
+          f"send-pass time total={sum(pass_seconds) * 1000:7.1f} ms")
+
+
+def main(history: int, messages: int, window: float, interval: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"history={history:,} sent messages, {messages} replies due over {window:g}s, interval={interval:g}s")
+        run_engine("interval", os.path.join(tmp, "interval.sqlite3"), history, messages, window, interval, 1)
+        run_engine("queue", os.path.join(tmp, "queue.sqlite3"), history, messages, window, interval, 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--window", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=5, help="polling period for interval mode (production: 60s)")
+    args = parser.parse_args()
+    main(args.history, args.messages, args.window, args.interval)
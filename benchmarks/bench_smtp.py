@@ -0,0 +1,75 @@
+"""
+Benchmark: one SMTP session per email vs the async dispatcher with reused connections.
+
+Starts a local aiosmtpd sink that charges --connect-latency per EHLO (standing in for the
+TCP + TLS + AUTH handshake) and --data-latency per message, and answers 421 to the first
+delivery attempt of every --throttle-every-th message. Queues --messages due replies in a
+SQLite outbox and sends them through process_due_emails (legacy path) and SmtpDispatcher
+with 1, 2 and 4 connections.
+
+    python -m benchmarks.bench_smtp --messages 200 --connect-latency 0.05 --data-latency 0.005
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from benchmarks.fake_smtp import SinkHandler, SmtpSink
+from tools import outbox as outbox_module
+from tools import schedule_mail
+from tools.outbox import SqliteOutbox
+from tools.rate_limit import smtp_limiter
+from tools.smtp_dispatch import SmtpDispatcher
+
+
+def fill_outbox(path: str, messages: int) -> SqliteOutbox:
+    outbox = SqliteOutbox(path)
+    due = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)).isoformat()
+    for i in range(messages):
+        outbox.add({"to": f"user{i}@example.com", "subject": f"Re: Question #{i}", "draft": "Thanks!\n\nBest regards"}, due)
+    return outbox
+
+
+def report(name: str, seconds: float, handler: SinkHandler, messages: int, extra: str = ""):
+    print(f"{name:<16} {seconds:8.3f} s  {messages / seconds:8.1f} emails/s  delivered={handler.delivered:<5} "
+          f"smtp_sessions={handler.connections:<5} {extra}")
+
+
+def main(messages: int, connect_latency: float, data_latency: float, throttle_every: int):
+    sink = SmtpSink(connect_latency, data_latency, throttle_every).start()
+    # Pacing (SMTP_SENDS_PER_MINUTE) would hide the transport cost measured here; bench_rate_limit covers it.
+    smtp_limiter.bucket.rate_per_minute = 0
+    handler = sink.handler
+    server = sink.address
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            outbox_module.set_outbox(fill_outbox(os.path.join(tmp, "legacy.sqlite3"), messages))
+            schedule_mail.SMTP_ASYNC_DISPATCH = False
+            start = time.perf_counter()
+            schedule_mail.process_due_emails(server, "me@example.com", "")
+            report("legacy", time.perf_counter() - start, handler, messages, "(421s are left for the next pass)")
+
+            for connections in (1, 2, 4):
+                handler.reset()
+                outbox = fill_outbox(os.path.join(tmp, f"async{connections}.sqlite3"), messages)
+                dispatcher = SmtpDispatcher(server, "me@example.com", "", connections=connections,
+                                            backoff_seconds=0.01, outbox=outbox)
+                start = time.perf_counter()
+                stats = asyncio.run(dispatcher.dispatch(outbox.claim_due()))
+                report(f"async x{connections}", time.perf_counter() - start, handler, messages,
+                       f"retries={stats['retries']} commits={stats['commits']} unsent={outbox.count() - stats['sent']}")
+    finally:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="seconds per connection handshake")
+    parser.add_argument("--data-latency", type=float, default=0.005, help="seconds per message")
+    parser.add_argument("--throttle-every", type=int, default=25, help="answer 421 once to every Nth message (0 = never)")
+    args = parser.parse_args()
+    main(args.messages, args.connect_latency, args.data_latency, args.throttle_every)
@@ -0,0 +1,66 @@
+"""
+Synthetic mail corpus for benchmarks: plain replies, multipart mail with attachments
+and bulk newsletters, generated deterministically from a seed.
+"""
+
+import random
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List
+
+WORDS = (
+    "invoice meeting project update schedule deadline review budget report team "
+    "client proposal contract payment shipping order account access request question "
+    "thanks please tomorrow monday friday call notes draft final approval"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_plain(rng: random.Random, index: int) -> bytes:
+    msg = MIMEText("\n".join(_sentence(rng, 12) for _ in range(rng.randint(3, 12))))
+    msg["From"] = f"Sender {index} <sender{index}@example.com>"
+    msg["To"] = "me@example.com"
+    msg["Subject"] = f"{rng.choice(WORDS).title()} #{index}"
+    msg["Message-ID"] = f"<plain-{index}@example.com>"
+    return msg.as_bytes().replace(b"\n", b"\r\n")
+
+
+def make_with_attachment(rng: random.Random, index: int, attachment_bytes: int) -> bytes:
+    msg = MIMEMultipart()
+    msg["From"] = f"Client {index} <client{index}@example.org>"
+    msg["To"] = "me@example.com"
+    msg["Subject"] = f"Attached {rng.choice(WORDS)} #{index}"
+    msg["Message-ID"] = f"<attach-{index}@example.org>"
+    msg.attach(MIMEText(_sentence(rng, 40)))
+    msg.attach(MIMEApplication(rng.randbytes(attachment_bytes), Name=f"file{index}.bin"))
+    return msg.as_bytes().replace(b"\n", b"\r\n")
+
+
+def make_newsletter(rng: random.Random, index: int) -> bytes:
+    msg = MIMEText("\n".join(_sentence(rng, 20) for _ in range(30)))
+    msg["From"] = "Weekly Digest <news@lists.example.net>"
+    msg["To"] = "me@example.com"
+    msg["Subject"] = f"Your weekly digest #{index}"
+    msg["Message-ID"] = f"<news-{index}@lists.example.net>"
+    msg["List-Unsubscribe"] = "<mailto:unsubscribe@lists.example.net>"
+    msg["Precedence"] = "bulk"
+    return msg.as_bytes().replace(b"\n", b"\r\n")
+
+
+def build_corpus(size: int, attachment_ratio: float = 0.2, newsletter_ratio: float = 0.2,
+                 attachment_bytes: int = 256 * 1024, seed: int = 42) -> List[bytes]:
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(size):
+        roll = rng.random()
+        if roll < attachment_ratio:
+            corpus.append(make_with_attachment(rng, index, attachment_bytes))
+        elif roll < attachment_ratio + newsletter_ratio:
+            corpus.append(make_newsletter(rng, index))
+        else:
+            corpus.append(make_plain(rng, index))
+    return corpus
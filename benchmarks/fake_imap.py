@@ -0,0 +1,249 @@
+"""
+In-process fake IMAP server for benchmarks.
+Speaks just enough IMAP4rev1 (plain TCP) for aioimaplib and tools/read_mail.py,
+and counts commands and bytes so round trips and transfer can be compared.
+Like real servers it reports mail that arrived while a client was not idling as soon as it starts
+IDLE again, and drop_connections() simulates a network failure or server restart.
+"""
+
+import asyncio
+import re
+from email import message_from_bytes
+from typing import Dict, List, Optional
+
+SECTION_RE = re.compile(r'(BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|RFC822\.HEADER|RFC822\.SIZE|RFC822|UID|FLAGS)', re.I)
+
+
+class FakeMailbox:
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.uids: List[int] = []
+        self.messages: Dict[int, bytes] = {}
+        self.next_uid = 1
+
+    def append(self, raw: bytes) -> int:
+        uid = self.next_uid
+        self.next_uid += 1
+        self.uids.append(uid)
+        self.messages[uid] = raw
+        return uid
+
+
+class FakeImapServer:
+    def __init__(self, mailboxes: Optional[Dict[str, FakeMailbox]] = None, latency: float = 0.0):
+        self.mailboxes = mailboxes or {"INBOX": FakeMailbox()}
+        self.latency = latency
+        self.commands = 0
+        self.command_counts: Dict[str, int] = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.connections = 0
+        self.idle_writers: List = []
+        # Mailbox size last reported to each connection (with EXISTS).
+        self.reported: Dict = {}
+        self._server = None
+        self.port = None
+
+    @property
+    def address(self) -> str:
+        return f"imap://127.0.0.1:{self.port}"
+
+    def reset_counters(self):
+        self.commands = 0
+        self.command_counts = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.connections = 0
+
+    def mailbox(self, name: str) -> FakeMailbox:
+        return self.mailboxes.setdefault(name.upper(), FakeMailbox())
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for writer, _ in list(self.idle_writers):
+            writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def deliver(self, raw: bytes, mailbox: str = "INBOX") -> int:
+        """Appends a message and notifies IDLE-ing clients with an untagged EXISTS."""
+        box = self.mailbox(mailbox)
+        uid = box.append(raw)
+        for writer, box_name in list(self.idle_writers):
+            if box_name == mailbox.upper():
+                self._report(writer, box)
+        return uid
+
+    def drop_connections(self):
+        """Closes every client connection at once, without a BYE."""
+        for writer in list(self.reported):
+            writer.close()
+
+    def _report(self, writer, box: FakeMailbox):
+        self._write(writer, f"* {len(box.uids)} EXISTS\r\n".encode())
+        self.reported[writer] = len(box.uids)
+
+    def _write(self, writer, data: bytes):
+        self.bytes_sent += len(data)
+        writer.write(data)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self.reported[writer] = 0
+        selected: Optional[str] = None
+        self._write(writer, b"* OK IMAP4rev1 fake server ready\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.bytes_received += len(line)
+                text = line.decode().rstrip("\r\n")
+                tag, _, rest = text.partition(" ")
+                name, _, args = rest.partition(" ")
+                name = name.upper()
+                by_uid = False
+                if name == "UID":
+                    by_uid = True
+                    name, _, args = args.partition(" ")
+                    name = name.upper()
+                self.commands += 1
+                key = ("UID " if by_uid else "") + name
+                self.command_counts[key] = self.command_counts.get(key, 0) + 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                if name == "CAPABILITY":
+                    self._write(writer, b"* CAPABILITY IMAP4rev1 IDLE UIDPLUS\r\n")
+                elif name == "LOGIN":
+                    pass
+                elif name in ("SELECT", "EXAMINE"):
+                    selected = args.strip('"').upper()
+                    box = self.mailbox(selected)
+                    self.reported[writer] = len(box.uids)
+                    self._write(writer, (
+                        f"* {len(box.uids)} EXISTS\r\n"
+                        f"* 0 RECENT\r\n"
+                        f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid\r\n"
+                        f"* OK [UIDNEXT {box.next_uid}] Predicted next UID\r\n"
+                    ).encode())
+                elif name == "SEARCH":
+                    box = self.mailbox(selected)
+                    ids = box.uids if by_uid else range(1, len(box.uids) + 1)
+                    self._write(writer, ("* SEARCH " + " ".join(str(i) for i in ids) + "\r\n").encode())
+                elif name == "FETCH":
+                    self._fetch(writer, self.mailbox(selected), args, by_uid)
+                elif name == "NOOP":
+                    pass
+                elif name == "IDLE":
+                    entry = (writer, selected)
+                    self.idle_writers.append(entry)
+                    self._write(writer, b"+ idling\r\n")
+                    if selected and len(self.mailbox(selected).uids) > self.reported.get(writer, 0):
+                        self._report(writer, self.mailbox(selected))
+                    await writer.drain()
+                    done = await reader.readline()
+                    self.bytes_received += len(done)
+                    self.idle_writers.remove(entry)
+                    if not done:
+                        break
+                elif name == "LOGOUT":
+                    self._write(writer, b"* BYE logging out\r\n")
+                    self._write(writer, f"{tag} OK LOGOUT completed\r\n".encode())
+                    await writer.drain()
+                    break
+                else:
+                    self._write(writer, f"{tag} BAD unknown command\r\n".encode())
+                    await writer.drain()
+                    continue
+                self._write(writer, f"{tag} OK {name} completed\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.reported.pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    def _resolve_set(box: FakeMailbox, message_set: str, by_uid: bool) -> List[int]:
+        """Returns the sequence numbers (1-based) selected by an IMAP message set."""
+        count = len(box.uids)
+        seqs = []
+        for part in message_set.split(","):
+            low, _, high = part.partition(":")
+            if by_uid:
+                max_uid = box.uids[-1] if box.uids else 0
+                lo = max_uid if low == "*" else int(low)
+                hi = (max_uid if high == "*" else int(high)) if high else lo
+                lo, hi = min(lo, hi), max(lo, hi)
+                matched = [i + 1 for i, uid in enumerate(box.uids) if lo <= uid <= hi]
+                # RFC 3501: "N:*" always includes the highest UID
+                if high == "*" and count and not matched:
+                    matched = [count]
+                seqs.extend(matched)
+            else:
+                lo = count if low == "*" else int(low)
+                hi = (count if high == "*" else int(high)) if high else lo
+                lo, hi = min(lo, hi), max(lo, hi)
+                seqs.extend(range(max(lo, 1), min(hi, count) + 1))
+        return seqs
+
+    def _fetch(self, writer, box: FakeMailbox, args: str, by_uid: bool):
+        message_set, _, items = args.partition(" ")
+        wanted = SECTION_RE.findall(items)
+        for seq in self._resolve_set(box, message_set, by_uid):
+            uid = box.uids[seq - 1]
+            raw = box.messages[uid]
+            header_end = raw.find(b"\r\n\r\n")
+            header, body = (raw[:header_end + 4], raw[header_end + 4:]) if header_end >= 0 else (raw, b"")
+            parts = []
+            if by_uid:
+                parts.append(f"UID {uid}".encode())
+            for token, section, offset, length in wanted:
+                upper = token.upper()
+                if upper == "UID":
+                    if not by_uid:
+                        parts.append(f"UID {uid}".encode())
+                    continue
+                if upper == "FLAGS":
+                    parts.append(b"FLAGS ()")
+                    continue
+                if upper == "RFC822.SIZE":
+                    parts.append(f"RFC822.SIZE {len(raw)}".encode())
+                    continue
+                if upper == "RFC822":
+                    data, label = raw, "RFC822"
+                elif upper == "RFC822.HEADER":
+                    data, label = header, "RFC822.HEADER"
+                else:
+                    section_upper = section.upper()
+                    if section_upper == "":
+                        data = raw
+                    elif section_upper == "TEXT":
+                        data = body
+                    elif section_upper == "HEADER":
+                        data = header
+                    elif section_upper.startswith("HEADER.FIELDS"):
+                        names = section_upper[section_upper.index("(") + 1:section_upper.rindex(")")].split()
+                        data = self._header_fields(header, names)
+                    else:
+                        data = b""
+                    label = f"BODY[{section}]"
+                    if offset:
+                        data = data[int(offset):int(offset) + int(length)]
+                        label += f"<{offset}>"
+                parts.append(f"{label} {{{len(data)}}}\r\n".encode() + data)
+            self._write(writer, f"* {seq} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+
+    @staticmethod
+    def _header_fields(header: bytes, names: List[str]) -> bytes:
+        msg = message_from_bytes(header)
+        lines = []
+        for name in names:
+            for value in msg.get_all(name, []):
+                lines.append(f"{name.title()}: {value}\r\n")
+        return ("".join(lines) + "\r\n").encode()
@@ -0,0 +1,152 @@
+"""
+Minimal Ollama HTTP server for benchmarks: POST /api/generate with NDJSON streaming, as the ollama
+client (and so OllamaLLM) speaks it.
+
+A request for an unloaded model first pays load_seconds (one load shared by every request that
+arrives meanwhile). The model then stays loaded for the request's keep_alive, or default_keep_alive
+seconds when the client sends none, and is unloaded after that much idle time, as Ollama does.
+Replies (reply, one word per token) stream at tokens_per_second after a per-prompt-token evaluation cost.
+An empty prompt only loads the model, like Ollama's own warm-up idiom.
+"""
+
+import asyncio
+import datetime
+import json
+import re
+import time
+from typing import Optional
+
+DURATION_RE = re.compile(r'(-?\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+REPLY = ("Dear Sender,\n\nThank you for your email. I have received it and will get back to you "
+         "shortly with the details you asked for.\n\nBest regards,\nSridhar Prajwal")
+
+
+def parse_keep_alive(value, default: float) -> float:
+    """Seconds to keep the model loaded; negative means forever. Accepts seconds or Go durations like '30m'."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = DURATION_RE.findall(value)
+    if not parts:
+        return float(value)
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+class FakeOllama:
+    def __init__(self, load_seconds: float = 2.0, tokens_per_second: float = 200.0,
+                 prompt_token_latency: float = 0.0, default_keep_alive: float = 300.0, reply: str = REPLY):
+        self.load_seconds = load_seconds
+        self.tokens_per_second = tokens_per_second
+        self.prompt_token_latency = prompt_token_latency
+        self.default_keep_alive = default_keep_alive
+        self.reply_tokens = re.findall(r'\S+\s*', reply)
+        self.loads = 0
+        self.requests = 0
+        self.tokens_generated = 0  # stops growing when a client closes its stream early
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._loaded_until: Optional[float] = None
+        self._active = 0
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = {}  # handler task -> its writer
+        self.port = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def is_loaded(self) -> bool:
+        return self._active > 0 or (self._loaded_until is not None and time.monotonic() < self._loaded_until)
+
+    async def start(self) -> "FakeOllama":
+        self._load_lock = asyncio.Lock()
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        # The client keeps its connections open; close them so the handlers see EOF and return.
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _ensure_loaded(self):
+        async with self._load_lock:
+            if not self.is_loaded():
+                await asyncio.sleep(self.load_seconds)
+                self.loads += 1
+            self._active += 1
+
+    def _release(self, keep_alive: float):
+        self._active -= 1
+        self._loaded_until = float("inf") if keep_alive < 0 else time.monotonic() + keep_alive
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if method == "POST" and path == "/api/generate":
+                    await self._generate(json.loads(body or b"{}"), writer)
+                else:
+                    writer.write(b"HTTP/1.1 404 Not Found\r\ncontent-length: 0\r\n\r\n")
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def _send_chunk(self, writer: asyncio.StreamWriter, payload: dict):
+        data = json.dumps(payload).encode() + b"\n"
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    async def _generate(self, request: dict, writer: asyncio.StreamWriter):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        keep_alive = parse_keep_alive(request.get("keep_alive"), self.default_keep_alive)
+        prompt = request.get("prompt") or ""
+        model = request.get("model", "")
+        start = time.perf_counter()
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: application/x-ndjson\r\ntransfer-encoding: chunked\r\n\r\n")
+        await self._ensure_loaded()
+        load_seconds = time.perf_counter() - start
+        try:
+            base = {"model": model, "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+            if not prompt:
+                await self._send_chunk(writer, {**base, "response": "", "done": True, "done_reason": "load"})
+            else:
+                await asyncio.sleep((len(prompt) // 4 + 1) * self.prompt_token_latency)
+                tokens = self.reply_tokens
+                for token in tokens:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                    self.tokens_generated += 1
+                    await self._send_chunk(writer, {**base, "response": token, "done": False})
+                elapsed = int((time.perf_counter() - start) * 1e9)
+                await self._send_chunk(writer, {**base, "response": "", "done": True, "done_reason": "stop",
+                                                "total_duration": elapsed, "load_duration": int(load_seconds * 1e9),
+                                                "eval_count": len(tokens)})
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            self._release(keep_alive)
+            self.in_flight -= 1
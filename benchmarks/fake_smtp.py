@@ -0,0 +1,92 @@
+"""
+Local aiosmtpd sink for benchmarks.
+Charges a configurable latency per connection handshake (EHLO, standing in for TCP + TLS + AUTH)
+and per message, can answer 421 once to every Nth recipient or to every message over a per-second
+rate (as providers throttle fast senders), and counts sessions and deliveries.
+"""
+
+import asyncio
+import socket
+import time
+from collections import deque
+from typing import List
+
+from aiosmtpd.controller import Controller
+
+
+def free_port() -> int:
+    # aiosmtpd's Controller cannot bind port 0 and report the chosen port, so pick one up front.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class SinkHandler:
+    def __init__(self, connect_latency: float = 0.0, data_latency: float = 0.0, throttle_every: int = 0,
+                 max_per_second: float = 0):
+        self.connect_latency = connect_latency
+        self.data_latency = data_latency
+        self.throttle_every = throttle_every
+        self.max_per_second = max_per_second
+        self.connections = 0
+        self.delivered = 0
+        self.throttled = set()
+        self.rate_limited = 0
+        self._recent = deque()
+        self.messages: List[bytes] = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        await asyncio.sleep(self.connect_latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.data_latency)
+        # Recipients named userN@... are throttled once when N is a multiple of throttle_every.
+        local_part = envelope.rcpt_tos[0].split("@")[0]
+        number = int(local_part.removeprefix("user")) if local_part.removeprefix("user").isdigit() else None
+        if self.throttle_every and number is not None and number % self.throttle_every == 0 and number not in self.throttled:
+            self.throttled.add(number)
+            return "421 Too many messages, slow down"
+        if self.max_per_second:
+            # Sliding one-second window over accepted messages.
+            now = time.monotonic()
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_per_second:
+                self.rate_limited += 1
+                return "421 4.7.28 Rate limit exceeded, slow down"
+            self._recent.append(now)
+        self.delivered += 1
+        self.messages.append(envelope.content)
+        return "250 OK"
+
+    def reset(self):
+        self.connections = 0
+        self.delivered = 0
+        self.throttled.clear()
+        self.rate_limited = 0
+        self._recent.clear()
+        self.messages.clear()
+
+
+class SmtpSink:
+    """A SinkHandler served by aiosmtpd on a background thread; address is a plain smtp:// server setting."""
+
+    def __init__(self, connect_latency: float = 0.0, data_latency: float = 0.0, throttle_every: int = 0,
+                 max_per_second: float = 0):
+        self.handler = SinkHandler(connect_latency, data_latency, throttle_every, max_per_second)
+        self.port = free_port()
+        self._controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+
+    @property
+    def address(self) -> str:
+        return f"smtp://127.0.0.1:{self.port}"
+
+    def start(self) -> "SmtpSink":
+        self._controller.start()
+        return self
+
+    def stop(self):
+        self._controller.stop()
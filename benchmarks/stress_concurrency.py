@@ -0,0 +1,116 @@
+"""
+Stress test: many overlapping run_workflow calls against one mailbox.
+
+Fires --clients concurrent runs at a fake IMAP server with a stub LLM, in three shapes:
+identical requests, requests spread over two tones and two max_emails values, and the same
+mix with incremental sync. Each scenario runs with single-flight on and off, for both
+outbox backends and for graph and streaming mode, and checks that
+  - no reply is scheduled twice (one outbox row per recipient + subject),
+  - callers with identical requests receive identical results,
+  - each run's own stats (metrics.collecting_stats) count the emails it returned, not another run's,
+and prints LLM calls and IMAP logins per scenario. Exits non-zero if a check fails, so it doubles as
+the concurrency check to run before merging (see Testing in README.md).
+
+    python -m benchmarks.stress_concurrency --clients 16 --emails 10 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+
+import langgraph_flow
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.stub_llm import StubLLM
+from tools import categorize_mail, draft_mail, outbox, read_mail
+from tools import imap_pool as imap_pool_module
+from tools.coordination import workflow_flights
+from tools.imap_pool import ImapPool
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+from tools.metrics import collecting_stats
+import tools.llm_cache
+
+SEND_TIME = "2030-01-01T09:00:00+00:00"
+
+
+async def run_with_stats(server: FakeImapServer, streaming: bool, request: dict):
+    """One run_workflow call and the stats collected for it (empty when it joined an identical run)."""
+    with collecting_stats() as stats:
+        result = await langgraph_flow.run_workflow(server.address, "smtp://127.0.0.1:1", "stress@example.com", "secret",
+                                                   send_time=SEND_TIME, streaming=streaming, **request)
+    return result, stats
+
+
+def requests_for(scenario: str, clients: int, emails: int):
+    if scenario == "identical":
+        return [{"tone": "polite", "max_emails": emails, "incremental": False}] * clients
+    tones, sizes = ("polite", "formal"), (emails, emails // 2)
+    return [{"tone": tones[i % 2], "max_emails": sizes[(i // 2) % 2], "incremental": scenario == "incremental"}
+            for i in range(clients)]
+
+
+async def run_scenario(server: FakeImapServer, stub: StubLLM, tmp: str, scenario: str, clients: int, emails: int,
+                       single_flight: bool, backend: str, streaming: bool) -> bool:
+    label = f"{scenario:<11} {backend:<6} {'stream' if streaming else 'graph':<6} single_flight={'on ' if single_flight else 'off'}"
+    name = label.replace(" ", "_").replace("=", "")
+    read_mail.SYNC_STATE_FILE = os.path.join(tmp, f"{name}.json")
+    store = (outbox.SqliteOutbox(os.path.join(tmp, f"{name}.sqlite3")) if backend == "sqlite"
+             else outbox.JsonOutbox(os.path.join(tmp, f"{name}-outbox.json")))
+    outbox.set_outbox(store)
+    langgraph_flow.WORKFLOW_SINGLE_FLIGHT = single_flight
+    imap_pool_module.imap_pool = ImapPool()
+    server.reset_counters()
+    calls_before, executions_before = stub.calls, workflow_flights.executions
+
+    requests = requests_for(scenario, clients, emails)
+    outcomes = await asyncio.gather(*(run_with_stats(server, streaming, request) for request in requests))
+    await imap_pool_module.imap_pool.close()
+    results = [result for result, _ in outcomes]
+    # Routing sees every email a run read; only the skipped ones are left out of its result.
+    own_stats = all(not stats or stats["routing"]["emails"] - stats["routing"]["skip"] == len(result)
+                    for result, stats in outcomes if result or stats)
+
+    rows = collections.Counter((row["to"], row["subject"]) for row in store.all())
+    duplicates = sum(count - 1 for count in rows.values() if count > 1)
+    by_request = collections.defaultdict(list)
+    for request, result in zip(requests, results):
+        by_request[tuple(sorted(request.items()))].append([(m["subject"], m.get("category"), m.get("draft")) for m in result])
+    # Incremental runs legitimately differ: whichever reads first gets the new mail.
+    consistent = scenario == "incremental" or all(all(r == group[0] for r in group) for group in by_request.values())
+    ok = duplicates == 0 and consistent and own_stats
+    executions = workflow_flights.executions - executions_before if single_flight else clients
+    print(f"{label}  executions={executions:<3} llm_calls={stub.calls - calls_before:<4} imap_logins={server.command_counts.get('LOGIN', 0):<3} "
+          f"scheduled={len(rows):<3} duplicates={duplicates}  consistent={consistent}  own_stats={own_stats}  {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+async def main(clients: int, emails: int, latency: float):
+    tmp = tempfile.mkdtemp()
+    tools.llm_cache.llm_cache = categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+    stub = StubLLM(latency=latency)
+    llm_client.set_llm(stub)
+    server = await FakeImapServer(latency=0.005).start()
+    for raw in build_corpus(emails * 2, attachment_ratio=0.0, newsletter_ratio=0.0):
+        server.deliver(raw)
+
+    ok = True
+    for scenario in ("identical", "mixed", "incremental"):
+        for backend in ("sqlite", "json"):
+            for streaming in (False, True):
+                for single_flight in (True, False):
+                    ok &= await run_scenario(server, stub, tmp, scenario, clients, emails, single_flight, backend, streaming)
+    await server.stop()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--emails", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args.clients, args.emails, args.latency)) else 1)
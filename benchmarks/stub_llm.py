@@ -0,0 +1,116 @@
+"""
+Deterministic stand-in for OllamaLLM with configurable latency, used by the benchmarks.
+Latency is modelled as a fixed per-call cost plus a per-prompt-token cost (prompt evaluation)
+plus completion tokens / tokens_per_second (generation), so batching, prompt size and reply
+length show up in the numbers the way they do with a local model.
+Both invoke (blocking, for the executor path) and ainvoke/astream (non-blocking) are provided.
+"""
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+BATCH_ITEM_RE = re.compile(r'^\[(\d+)\] Subject: (.*)$', re.MULTILINE)
+
+
+def label_for(subject: str) -> str:
+    subject = subject.lower()
+    if "digest" in subject or "newsletter" in subject:
+        return "newsletter"
+    if "urgent" in subject:
+        return "urgent"
+    return "normal"
+
+
+class StubLLM:
+    def __init__(self, latency: float = 0.5, prompt_token_latency: float = 0.0, malformed_rate: float = 0.0,
+                 model: str = "stub", seed: int = 7, tokens_per_second: float = 0.0):
+        self.latency = latency
+        self.prompt_token_latency = prompt_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.malformed_rate = malformed_rate
+        self.model = model
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _respond(self, prompt: str) -> str:
+        if prompt.startswith("Classify each"):
+            labels = [label_for(subject) for _, subject in BATCH_ITEM_RE.findall(prompt)]
+            with self._lock:
+                malformed = self._rng.random() < self.malformed_rate
+            if malformed:
+                # Simulate a truncated answer: drop the tail of the array and its closing bracket.
+                return json.dumps(labels)[: max(1, len(labels) * 5)]
+            return json.dumps(labels)
+        if prompt.startswith("Classify"):
+            subject = re.search(r'^Subject: (.*)$', prompt, re.MULTILINE)
+            return label_for(subject.group(1) if subject else "")
+        name = re.search(r"Start the reply with 'Dear ([^,]*),'", prompt)
+        return (
+            f"Dear {name.group(1) if name else 'Sender'},\n\n"
+            "Thank you for your email. I have received it and will get back to you shortly.\n\n"
+            "Best regards,\nSridhar Prajwal"
+        )
+
+    def _start(self, prompt: str) -> float:
+        """Counts the call and returns how long it should take."""
+        tokens = len(prompt) // 4 + 1
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += tokens
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return self.latency + tokens * self.prompt_token_latency
+
+    def _generation(self, response: str) -> float:
+        completion_tokens = len(response) // 4 + 1
+        with self._lock:
+            self.completion_tokens += completion_tokens
+        return completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def invoke(self, prompt: str, *args, **kwargs) -> str:
+        try:
+            delay = self._start(prompt)
+            response = self._respond(prompt)
+            time.sleep(delay + self._generation(response))
+            return response
+        finally:
+            self._finish()
+
+    async def ainvoke(self, prompt: str, *args, **kwargs) -> str:
+        # The non-blocking path, like OllamaLLM's async client: waiting holds no thread.
+        try:
+            delay = self._start(prompt)
+            response = self._respond(prompt)
+            await asyncio.sleep(delay + self._generation(response))
+            return response
+        finally:
+            self._finish()
+
+    async def astream(self, prompt: str, *args, **kwargs):
+        # One word per token at tokens_per_second, after the per-call and prompt costs; a consumer that
+        # stops early skips the rest of the generation, as a closed Ollama stream does.
+        try:
+            delay = self._start(prompt)
+            response = self._respond(prompt)
+            await asyncio.sleep(delay)
+            for token in re.findall(r'\S+\s*', response):
+                if self.tokens_per_second > 0:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                with self._lock:
+                    self.completion_tokens += 1
+                yield token
+        finally:
+            self._finish()
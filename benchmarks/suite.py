@@ -0,0 +1,346 @@
+"""
+Offline end-to-end benchmark suite: the whole workflow against the in-process fake IMAP server,
+an aiosmtpd sink and the stub LLM, so no mail account or Ollama is needed and runs are repeatable.
+
+Scenarios, each repeated --runs times on the same synthetic inbox (fresh outbox, LLM cache off):
+  stages     the graph nodes called one after another, then the SMTP send of the replies they
+             scheduled; p50/p99 latency per stage, plus peak memory per stage from a tracemalloc pass
+  graph      run_workflow end to end (LangGraph)
+  streaming  run_workflow end to end with the per-email pipeline
+  call_tool  POST /call_tool on the FastAPI app (in process over httpx's ASGI transport), with "trace": true
+For the end-to-end scenarios, per-stage p50/p99 come from the run's trace spans (tools/metrics.py).
+
+Results are written to benchmarks/results/<time>-<commit>.json. --compare checks this run against an
+earlier results file ("latest" for the newest one) and flags p50 slowdowns above --threshold percent
+and --min-delta-ms; the exit status is 1 if any were found.
+
+    python -m benchmarks.suite --emails 50 --runs 5
+    python -m benchmarks.suite --runs 5 --compare latest
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_imap import FakeImapServer
+from benchmarks.fake_smtp import SmtpSink
+from benchmarks.stub_llm import StubLLM
+import langgraph_flow
+import mcp_server
+from tools import categorize_mail, draft_mail, outbox, read_mail
+from tools.accounts import Account, set_accounts
+from tools.imap_pool import imap_pool
+from tools.llm_cache import LLMCache
+from tools.llm_client import llm_client
+from tools.metrics import Trace, tracing
+from tools.rate_limit import smtp_limiter
+from tools.smtp_dispatch import dispatch_due_emails
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SCENARIOS = ("stages", "graph", "streaming", "call_tool")
+STAGES = (
+    ("read_mail", langgraph_flow.node_read_mail),
+    ("preprocess_mail", langgraph_flow.node_preprocess_mail),
+    ("categorize_mail", langgraph_flow.node_categorize_mail),
+    ("route_mail", langgraph_flow.node_route_mail),
+    ("draft_mail", langgraph_flow.node_draft_mail),
+    ("schedule_mail", langgraph_flow.node_schedule_mail),
+)
+ACCOUNT = "bench@example.com"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear interpolation between closest ranks, q in [0, 100]."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(seconds: List[float]) -> Dict:
+    return {"p50_ms": round(percentile(seconds, 50) * 1000, 3), "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+            "samples": len(seconds)}
+
+
+def reset_peak_rss() -> bool:
+    # Linux: writing 5 to clear_refs resets VmHWM, so each scenario reports its own peak.
+    try:
+        with open("/proc/self/clear_refs", "w") as refs:
+            refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mib() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def git_revision() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": False}
+    return {"commit": commit, "dirty": dirty}
+
+
+def past_send_time() -> str:
+    # Already due, so the SMTP stage has every scheduled reply to send.
+    return (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)).replace(microsecond=0).isoformat()
+
+
+class Suite:
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix="email-bench-")
+        self.imap: Optional[FakeImapServer] = None
+        self.sink: Optional[SmtpSink] = None
+        self.llm = StubLLM(latency=args.llm_latency, prompt_token_latency=args.prompt_token_latency,
+                           tokens_per_second=args.tokens_per_second)
+        self.runs = 0
+
+    def fresh_outbox(self):
+        self.runs += 1
+        store = outbox.SqliteOutbox(os.path.join(self.tmp, f"outbox-{self.runs}.sqlite3"))
+        outbox.set_outbox(store)
+        return store
+
+    async def setup(self):
+        llm_client.set_llm(self.llm)
+        categorize_mail.llm_cache = draft_mail.llm_cache = LLMCache(enabled=False)
+        read_mail.SYNC_STATE_FILE = os.path.join(self.tmp, "imap_sync_state.json")
+        self.imap = await FakeImapServer(latency=self.args.imap_latency).start()
+        for raw in build_corpus(self.args.inbox or self.args.emails, attachment_ratio=self.args.attachment_ratio,
+                                newsletter_ratio=self.args.newsletter_ratio, attachment_bytes=self.args.attachment_kb * 1024):
+            self.imap.deliver(raw)
+        self.sink = SmtpSink(data_latency=self.args.smtp_latency).start()
+        # SMTP_SENDS_PER_MINUTE pacing would dominate the send phase; bench_rate_limit measures it.
+        smtp_limiter.bucket.rate_per_minute = 0
+        mcp_server.EMAIL_IMAP_SERVER, mcp_server.EMAIL_SMTP_SERVER = self.imap.address, self.sink.address
+        mcp_server.EMAIL_ADDRESS, mcp_server.EMAIL_PASSWORD = ACCOUNT, "secret"
+        set_accounts([Account(ACCOUNT, "secret", self.imap.address, self.sink.address, ("Inbox",))])
+
+    async def teardown(self):
+        await imap_pool.close()
+        await self.imap.stop()
+        self.sink.stop()
+
+    def state(self) -> Dict:
+        return {"imap_server": self.imap.address, "smtp_server": self.sink.address, "email": ACCOUNT,
+                "password": "secret", "send_time": past_send_time(), "tone": "polite",
+                "max_emails": self.args.emails, "incremental": False}
+
+    async def run_stages(self, samples: Dict[str, List[float]], memory: Optional[Dict[str, float]] = None):
+        store = self.fresh_outbox()
+        state = self.state()
+        steps = [(name, node) for name, node in STAGES] + [("smtp_send", None)]
+        for name, node in steps:
+            if memory is not None:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            if node is None:
+                await dispatch_due_emails(self.sink.address, ACCOUNT, "", outbox=store, backoff_seconds=0.01)
+            else:
+                state.update(await node(state))
+            samples.setdefault(name, []).append(time.perf_counter() - start)
+            if memory is not None:
+                memory[name] = round((tracemalloc.get_traced_memory()[1] - baseline) / (1 << 20), 3)
+
+    async def scenario_stages(self) -> Dict:
+        samples: Dict[str, List[float]] = {}
+        totals = []
+        for _ in range(self.args.runs):
+            start = time.perf_counter()
+            await self.run_stages(samples)
+            totals.append(time.perf_counter() - start)
+        # One more pass under tracemalloc, which is too slow to leave on for the timed runs.
+        memory: Dict[str, float] = {}
+        tracemalloc.start()
+        try:
+            await self.run_stages({}, memory)
+        finally:
+            tracemalloc.stop()
+        stages = {name: {**summarize(values), "peak_mib": memory.get(name)} for name, values in samples.items()}
+        return {"totals": totals, "stages": stages}
+
+    async def traced_runs(self, run_once) -> Dict:
+        totals = []
+        spans: Dict[str, List[float]] = {}
+        for _ in range(self.args.runs):
+            self.fresh_outbox()
+            start = time.perf_counter()
+            trace_spans = await run_once()
+            totals.append(time.perf_counter() - start)
+            for span in trace_spans:
+                spans.setdefault(span["name"], []).append(span["duration_ms"] / 1000)
+        return {"totals": totals, "stages": {name: summarize(values) for name, values in sorted(spans.items())}}
+
+    async def scenario_workflow(self, streaming: bool) -> Dict:
+        async def run_once():
+            state = self.state()
+            with tracing(Trace()) as trace:
+                await langgraph_flow.run_workflow(state["imap_server"], state["smtp_server"], ACCOUNT, "secret",
+                                                  send_time=state["send_time"], max_emails=self.args.emails,
+                                                  streaming=streaming)
+            return trace.spans
+        return await self.traced_runs(run_once)
+
+    async def scenario_call_tool(self) -> Dict:
+        transport = httpx.ASGITransport(app=mcp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def run_once():
+                response = await client.post("/call_tool", json={"name": "run_email_automation_workflow", "arguments": {
+                    "max_emails": self.args.emails, "schedule_time": past_send_time(), "incremental": False, "trace": True}})
+                response.raise_for_status()
+                content = response.json()["content"]
+                if len(content) < 2:
+                    raise RuntimeError(content[0]["text"])
+                return json.loads(content[1]["text"])["trace"]["spans"]
+            return await self.traced_runs(run_once)
+
+    async def run(self) -> Dict:
+        await self.setup()
+        results = {}
+        try:
+            for name in self.args.scenarios:
+                reset_peak_rss()
+                with contextlib.nullcontext() if self.args.verbose else contextlib.redirect_stdout(io.StringIO()):
+                    if name == "stages":
+                        result = await self.scenario_stages()
+                    elif name == "call_tool":
+                        result = await self.scenario_call_tool()
+                    else:
+                        result = await self.scenario_workflow(streaming=name == "streaming")
+                totals = result.pop("totals")
+                p50 = percentile(totals, 50)
+                results[name] = {**summarize(totals), "emails_per_second": round(self.args.emails / p50, 2) if p50 else 0.0,
+                                 "peak_rss_mib": peak_rss_mib(), **result}
+                print_scenario(name, results[name])
+        finally:
+            await self.teardown()
+        return results
+
+
+def print_scenario(name: str, result: Dict):
+    print(f"{name:<10} p50={result['p50_ms']:9.1f} ms  p99={result['p99_ms']:9.1f} ms  "
+          f"{result['emails_per_second']:7.1f} emails/s  peak_rss={result['peak_rss_mib']} MiB")
+    for stage, stats in result["stages"].items():
+        memory = f"  peak={stats['peak_mib']:.2f} MiB" if stats.get("peak_mib") is not None else ""
+        print(f"  {stage:<18} p50={stats['p50_ms']:9.2f} ms  p99={stats['p99_ms']:9.2f} ms  n={stats['samples']:<4}{memory}")
+
+
+def save(report: Dict) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{report['commit']}{'-dirty' if report['dirty'] else ''}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def resolve_baseline(compare: str, exclude: Optional[str]) -> Optional[str]:
+    if compare != "latest":
+        return compare
+    candidates = [path for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json"))) if path != exclude]
+    return candidates[-1] if candidates else None
+
+
+def compare(report: Dict, baseline_path: str, threshold: float, min_delta_ms: float) -> int:
+    """
+    Prints p50 changes against baseline_path and returns the number of regressions: slower by more than
+    threshold percent and by more than min_delta_ms, so jitter on sub-millisecond stages is not flagged.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {os.path.basename(baseline_path)} (commit {baseline['commit']}), threshold {threshold:g}%")
+    regressions = 0
+    for name, result in report["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        rows = [(name, before, result)] + [
+            (f"  {stage}", before["stages"][stage], stats)
+            for stage, stats in result["stages"].items() if stage in before.get("stages", {})
+        ]
+        for label, old, new in rows:
+            if not old["p50_ms"]:
+                continue
+            change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            slower = change > threshold and new["p50_ms"] - old["p50_ms"] > min_delta_ms
+            flag = "  REGRESSION" if slower else ""
+            regressions += bool(flag)
+            print(f"{label:<20} p50 {old['p50_ms']:9.2f} -> {new['p50_ms']:9.2f} ms ({change:+6.1f}%){flag}")
+    return regressions
+
+
+def main(args) -> int:
+    report = {
+        **git_revision(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("compare", "threshold", "min_delta_ms", "save", "verbose")},
+        "scenarios": {},
+    }
+    print(f"{args.emails} emails/run, {args.runs} runs, stub LLM {args.llm_latency * 1000:.0f} ms/call "
+          f"+ {args.tokens_per_second:g} tokens/s, commit {report['commit']}{' (dirty)' if report['dirty'] else ''}")
+    report["scenarios"] = asyncio.run(Suite(args).run())
+    path = save(report) if args.save else None
+    if path:
+        print(f"\nresults written to {os.path.relpath(path)}")
+    if args.compare:
+        baseline = resolve_baseline(args.compare, path)
+        if baseline is None:
+            print("no earlier results to compare with")
+        else:
+            return 1 if compare(report, baseline, args.threshold, args.min_delta_ms) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=20, help="emails read per run")
+    parser.add_argument("--inbox", type=int, default=0, help="messages in the fake inbox (default: --emails)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--attachment-ratio", type=float, default=0.2)
+    parser.add_argument("--newsletter-ratio", type=float, default=0.2)
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    parser.add_argument("--imap-latency", type=float, default=0.002, help="seconds per IMAP command")
+    parser.add_argument("--smtp-latency", type=float, default=0.002, help="seconds per SMTP message")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fixed seconds per LLM call")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0001, help="seconds per prompt token")
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="stub generation rate (0 = instant)")
+    parser.add_argument("--compare", help='earlier results file to compare with, or "latest"')
+    parser.add_argument("--threshold", type=float, default=10.0, help="p50 slowdown in percent counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--no-save", dest="save", action="store_false", help="do not write a results file")
+    parser.add_argument("--verbose", action="store_true", help="keep the workflow's own log output")
+    sys.exit(main(parser.parse_args()))
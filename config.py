@@ -16,4 +16,152 @@ MCP_SERVER_HOST = os.getenv('MCP_SERVER_HOST', '127.0.0.1')  # Changed to localh
 MCP_SERVER_PORT = int(os.getenv('MCP_SERVER_PORT', 8000))
 
 # Development mode - set to True to skip API key authentication
-DEV_MODE = os.getenv('DEV_MODE', 'True').lower() == 'true' 
\ No newline at end of file
+DEV_MODE = os.getenv('DEV_MODE', 'True').lower() == 'true' 
+
+# Incremental IMAP sync - only fetch messages not seen by a previous run (tracked per mailbox by UIDVALIDITY/UID)
+IMAP_INCREMENTAL_SYNC = os.getenv('IMAP_INCREMENTAL_SYNC', 'False').lower() == 'true'
+
+# Pooled IMAP sessions shared across workflow runs (keyed by server + account)
+IMAP_POOL_ENABLED = os.getenv('IMAP_POOL_ENABLED', 'True').lower() == 'true'
+IMAP_POOL_MAX_SESSIONS = int(os.getenv('IMAP_POOL_MAX_SESSIONS', 4))  # per account; Gmail allows 15
+IMAP_POOL_KEEPALIVE_SECONDS = float(os.getenv('IMAP_POOL_KEEPALIVE_SECONDS', 240))
+IMAP_POOL_MAX_IDLE_SECONDS = float(os.getenv('IMAP_POOL_MAX_IDLE_SECONDS', 1500))  # servers drop idle sessions after ~30 min
+
+# Push mode: the MCP server holds an IMAP IDLE session per configured mailbox and runs the workflow on newly
+# arrived mail only. Pushes are debounced into micro-batches: a batch is fetched once no new mail has arrived for
+# IMAP_IDLE_DEBOUNCE_SECONDS, or IMAP_IDLE_MAX_DELAY_SECONDS after the first arrival, and split into workflow runs of
+# at most IMAP_IDLE_MAX_BATCH emails. Replies are scheduled IMAP_IDLE_SEND_DELAY_SECONDS after processing.
+IMAP_IDLE_ENABLED = os.getenv('IMAP_IDLE_ENABLED', 'False').lower() == 'true'
+IMAP_IDLE_DEBOUNCE_SECONDS = float(os.getenv('IMAP_IDLE_DEBOUNCE_SECONDS', 1.0))
+IMAP_IDLE_MAX_DELAY_SECONDS = float(os.getenv('IMAP_IDLE_MAX_DELAY_SECONDS', 5.0))
+IMAP_IDLE_MAX_BATCH = int(os.getenv('IMAP_IDLE_MAX_BATCH', 20))
+IMAP_IDLE_SEND_DELAY_SECONDS = float(os.getenv('IMAP_IDLE_SEND_DELAY_SECONDS', 300))
+IMAP_IDLE_TONE = os.getenv('IMAP_IDLE_TONE', 'polite')
+IMAP_IDLE_RENEW_SECONDS = float(os.getenv('IMAP_IDLE_RENEW_SECONDS', 1500))  # RFC 2177: re-issue IDLE within 29 min
+IMAP_IDLE_RECONNECT_MAX_SECONDS = float(os.getenv('IMAP_IDLE_RECONNECT_MAX_SECONDS', 60))  # backoff cap after a drop
+
+# Reply drafting - max LLM generations in flight and per-draft timeout
+DRAFT_MAX_CONCURRENCY = int(os.getenv('DRAFT_MAX_CONCURRENCY', 4))
+DRAFT_TIMEOUT_SECONDS = float(os.getenv('DRAFT_TIMEOUT_SECONDS', 120))
+# Streamed drafting: read replies token by token, forward partial drafts as progress events, and stop
+# generating once a draft reaches DRAFT_MAX_CHARS characters (0 = no limit)
+DRAFT_STREAMING = os.getenv('DRAFT_STREAMING', 'True').lower() == 'true'
+DRAFT_MAX_CHARS = int(os.getenv('DRAFT_MAX_CHARS', 2000))
+
+# Context-aware drafting: a local embedding index (tools/mail_index.py) over read mail and sent replies adds
+# up to MAIL_INDEX_TOP_K related messages, within MAIL_INDEX_TOKEN_BUDGET tokens, to each draft prompt
+MAIL_INDEX_ENABLED = os.getenv('MAIL_INDEX_ENABLED', 'False').lower() == 'true'
+MAIL_INDEX_DIR = os.getenv('MAIL_INDEX_DIR')  # default: tools/mail_index/
+MAIL_INDEX_DIM = int(os.getenv('MAIL_INDEX_DIM', 256))  # 1 KiB per message on disk; fixed once the index exists
+MAIL_INDEX_TOP_K = int(os.getenv('MAIL_INDEX_TOP_K', 3))
+MAIL_INDEX_TOKEN_BUDGET = int(os.getenv('MAIL_INDEX_TOKEN_BUDGET', 200))
+
+# Batched categorization - pack several emails into one classification prompt of up to this many tokens
+CATEGORIZE_BATCH_MODE = os.getenv('CATEGORIZE_BATCH_MODE', 'False').lower() == 'true'
+CATEGORIZE_BATCH_TOKEN_BUDGET = int(os.getenv('CATEGORIZE_BATCH_TOKEN_BUDGET', 1500))
+
+# Prompt preprocessing (tools/preprocess_mail.py): before the LLM steps, each email's text is cut down to what the
+# sender wrote (greeting, quoted replies, signatures and tracking links removed, whitespace collapsed) and to at most
+# PROMPT_BODY_TOKENS tokens, about the 200 bytes prompts got before, now without the noise. Up to PROMPT_RAW_TEXT_BYTES
+# of the first text part are read for it; with preprocessing off, prompts get the first 200 bytes as they are.
+PROMPT_PREPROCESS = os.getenv('PROMPT_PREPROCESS', 'True').lower() == 'true'
+PROMPT_BODY_TOKENS = int(os.getenv('PROMPT_BODY_TOKENS', 50))
+PROMPT_RAW_TEXT_BYTES = int(os.getenv('PROMPT_RAW_TEXT_BYTES', 2048))
+
+# Persistent LLM result cache for categorization and drafting (SQLite file in tools/)
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True').lower() == 'true'
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 20000))
+LLM_CACHE_TTL_SECONDS = float(os.getenv('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+# Outbox for scheduled replies: 'sqlite' (indexed, WAL mode) or 'json' (legacy tools/scheduled_emails.json)
+OUTBOX_BACKEND = os.getenv('OUTBOX_BACKEND', 'sqlite').lower()
+OUTBOX_DB_FILE = os.getenv('OUTBOX_DB_FILE')  # default: tools/outbox.sqlite3
+# A reply is a duplicate when the outbox already answers the same Message-ID. With the Bloom filter on, the
+# SQLite outbox keeps the dedup keys in memory (about 1.8 MB per million at 0.1%) and skips the lookup for new mail
+OUTBOX_BLOOM_FILTER = os.getenv('OUTBOX_BLOOM_FILTER', 'False').lower() == 'true'
+OUTBOX_BLOOM_CAPACITY = int(os.getenv('OUTBOX_BLOOM_CAPACITY', 1_000_000))
+OUTBOX_BLOOM_ERROR_RATE = float(os.getenv('OUTBOX_BLOOM_ERROR_RATE', 0.001))
+
+# Scheduled-send engine: 'queue' wakes exactly when the next email is due, 'interval' polls every N minutes
+SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'queue').lower()
+SCHEDULER_INTERVAL_MINUTES = float(os.getenv('SCHEDULER_INTERVAL_MINUTES', 1))
+
+# Async SMTP dispatch: reuse authenticated connections for every due email in a send pass
+SMTP_ASYNC_DISPATCH = os.getenv('SMTP_ASYNC_DISPATCH', 'True').lower() == 'true'
+SMTP_MAX_CONNECTIONS = int(os.getenv('SMTP_MAX_CONNECTIONS', 2))
+SMTP_COMMIT_BATCH = int(os.getenv('SMTP_COMMIT_BATCH', 50))  # sent flags written to the outbox per batch
+SMTP_MAX_RETRIES = int(os.getenv('SMTP_MAX_RETRIES', 3))
+SMTP_BACKOFF_SECONDS = float(os.getenv('SMTP_BACKOFF_SECONDS', 2))
+
+# Streaming workflow: each email moves through categorize/draft/schedule as soon as it is fetched
+WORKFLOW_STREAMING = os.getenv('WORKFLOW_STREAMING', 'False').lower() == 'true'
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 16))  # per stage; a full queue pauses the stage feeding it
+PIPELINE_CATEGORIZE_WORKERS = int(os.getenv('PIPELINE_CATEGORIZE_WORKERS', 1))
+PIPELINE_DRAFT_WORKERS = int(os.getenv('PIPELINE_DRAFT_WORKERS', DRAFT_MAX_CONCURRENCY))
+
+# What happens to each email after categorization: draft (reply and schedule), archive (list it, no reply)
+# or skip (drop it). Format "category:action,..."; categories not listed use CATEGORY_DEFAULT_ACTION.
+CATEGORY_POLICY = dict(
+    item.strip().lower().split(':', 1)
+    for item in os.getenv('CATEGORY_POLICY', 'spam:skip,newsletter:archive,promotion:archive').split(',')
+    if ':' in item
+)
+CATEGORY_DEFAULT_ACTION = os.getenv('CATEGORY_DEFAULT_ACTION', 'draft').lower()
+# Label mail with List-Unsubscribe / List-Id / Precedence: bulk headers without asking the LLM
+BULK_HEADER_RULES = os.getenv('BULK_HEADER_RULES', 'True').lower() == 'true'
+
+# Background jobs for the MCP tool (POST /jobs): workflow runs allowed at once, finished jobs kept for /jobs/{id}
+JOBS_MAX_CONCURRENCY = int(os.getenv('JOBS_MAX_CONCURRENCY', 2))
+JOBS_MAX_HISTORY = int(os.getenv('JOBS_MAX_HISTORY', 100))
+
+# Overlapping run_workflow calls for the same account, max_emails and tone share one execution
+WORKFLOW_SINGLE_FLIGHT = os.getenv('WORKFLOW_SINGLE_FLIGHT', 'True').lower() == 'true'
+
+# Streaming MIME extraction: fetch messages in chunks and stop after the headers and first text part
+MIME_STREAMING = os.getenv('MIME_STREAMING', 'True').lower() == 'true'
+MIME_FETCH_CHUNK_BYTES = int(os.getenv('MIME_FETCH_CHUNK_BYTES', 64 * 1024))
+
+# Latency histograms and counters served at GET /metrics (Prometheus text format)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+
+# Shared Ollama client: model and server, how long the model stays loaded after a request
+# (Ollama duration such as '30m', seconds, or -1 to keep it loaded), and warm-up at server startup
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2')
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL')  # default: the ollama client's own (OLLAMA_HOST or localhost:11434)
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+if OLLAMA_KEEP_ALIVE.lstrip('-').isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+LLM_WARMUP = os.getenv('LLM_WARMUP', 'True').lower() == 'true'
+# Calls use the client's native async path; LLMs without one (or with this off) run on a dedicated executor
+LLM_NATIVE_ASYNC = os.getenv('LLM_NATIVE_ASYNC', 'True').lower() == 'true'
+LLM_EXECUTOR_WORKERS = int(os.getenv('LLM_EXECUTOR_WORKERS', 4))
+# LLM calls in flight across every run and mailbox in the process (0 = no cap); match Ollama's OLLAMA_NUM_PARALLEL
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+
+# Several accounts and folders per run: a JSON file listing {"email", "password", "imap_server", "smtp_server",
+# "folders"} objects (missing fields fall back to the EMAIL_* settings). Without one, the EMAIL_ADDRESS account
+# is the only account; EMAIL_FOLDERS (comma-separated) are the folders read when an account lists none.
+EMAIL_ACCOUNTS_FILE = os.getenv('EMAIL_ACCOUNTS_FILE')
+EMAIL_FOLDERS = [folder.strip() for folder in os.getenv('EMAIL_FOLDERS', 'Inbox').split(',') if folder.strip()]
+FANOUT_MAILBOX_TIMEOUT_SECONDS = float(os.getenv('FANOUT_MAILBOX_TIMEOUT_SECONDS', 600))  # per mailbox; 0 = no limit
+# Connections open at once to one IMAP / SMTP host, shared by every account on it (0 = no cap)
+IMAP_PROVIDER_MAX_CONNECTIONS = int(os.getenv('IMAP_PROVIDER_MAX_CONNECTIONS', 16))
+SMTP_PROVIDER_MAX_CONNECTIONS = int(os.getenv('SMTP_PROVIDER_MAX_CONNECTIONS', 8))
+
+# Rate limits and adaptive concurrency per dependency (tools/rate_limit.py): a token bucket of *_PER_MINUTE calls
+# (0 = no rate limit) in bursts of up to *_BURST, and calls in flight adapted (AIMD) between 1 and the maximum:
+# halved after an error or a call slower than *_LATENCY_TARGET_SECONDS, grown back by one per round of successes.
+# The LLM maximum is LLM_MAX_CONCURRENCY.
+RATE_LIMIT_ADAPTIVE = os.getenv('RATE_LIMIT_ADAPTIVE', 'True').lower() == 'true'
+IMAP_COMMANDS_PER_MINUTE = float(os.getenv('IMAP_COMMANDS_PER_MINUTE', 0))
+IMAP_COMMAND_BURST = int(os.getenv('IMAP_COMMAND_BURST', 50))
+IMAP_MAX_CONCURRENT_COMMANDS = int(os.getenv('IMAP_MAX_CONCURRENT_COMMANDS', 16))
+IMAP_LATENCY_TARGET_SECONDS = float(os.getenv('IMAP_LATENCY_TARGET_SECONDS', 10))
+LLM_CALLS_PER_MINUTE = float(os.getenv('LLM_CALLS_PER_MINUTE', 0))
+LLM_CALL_BURST = int(os.getenv('LLM_CALL_BURST', 10))
+LLM_LATENCY_TARGET_SECONDS = float(os.getenv('LLM_LATENCY_TARGET_SECONDS', 60))
+# Providers throttle accounts that send too fast (Gmail: 421 4.7.28), so sends are paced by default
+SMTP_SENDS_PER_MINUTE = float(os.getenv('SMTP_SENDS_PER_MINUTE', 60))
+SMTP_SEND_BURST = int(os.getenv('SMTP_SEND_BURST', 20))
+SMTP_MAX_CONCURRENT_SENDS = int(os.getenv('SMTP_MAX_CONCURRENT_SENDS', 4))
+SMTP_LATENCY_TARGET_SECONDS = float(os.getenv('SMTP_LATENCY_TARGET_SECONDS', 10))
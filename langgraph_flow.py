@@ -1,79 +1,244 @@
-from tools.read_mail import read_inbox_emails
+from tools.read_mail import (read_inbox_emails, read_inbox_emails_pooled, save_sync_position, stream_inbox_emails,
+                             sync_state_key)
 from tools.categorize_mail import categorize_emails
-from tools.draft_mail import draft_email_response
+from tools.draft_mail import draft_email_responses, partial_draft_event
+from tools.preprocess_mail import preprocess_emails
 from tools.schedule_mail import schedule_email_send
+from tools.pipeline import EmailPipeline
+from tools.route_mail import route_email, summarize_routing
+from tools.coordination import mailbox_locks, workflow_flights
+from tools.records import EmailRecord
+from tools.accounts import Account
+from tools.metrics import NODE_ERRORS, NODE_SECONDS, RUN_EMAILS, RUN_SECONDS, collecting_stats, observe
 import asyncio
-from typing import Any, Dict
-# Import the correct graph builder from langgraph
-from langgraph.graph import StateGraph, START, END
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypedDict
 import datetime
+import time
+from config import (IMAP_POOL_ENABLED, DRAFT_MAX_CONCURRENCY, DRAFT_TIMEOUT_SECONDS, WORKFLOW_STREAMING, WORKFLOW_SINGLE_FLIGHT,
+                    FANOUT_MAILBOX_TIMEOUT_SECONDS, PROMPT_PREPROCESS)
 
-# Define State as a plain dict for LangGraph compatibility
-State = dict
+# Declared keys let each node return only what it changes; LangGraph merges it into the state.
+class State(TypedDict, total=False):
+    imap_server: str
+    smtp_server: str
+    email: str
+    password: str
+    mailbox: str
+    send_time: str
+    tone: str
+    max_emails: int
+    incremental: bool
+    draft_concurrency: int
+    draft_timeout: float
+    progress: Callable[[Dict], None]  # receives partial drafts while they stream (set by run_graph_or_pipeline)
+    emails: List[EmailRecord]
 
 # --- Node wrappers for state dicts ---
 async def node_read_mail(state: Dict) -> Dict:
-    state_out = dict(state)  # Copy all keys
-    emails = await read_inbox_emails(
-        state["imap_server"],
-        state["email"],
-        state["password"],
-        state.get("max_emails", 10)
-    )
-    state_out["emails"] = emails
-    return state_out
+    if state.get("emails") is not None:
+        # Already fetched by the caller (the IMAP IDLE watcher): nothing to read.
+        return {"emails": [tag_mail(mail, state) for mail in state["emails"]]}
+    read = read_inbox_emails_pooled if IMAP_POOL_ENABLED else read_inbox_emails
+    mailbox = state.get("mailbox", "Inbox")
+    # One reader per mailbox at a time, so incremental runs see each other's saved UID state.
+    async with mailbox_locks.get("read", state["imap_server"], state["email"], mailbox):
+        emails = await read(
+            state["imap_server"],
+            state["email"],
+            state["password"],
+            state.get("max_emails", 10),
+            incremental=state.get("incremental", False),
+            mailbox=mailbox
+        )
+    for mail in emails:
+        tag_mail(mail, state)
+    return {"emails": emails}
+
+async def node_preprocess_mail(state: Dict) -> Dict:
+    # Trims each snippet to the text the LLM steps need (tools/preprocess_mail.py).
+    if PROMPT_PREPROCESS:
+        preprocess_emails(state["emails"])
+    return {"emails": state["emails"]}
 
 async def node_categorize_mail(state: Dict) -> Dict:
-    state_out = dict(state)  # Copy all keys
     emails = state["emails"]
     categorized = await categorize_emails(emails)
-    state_out["emails"] = categorized
-    return state_out
+    return {"emails": categorized}
+
+async def node_route_mail(state: Dict) -> Dict:
+    emails = state["emails"]
+    for mail in emails:
+        route_email(mail)
+    summarize_routing(emails)
+    return {"emails": emails}
 
 async def node_draft_mail(state: Dict) -> Dict:
-    state_out = dict(state)  # Copy all keys
     emails = state["emails"]
     tone = state.get("tone", "polite")
-    drafted = []
-    for mail in emails:
-        draft = await draft_email_response(mail, tone)
-        mail["draft"] = draft
-        drafted.append(mail)
-    state_out["emails"] = drafted
-    return state_out
+    positions = [position for position, mail in enumerate(emails) if mail.action == "draft"]
+    to_draft = [emails[position] for position in positions]
+    progress = state.get("progress")
+    on_partial = None
+    if progress is not None:
+        def on_partial(index: int, text: str, done: bool):
+            progress(partial_draft_event(positions[index], to_draft[index], text, done))
+    # Drafts complete out of order; writing by index keeps the input order in the state.
+    async for index, draft in draft_email_responses(
+        to_draft,
+        tone,
+        max_concurrency=state.get("draft_concurrency", DRAFT_MAX_CONCURRENCY),
+        timeout=state.get("draft_timeout", DRAFT_TIMEOUT_SECONDS),
+        on_partial=on_partial
+    ):
+        to_draft[index].draft = draft
+    return {"emails": emails}
 
 async def node_schedule_mail(state: Dict) -> Dict:
-    state_out = dict(state)  # Copy all keys
     emails = state["emails"]
     send_time = state["send_time"]
-    for mail in emails:
-        mail["to"] = mail.get("from")
-        scheduled = schedule_email_send(mail, send_time)
-        mail["scheduled"] = scheduled
-    state_out["emails"] = emails
-    return state_out
+    async with mailbox_locks.get("schedule", state["imap_server"], state["email"]):
+        for mail in emails:
+            if mail.action != "draft":
+                mail.scheduled = False
+                continue
+            mail.to = mail.sender
+            mail.scheduled = schedule_email_send(mail, send_time)
+    return {"emails": emails}
+
+def timed_node(name: str, node: Callable[[Dict], Awaitable[Dict]]) -> Callable[[Dict], Awaitable[Dict]]:
+    """Wraps a node so each run lands in the node latency histogram and, when tracing, in the run's trace."""
+    async def run(state: Dict) -> Dict:
+        with observe(NODE_SECONDS, span=name, errors=NODE_ERRORS, node=name):
+            return await node(state)
+    return run
+
+# --- Conditional edges ---
+def after_read(state: Dict) -> str:
+    return "preprocess_mail" if state["emails"] else "end"
+
+def after_route(state: Dict) -> str:
+    # Only emails routed to "draft" need the LLM and a scheduled reply.
+    if any(mail.action == "draft" for mail in state["emails"]):
+        return "draft_mail"
+    return "schedule_mail"
 
 # --- Build the workflow graph using StateGraph ---
-workflow = StateGraph(State)
-workflow.add_node("read_mail", node_read_mail)
-workflow.add_node("categorize_mail", node_categorize_mail)
-workflow.add_node("draft_mail", node_draft_mail)
-workflow.add_node("schedule_mail", node_schedule_mail)
-
-# Define the workflow: read -> categorize -> draft -> schedule
-workflow.add_edge(START, "read_mail")
-workflow.add_edge("read_mail", "categorize_mail")
-workflow.add_edge("categorize_mail", "draft_mail")
-workflow.add_edge("draft_mail", "schedule_mail")
-workflow.add_edge("schedule_mail", END)
-
-compiled_workflow = workflow.compile()
-
-async def run_workflow(imap_server: str, smtp_server: str, email: str, password: str, send_time: str = None, tone: str = "polite", max_emails: int = 10) -> Any:
+def build_workflow():
+    """
+    The uncompiled graph. LangGraph is imported here rather than at module level, so importing this
+    module (as mcp_server does at startup) does not pay for it until a workflow actually runs.
+    """
+    from langgraph.graph import StateGraph, START, END
+
+    workflow = StateGraph(State)
+    workflow.add_node("read_mail", timed_node("read_mail", node_read_mail))
+    workflow.add_node("preprocess_mail", timed_node("preprocess_mail", node_preprocess_mail))
+    workflow.add_node("categorize_mail", timed_node("categorize_mail", node_categorize_mail))
+    workflow.add_node("route_mail", timed_node("route_mail", node_route_mail))
+    workflow.add_node("draft_mail", timed_node("draft_mail", node_draft_mail))
+    workflow.add_node("schedule_mail", timed_node("schedule_mail", node_schedule_mail))
+
+    # Define the workflow: read -> categorize -> route -> draft -> schedule
+    # (an empty inbox ends after read; if nothing is routed to "draft", drafting is skipped)
+    workflow.add_edge(START, "read_mail")
+    workflow.add_conditional_edges("read_mail", after_read, {"preprocess_mail": "preprocess_mail", "end": END})
+    workflow.add_edge("preprocess_mail", "categorize_mail")
+    workflow.add_edge("categorize_mail", "route_mail")
+    workflow.add_conditional_edges("route_mail", after_route, ["draft_mail", "schedule_mail"])
+    workflow.add_edge("draft_mail", "schedule_mail")
+    workflow.add_edge("schedule_mail", END)
+    return workflow
+
+_compiled_workflow = None
+
+def get_compiled_workflow():
+    """Compiles the graph on first use and reuses it for every later run."""
+    global _compiled_workflow
+    if _compiled_workflow is None:
+        _compiled_workflow = build_workflow().compile()
+    return _compiled_workflow
+
+def tag_mail(mail: EmailRecord, state: Dict) -> EmailRecord:
+    """Records where mail was read from, so merged results and scheduled replies keep their account."""
+    mail.account = state["email"]
+    mail.mailbox = state.get("mailbox", "Inbox")
+    return mail
+
+async def locked_source(source: AsyncIterator[Dict], lock: asyncio.Lock, state: Dict) -> AsyncIterator[Dict]:
+    async with lock:
+        async for mail in source:
+            yield tag_mail(mail, state)
+
+async def prefetched_source(emails: List[EmailRecord], state: Dict) -> AsyncIterator[EmailRecord]:
+    for mail in emails:
+        yield tag_mail(mail, state)
+
+async def run_incremental(state: Dict, streaming: bool, progress: Optional[Callable[[Dict], None]] = None) -> List[EmailRecord]:
+    """
+    An incremental run: the new mail is read first and its UID saved only once every step, scheduling
+    included, has finished, so a run that fails or is cancelled part way leaves the mail to the next one.
+    The mailbox's read lock is held throughout, so an overlapping run does not pick up the same mail.
     """
-    Executes the email automation workflow using the compiled LangGraph graph.
-    Returns the final state from the workflow.
+    imap_server, email, mailbox = state["imap_server"], state["email"], state["mailbox"]
+    read = read_inbox_emails_pooled if IMAP_POOL_ENABLED else read_inbox_emails
+    position: Dict = {}
+    async with mailbox_locks.get("read", imap_server, email, mailbox):
+        emails = await read(imap_server, email, state["password"], state["max_emails"], incremental=True,
+                            mailbox=mailbox, position=position)
+        # Incremental sync fetches all of its mail in one round trip, so streaming loses no overlap here.
+        emails = await run_graph_or_pipeline({**state, "emails": emails}, streaming, progress)
+        save_sync_position(sync_state_key(imap_server, email, mailbox), position)
+    return emails
+
+async def run_graph_or_pipeline(state: Dict, streaming: bool, progress: Optional[Callable[[Dict], None]] = None) -> List[EmailRecord]:
+    imap_server, email, mailbox = state["imap_server"], state["email"], state["mailbox"]
+    if state.get("incremental") and state.get("emails") is None:
+        return await run_incremental(state, streaming, progress)
+    if streaming:
+        pipeline = EmailPipeline(tone=state["tone"], send_time=state["send_time"], progress=progress,
+                                 schedule_lock=mailbox_locks.get("schedule", imap_server, email))
+        if state.get("emails") is not None:
+            emails = await pipeline.run(prefetched_source(state["emails"], state))
+        else:
+            source = stream_inbox_emails(imap_server, email, state["password"], state["max_emails"],
+                                         incremental=state["incremental"], mailbox=mailbox, pooled=IMAP_POOL_ENABLED)
+            emails = await pipeline.run(locked_source(source, mailbox_locks.get("read", imap_server, email, mailbox), state))
+    elif progress is not None:
+        emails = []
+        async for update in get_compiled_workflow().astream({**state, "progress": progress}, stream_mode="updates"):
+            for stage, node_state in update.items():
+                emails = node_state["emails"]
+                for index, mail in enumerate(emails):
+                    progress({"type": "email", "stage": stage, "index": index, "email": mail.to_dict()})
+    else:
+        result = await get_compiled_workflow().ainvoke(state)
+        emails = result["emails"]
+    return emails
+
+async def execute_workflow(state: Dict, streaming: bool, progress: Optional[Callable[[Dict], None]] = None) -> List[EmailRecord]:
+    with observe(RUN_SECONDS, span="workflow", mode="streaming" if streaming else "graph"):
+        emails = await run_graph_or_pipeline(state, streaming, progress)
+    for mail in emails:
+        RUN_EMAILS.inc(action=mail.action or "none")
+    return [mail for mail in emails if mail.action != "skip"]
+
+async def run_workflow(imap_server: str, smtp_server: str, email: str, password: str, send_time: str = None, tone: str = "polite", max_emails: int = 10, incremental: bool = False, streaming: bool = WORKFLOW_STREAMING, progress: Optional[Callable[[Dict], None]] = None, mailbox: str = "Inbox", emails: Optional[List[EmailRecord]] = None) -> Any:
     """
+    Executes the email automation workflow using the compiled LangGraph graph on one mailbox
+    (folder) of one account. Returns the processed emails, each tagged with its account and mailbox;
+    those routed to "skip" by CATEGORY_POLICY are left out.
+    With streaming=True the same steps run as a per-email pipeline (tools/pipeline.py) instead,
+    so replies are scheduled while later emails are still being fetched and drafted.
+    progress, if given, is called with {"type": "email", "stage", "index", "email"} each time an email
+    finishes a step: per email as it happens in streaming mode, per node as each node completes otherwise.
+    With DRAFT_STREAMING it also receives {"type": "draft", "index", "message_id", "draft", "done"}
+    as each reply is generated (see draft_mail.stream_draft).
+    With WORKFLOW_SINGLE_FLIGHT, a call made while an identical one (same account, max_emails, tone,
+    options and explicit send_time) is running joins it and gets its own copy of the same result.
+    emails, if given, are processed instead of reading the mailbox (the IMAP IDLE watcher passes the
+    mail that just arrived); such runs are never shared.
+    """
+    key = (imap_server, email, mailbox, max_emails, tone, incremental, streaming, send_time)
     if not send_time:
         send_time = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5)).replace(microsecond=0).isoformat()
     state = {
@@ -81,12 +246,74 @@ async def run_workflow(imap_server: str, smtp_server: str, email: str, password:
         "smtp_server": smtp_server,
         "email": email,
         "password": password,
+        "mailbox": mailbox,
         "send_time": send_time,
         "tone": tone,
-        "max_emails": max_emails
+        "max_emails": max_emails,
+        "incremental": incremental
     }
-    result = await compiled_workflow.ainvoke(state)
-    return result["emails"]
+    if emails is not None:
+        state["emails"] = emails
+    if not WORKFLOW_SINGLE_FLIGHT or emails is not None:
+        return await execute_workflow(state, streaming, progress)
+    emails = await workflow_flights.do(key, lambda broadcast: execute_workflow(state, streaming, broadcast), listener=progress)
+    return [mail.copy() for mail in emails]
+
+async def run_mailboxes_workflow(mailboxes: List[Tuple[Account, str]], send_time: str = None, tone: str = "polite", max_emails: int = 10, incremental: bool = False, streaming: bool = WORKFLOW_STREAMING, progress: Optional[Callable[[Dict], None]] = None, timeout: float = FANOUT_MAILBOX_TIMEOUT_SECONDS) -> Dict:
+    """
+    Runs run_workflow on every (account, folder) pair at once and merges the results as each mailbox
+    finishes, so a slow or unreachable mailbox never holds up the others; one that takes longer than
+    timeout seconds (0 = no limit, and time spent waiting on the limits below counts) is cancelled and
+    reported instead. The shared limits still apply
+    across all of them: LLM_MAX_CONCURRENCY, the per-account IMAP pool and the per-provider IMAP cap.
+    Returns {"emails": [...], "mailboxes": [{"account", "mailbox", "status", "emails", "seconds", "stats", "error"?}]},
+    emails in the order their mailboxes finished. "stats" holds that mailbox run's per-step stats (see
+    metrics.run_stats); a run that joined an identical one (WORKFLOW_SINGLE_FLIGHT) has none of its own. progress receives run_workflow's events with "account"
+    and "mailbox" added, plus {"type": "mailbox", ...} with each mailbox's outcome as it finishes.
+    """
+    if not send_time:
+        # One send time for the whole run, so mailboxes that finish later do not push their replies back.
+        send_time = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5)).replace(microsecond=0).isoformat()
+
+    async def run_one(account: Account, folder: str) -> Tuple[Dict, List[EmailRecord]]:
+        tagged = None
+        if progress is not None:
+            def tagged(event: Dict):
+                progress({**event, "account": account.email, "mailbox": folder})
+        outcome = {"account": account.email, "mailbox": folder}
+        start = time.perf_counter()
+        try:
+            with collecting_stats() as stats:
+                run = run_workflow(account.imap_server, account.smtp_server, account.email, account.password, send_time,
+                                   tone, max_emails, incremental, streaming, progress=tagged, mailbox=folder)
+                emails = await asyncio.wait_for(run, timeout) if timeout > 0 else await run
+            outcome.update(status="ok", emails=len(emails))
+        except asyncio.TimeoutError:
+            emails = []
+            outcome.update(status="timeout", emails=0, error=f"no result after {timeout:g}s")
+        except Exception as e:
+            emails = []
+            outcome.update(status="error", emails=0, error=str(e))
+        outcome["seconds"] = round(time.perf_counter() - start, 3)
+        outcome["stats"] = stats
+        if outcome["status"] != "ok":
+            print(f"[FANOUT] {account.email}/{folder}: {outcome['status']} ({outcome['error']})")
+        if progress is not None:
+            progress({"type": "mailbox", **outcome})
+        return outcome, emails
+
+    merged, outcomes = [], []
+    tasks = [asyncio.ensure_future(run_one(account, folder)) for account, folder in mailboxes]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            outcome, emails = await finished
+            outcomes.append(outcome)
+            merged.extend(emails)
+    finally:
+        # Only has an effect when this call itself is cancelled: take the mailboxes still running with it.
+        for task in tasks:
+            task.cancel()
+    return {"emails": merged, "mailboxes": outcomes}
 
 # Example usage (for testing):
 # asyncio.run(run_workflow(imap_server, smtp_server, email, password, send_time="2024-06-01T10:00:00Z"))
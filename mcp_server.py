@@ -1,24 +1,54 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
-from mcp.types import Tool, ListToolsResult, CallToolResult, TextContent
-from langgraph_flow import run_workflow
-from config import EMAIL_IMAP_SERVER, EMAIL_SMTP_SERVER, EMAIL_ADDRESS, EMAIL_PASSWORD
+from typing import Callable, Dict, Any, Optional
+try:
+    # Newer SDKs ship the wire types as a standalone package; mcp.types would also import the client and server stacks.
+    from mcp_types import Tool, ListToolsResult, CallToolResult, TextContent
+except ImportError:
+    from mcp.types import Tool, ListToolsResult, CallToolResult, TextContent
+from langgraph_flow import run_mailboxes_workflow
+from config import EMAIL_IMAP_SERVER, EMAIL_SMTP_SERVER, EMAIL_ADDRESS, EMAIL_PASSWORD, IMAP_INCREMENTAL_SYNC
+from config import SCHEDULER_MODE, SCHEDULER_INTERVAL_MINUTES, LLM_WARMUP, IMAP_IDLE_ENABLED
+import asyncio
 import datetime
-from apscheduler.schedulers.background import BackgroundScheduler
-from tools.schedule_mail import process_due_emails
+from tools.accounts import get_accounts, select_mailboxes
+from tools.coordination import imap_provider_limits, smtp_provider_limits
+from tools.schedule_mail import process_due_emails, add_schedule_listener
+from tools.due_queue import DueQueueScheduler
+from tools.idle_watch import idle_watcher
+from tools.imap_pool import imap_pool
+from tools.llm_cache import llm_cache
+from tools.llm_client import llm_client
+from tools.jobs import job_manager
+from tools.records import as_dict, dumps
+from tools.metrics import Trace, registry, tracing
+from tools.rate_limit import imap_limiter, smtp_limiter
+
+# --- Local scheduling of due emails ---
+mail_scheduler = None
 
-# --- APScheduler integration for local scheduling ---
 def start_mail_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        lambda: process_due_emails(EMAIL_SMTP_SERVER, EMAIL_ADDRESS, EMAIL_PASSWORD),
-        'interval',
-        minutes=1,
-        id='mail_scheduler'
-    )
-    scheduler.start()
-    print("[SCHEDULER] Mail scheduler started (runs every minute)")
+    global mail_scheduler
+    # Replies go out from the account they answer; EMAIL_* covers any scheduled before accounts were recorded.
+    send_due = lambda: process_due_emails(EMAIL_SMTP_SERVER, EMAIL_ADDRESS, EMAIL_PASSWORD, get_accounts())
+    if SCHEDULER_MODE == "interval":
+        # Legacy polling mode, kept for comparison (APScheduler is only imported for it)
+        from apscheduler.schedulers.background import BackgroundScheduler
+        mail_scheduler = BackgroundScheduler()
+        mail_scheduler.add_job(
+            send_due,
+            'interval',
+            minutes=SCHEDULER_INTERVAL_MINUTES,
+            id='mail_scheduler'
+        )
+        mail_scheduler.start()
+        print(f"[SCHEDULER] Mail scheduler started (runs every {SCHEDULER_INTERVAL_MINUTES:g} minute(s))")
+    else:
+        mail_scheduler = DueQueueScheduler(send_due)
+        add_schedule_listener(mail_scheduler.notify)
+        mail_scheduler.start()
+        print("[SCHEDULER] Mail scheduler started (wakes when the next email is due)")
 # ---------------------------------------------------
 
 app = FastAPI()
@@ -44,15 +74,98 @@ EMAIL_WORKFLOW_TOOL = Tool(
                 "description": "When to schedule emails (ISO format, default: 5 minutes from now)",
                 "format": "date-time",
                 "default": (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5)).replace(microsecond=0).isoformat()
+            },
+            "accounts": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Addresses of the configured accounts to process (default: all of them); mailboxes run concurrently"
+            },
+            "folders": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Folders to read in each account (default: the account's configured folders, e.g. Inbox)"
+            },
+            "incremental": {
+                "type": "boolean",
+                "description": "Only process emails that arrived since the previous run (UID-based sync)",
+                "default": IMAP_INCREMENTAL_SYNC
+            },
+            "background": {
+                "type": "boolean",
+                "description": "Return a job id immediately and run in the background (see /jobs/{job_id})",
+                "default": False
+            },
+            "trace": {
+                "type": "boolean",
+                "description": "Append per-step timing spans (IMAP, LLM, SMTP, graph nodes) to the result; not for background runs",
+                "default": False
+            },
+            "stream": {
+                "type": "boolean",
+                "description": "Answer with server-sent events: progress, partial drafts as they are generated, then the result",
+                "default": False
             }
         },
         "required": []
     }
 )
 
+# Background model load started at startup; kept here so it is not garbage-collected mid-flight.
+llm_warmup_task: Optional[asyncio.Task] = None
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
+    global llm_warmup_task
     start_mail_scheduler()
+    if LLM_WARMUP:
+        # Load the model in the background: the server accepts requests meanwhile, and Ollama
+        # queues any that arrive before the load finishes instead of loading the model twice.
+        llm_warmup_task = asyncio.create_task(llm_client.warm_up())
+    if IMAP_IDLE_ENABLED:
+        # New mail is processed as it arrives, in addition to on-demand runs through /call_tool.
+        idle_watcher.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if mail_scheduler is not None:
+        mail_scheduler.shutdown(wait=False)
+    await job_manager.shutdown()
+    await idle_watcher.stop()
+    await imap_pool.close()
+    if llm_warmup_task is not None:
+        llm_warmup_task.cancel()
+    llm_client.shutdown()
+
+@app.get("/imap_pool_stats")
+def imap_pool_stats():
+    return imap_pool.stats()
+
+@app.get("/llm_cache_stats")
+def llm_cache_stats():
+    return llm_cache.stats()
+
+@app.get("/llm_stats")
+def llm_stats():
+    return llm_client.stats()
+
+@app.get("/provider_stats")
+def provider_stats():
+    return {"imap": imap_provider_limits.stats(), "smtp": smtp_provider_limits.stats()}
+
+@app.get("/idle_stats")
+def idle_stats():
+    """Per-mailbox state of the IMAP IDLE watchers (IMAP_IDLE_ENABLED): pushes, batches, reconnects."""
+    return idle_watcher.stats()
+
+@app.get("/limiter_stats")
+def limiter_stats():
+    """Token buckets and adaptive concurrency limits of each external dependency (tools/rate_limit.py)."""
+    return {"imap": imap_limiter.stats(), "llm": llm_client.limiter.stats(), "smtp": smtp_limiter.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of the node, LLM, IMAP and SMTP latency histograms and counters."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/list_tools")
 def list_tools():
@@ -62,39 +175,82 @@ class CallToolRequest(BaseModel):
     name: str
     arguments: Dict[str, Any]
 
+async def run_email_workflow_tool(arguments: Dict[str, Any], progress: Optional[Callable[[Dict], None]] = None) -> Dict[str, Any]:
+    max_emails = arguments.get("max_emails", 10)
+    tone = arguments.get("tone", "polite")
+    schedule_time = arguments.get("schedule_time")
+    incremental = arguments.get("incremental", IMAP_INCREMENTAL_SYNC)
+    return await run_mailboxes_workflow(
+        select_mailboxes(arguments.get("accounts"), arguments.get("folders")),
+        send_time=schedule_time,
+        tone=tone,
+        max_emails=max_emails,
+        incremental=incremental,
+        progress=progress
+    )
+
+def format_workflow_result(result: Dict[str, Any]) -> str:
+    result_text = "📧 Email Automation Workflow Results\n"
+    result_text += "=" * 50 + "\n\n"
+    mailboxes = result["mailboxes"]
+    several = len(mailboxes) > 1
+    if several or any(outcome["status"] != "ok" for outcome in mailboxes):
+        for outcome in mailboxes:
+            result_text += (f"📬 {outcome['account']}/{outcome['mailbox']}: {outcome['status']}, "
+                            f"{outcome['emails']} email(s) in {outcome['seconds']}s")
+            result_text += f" ({outcome['error']})\n" if "error" in outcome else "\n"
+        result_text += "\n"
+    for email in result["emails"]:
+        if several:
+            result_text += f"📬 Mailbox: {email.account}/{email.mailbox}\n"
+        result_text += f"📨 From: {email.sender}\n"
+        result_text += f"📝 Subject: {email.subject}\n"
+        result_text += f"🏷️  Category: {email.category or 'unknown'}\n"
+        result_text += f"🔀 Action: {email.action or 'draft'}\n"
+        result_text += f"📅 Scheduled: {bool(email.scheduled)}\n"
+        result_text += f"✍️  Draft: {(email.draft or 'No draft')[:200]}...\n"
+        result_text += "-" * 50 + "\n\n"
+    return result_text
+
+def format_trace(trace: Trace) -> str:
+    # Identical calls that joined a running execution (WORKFLOW_SINGLE_FLIGHT) have no spans of their own.
+    return dumps({"trace": {"summary": trace.summary(), "spans": trace.spans}}).decode()
+
+def submit_workflow_job(req: "CallToolRequest"):
+    return job_manager.submit(req.name, req.arguments, lambda progress: run_email_workflow_tool(req.arguments, progress))
+
+def format_sse(event_id, event_type: str, data: Dict) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {dumps(data).decode()}\n\n"
+
+def tool_result(job) -> Dict:
+    return CallToolResult(content=[TextContent(type="text", text=format_workflow_result(job.result))]).dict()
+
+async def stream_tool_call(job):
+    """SSE body for call_tool with stream=true: the job's events as they happen, then a "result" event."""
+    async for event in job.stream():
+        yield format_sse(event["id"], event["type"], event)
+    if job.status == "succeeded":
+        yield format_sse("result", "result", tool_result(job))
+
 @app.post("/call_tool")
 async def call_tool(req: CallToolRequest):
     if req.name == "run_email_automation_workflow":
         try:
-            max_emails = req.arguments.get("max_emails", 10)
-            tone = req.arguments.get("tone", "polite")
-            schedule_time = req.arguments.get("schedule_time")
-            # Debug prints for config values
-            print("IMAP:", EMAIL_IMAP_SERVER)
-            print("SMTP:", EMAIL_SMTP_SERVER)
-            print("EMAIL:", EMAIL_ADDRESS)
-            print("PASSWORD:", EMAIL_PASSWORD)
-            result = await run_workflow(
-                imap_server=EMAIL_IMAP_SERVER,
-                smtp_server=EMAIL_SMTP_SERVER,
-                email=EMAIL_ADDRESS,
-                password=EMAIL_PASSWORD,
-                send_time=schedule_time,
-                tone=tone,
-                max_emails=max_emails
-            )
-            result_text = "📧 Email Automation Workflow Results\n"
-            result_text += "=" * 50 + "\n\n"
-            for email in result:
-                result_text += f"📨 From: {email.get('from', 'Unknown')}\n"
-                result_text += f"📝 Subject: {email.get('subject', 'No subject')}\n"
-                result_text += f"🏷️  Category: {email.get('category', 'unknown')}\n"
-                result_text += f"📅 Scheduled: {email.get('scheduled', False)}\n"
-                result_text += f"✍️  Draft: {email.get('draft', 'No draft')[:200]}...\n"
-                result_text += "-" * 50 + "\n\n"
-            return CallToolResult(
-                content=[TextContent(type="text", text=result_text)]
-            ).dict()
+            if req.arguments.get("stream", False):
+                job = submit_workflow_job(req)
+                return StreamingResponse(stream_tool_call(job), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+            if req.arguments.get("background", False):
+                job = submit_workflow_job(req)
+                return CallToolResult(
+                    content=[TextContent(type="text", text=f"🕒 Workflow job {job.id} queued. Follow it at /jobs/{job.id}/events, fetch the result from /jobs/{job.id}/result")]
+                ).dict()
+            trace = Trace() if req.arguments.get("trace", False) else None
+            with tracing(trace):
+                result = await run_email_workflow_tool(req.arguments)
+            content = [TextContent(type="text", text=format_workflow_result(result))]
+            if trace is not None:
+                content.append(TextContent(type="text", text=format_trace(trace)))
+            return CallToolResult(content=content).dict()
         except Exception as e:
             return CallToolResult(
                 content=[TextContent(type="text", text=f"❌ Workflow Error: {str(e)}")]
@@ -102,4 +258,58 @@ async def call_tool(req: CallToolRequest):
     else:
         return CallToolResult(
             content=[TextContent(type="text", text=f"❌ Unknown tool: {req.name}")]
-        ).dict() 
\ No newline at end of file
+        ).dict()
+
+# --- Background jobs ---
+def get_job_or_404(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def submit_job(req: CallToolRequest):
+    if req.name != "run_email_automation_workflow":
+        raise HTTPException(status_code=404, detail=f"Unknown tool: {req.name}")
+    return submit_workflow_job(req).info()
+
+@app.get("/jobs")
+def list_jobs():
+    return {"stats": job_manager.stats(), "jobs": [job.info() for job in job_manager.jobs.values()]}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return get_job_or_404(job_id).info()
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    if job.status == "succeeded":
+        return {**job.info(), "emails": as_dict(job.result["emails"]), "mailboxes": job.result["mailboxes"],
+                "result": tool_result(job)}
+    if job.finished:
+        return job.info()
+    raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}")
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, after: int = -1):
+    """
+    Server-sent events until the job ends: status changes, one event per email per finished stage,
+    a "mailbox" event as each account/folder finishes and, with DRAFT_STREAMING, "draft" events
+    carrying each reply as it is generated.
+    """
+    job = get_job_or_404(job_id)
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id is not None and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+
+    async def event_stream():
+        async for event in job.stream(after):
+            yield format_sse(event["id"], event["type"], event)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    get_job_or_404(job_id)
+    return (await job_manager.cancel(job_id)).info()
@@ -0,0 +1,89 @@
+"""
+Mail accounts a workflow run can cover.
+
+EMAIL_ACCOUNTS_FILE lists them as JSON objects; fields an entry leaves out fall back to the EMAIL_*
+settings, so a file of shared mailboxes on one provider only needs "email" and "password" per entry.
+Without the file, the single EMAIL_ADDRESS account is the only one, as before.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+from config import (EMAIL_ACCOUNTS_FILE, EMAIL_ADDRESS, EMAIL_FOLDERS, EMAIL_IMAP_SERVER, EMAIL_PASSWORD,
+                    EMAIL_SMTP_SERVER)
+
+
+@dataclass(slots=True)
+class Account:
+    email: str
+    password: Optional[str]
+    imap_server: Optional[str]
+    smtp_server: Optional[str]
+    folders: Tuple[str, ...]
+
+
+def load_accounts(path: Optional[str] = EMAIL_ACCOUNTS_FILE) -> List[Account]:
+    if not path:
+        return [Account(EMAIL_ADDRESS, EMAIL_PASSWORD, EMAIL_IMAP_SERVER, EMAIL_SMTP_SERVER, tuple(EMAIL_FOLDERS))]
+    with open(path, "r") as f:
+        entries = json.load(f)
+    return [
+        Account(
+            email=entry["email"],
+            password=entry.get("password", EMAIL_PASSWORD),
+            imap_server=entry.get("imap_server", EMAIL_IMAP_SERVER),
+            smtp_server=entry.get("smtp_server", EMAIL_SMTP_SERVER),
+            folders=tuple(entry.get("folders") or EMAIL_FOLDERS),
+        )
+        for entry in entries
+    ]
+
+
+_accounts: Optional[List[Account]] = None
+
+
+def get_accounts() -> List[Account]:
+    """The configured accounts, read once per process; the first is the default account."""
+    global _accounts
+    if _accounts is None:
+        _accounts = load_accounts()
+    return _accounts
+
+
+def find_account(address: Optional[str], accounts: Optional[List[Account]] = None) -> Optional[Account]:
+    if not address:
+        return None
+    address = address.lower()
+    return next((account for account in accounts or get_accounts() if account.email and account.email.lower() == address), None)
+
+
+def select_mailboxes(addresses: Optional[Iterable[str]] = None, folders: Optional[Iterable[str]] = None,
+                     accounts: Optional[List[Account]] = None) -> List[Tuple[Account, str]]:
+    """
+    The (account, folder) pairs a run covers: the given account addresses (default: every configured
+    account), each with the given folders (default: the account's own). Raises ValueError for an
+    address that is not configured, since its password is not known.
+    """
+    accounts = accounts or get_accounts()
+    if addresses:
+        selected = []
+        for address in addresses:
+            account = find_account(address, accounts)
+            if account is None:
+                raise ValueError(f"Unknown account: {address}")
+            selected.append(account)
+    else:
+        selected = accounts
+    mailboxes = []
+    for account in selected:
+        for folder in folders or account.folders:
+            if (account, folder) not in mailboxes:
+                mailboxes.append((account, folder))
+    return mailboxes
+
+
+def set_accounts(accounts: Optional[List[Account]]):
+    """Replaces the configured accounts (None re-reads EMAIL_ACCOUNTS_FILE on next use)."""
+    global _accounts
+    _accounts = accounts
@@ -0,0 +1,57 @@
+"""
+A Bloom filter: set membership in a fixed bit array, with no false negatives and about error_rate
+false positives while it holds at most capacity keys. Used in front of the outbox dedup index, so a
+new email (the common case) is ruled out without touching the database.
+"""
+
+import hashlib
+import math
+import threading
+from typing import Dict, Iterable
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Two 64-bit halves of one digest, combined as h1 + i * h2 (Kirsch-Mitzenmacher double hashing).
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        size = self.size
+        position = int.from_bytes(digest[:8], "little") % size
+        step = int.from_bytes(digest[8:], "little") % size or 1
+        for _ in range(self.hashes):
+            yield position
+            position = (position + step) % size
+
+    def add(self, key: str):
+        self.update((key,))
+
+    def update(self, keys: Iterable[str]):
+        bits = self._bits
+        # Setting a bit is a read-modify-write of its byte: concurrent adds must not lose each other's bits.
+        with self._lock:
+            for key in keys:
+                for position in self._positions(key):
+                    bits[position >> 3] |= 1 << (position & 7)
+                self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        # A key that was never added usually fails on its first probe or two.
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def stats(self) -> Dict:
+        # Past capacity the false-positive rate climbs; it is estimated from the keys actually added.
+        estimated = (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+        return {"keys": self.count, "capacity": self.capacity, "bytes": len(self._bits), "hashes": self.hashes,
+                "false_positive_rate": round(estimated, 6)}
@@ -1,36 +1,151 @@
-from typing import List, Dict
-from langchain_ollama.llms import OllamaLLM
-import asyncio
+from typing import List, Optional
+import json
+import re
+import time
 
-# Initialize Ollama LLM (assumes Ollama is running locally)
-llm = OllamaLLM(model="llama3.2")  # You can change the model name if needed
+from config import CATEGORIZE_BATCH_MODE, CATEGORIZE_BATCH_TOKEN_BUDGET, BULK_HEADER_RULES
+from tools.llm_cache import llm_cache
+from tools.llm_client import llm_client
+from tools.metrics import estimate_tokens, run_stats
+from tools.records import EmailRecord
 
-async def categorize_emails(emails: List[Dict]) -> List[Dict]:
+CATEGORIES = ["urgent", "newsletter", "normal", "spam", "social", "promotion"]
+
+# Bump when the classification prompts change so cached labels from the old prompts are not reused
+PROMPT_VERSION = "categorize-v2"
+
+# Rendered once at import; each call only fills in the email.
+SINGLE_PROMPT = (
+    f"Classify this email as one of: {', '.join(CATEGORIES)}. Answer with the category only.\n"
+    "Subject: {subject}\n"
+    "Body: {body}"
+)
+BATCH_PROMPT_HEADER = (
+    f"Classify each email below as one of: {', '.join(CATEGORIES)}.\n"
+    f"Answer with a JSON array of category names, one per email, in order.\n"
+)
+
+def format_batch_item(number: int, mail: EmailRecord) -> str:
+    subject = mail.get('subject', '')
+    snippet = mail.get('snippet', '').replace('\n', ' ')
+    return f"[{number}] Subject: {subject}\nBody: {snippet}\n"
+
+def cache_key(mail: EmailRecord) -> str:
+    return llm_cache.make_key(llm_client.model_name, PROMPT_VERSION, "", mail.get('subject', ''), mail.get('snippet', ''))
+
+def make_batches(emails: List[EmailRecord], token_budget: int) -> List[List[int]]:
+    """
+    Groups email indexes into batches whose rendered prompt (and expected answer) fits token_budget.
+    Every batch holds at least one email, even if that single email is over budget.
+    """
+    batches = []
+    current: List[int] = []
+    used = estimate_tokens(BATCH_PROMPT_HEADER)
+    for index, mail in enumerate(emails):
+        # item text plus roughly four tokens for its label in the JSON answer
+        cost = estimate_tokens(format_batch_item(len(current) + 1, mail)) + 4
+        if current and used + cost > token_budget:
+            batches.append(current)
+            current = []
+            used = estimate_tokens(BATCH_PROMPT_HEADER)
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_prompt(emails: List[EmailRecord]) -> str:
+    items = "\n".join(format_batch_item(number, mail) for number, mail in enumerate(emails, 1))
+    return f"{BATCH_PROMPT_HEADER}\n{items}\nJSON array of {len(emails)} categories:"
+
+def parse_batch_labels(response: str, expected: int) -> List[Optional[str]]:
+    """
+    Pulls the JSON array out of a batch response.
+    Returns one label per email; None marks entries that are missing (truncated) or not a known category.
+    """
+    labels: List[Optional[str]] = [None] * expected
+    start = response.find('[')
+    if start < 0:
+        return labels
+    match = re.search(r'\[.*\]', response[start:], re.DOTALL)
+    try:
+        parsed = json.loads(match.group(0)) if match else None
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, list):
+        # Truncated or otherwise broken array: salvage the complete quoted labels before the break.
+        parsed = re.findall(r'"([^"\\]*)"', response[start:])
+    for index, label in enumerate(parsed[:expected]):
+        if isinstance(label, str) and label.strip().lower() in CATEGORIES:
+            labels[index] = label.strip().lower()
+    return labels
+
+async def categorize_one(mail: EmailRecord):
+    prompt = SINGLE_PROMPT.format(subject=mail.get('subject', ''), body=mail.get('snippet', ''))
+    try:
+        category = await llm_client.ainvoke(prompt, "categorize")
+        mail['category'] = category.strip().lower()
+        llm_cache.put(cache_key(mail), mail['category'])
+    except Exception as e:
+        mail['category'] = f"[LLM Error: {e}]"
+
+async def categorize_emails(emails: List[EmailRecord], batch: bool = CATEGORIZE_BATCH_MODE, token_budget: int = CATEGORIZE_BATCH_TOKEN_BUDGET) -> List[EmailRecord]:
     """
     Categorizes emails by priority or topic using Ollama LLM.
     Adds a 'category' field: e.g., 'urgent', 'newsletter', 'normal', etc.
+    With batch=True, emails are packed into prompts of up to token_budget tokens and classified
+    with one LLM call per batch; malformed or truncated answers fall back to per-email calls.
+    Emails already classified with the same model and prompt version are served from llm_cache,
+    and with BULK_HEADER_RULES, mail whose headers mark it as bulk (read_mail.bulk_category) skips the LLM.
+    Counts and throughput are added to the run's "categorize" stats (see metrics.run_stats).
     """
+    start = time.perf_counter()
+    llm_calls = 0
+    fallbacks = 0
+    rule_hits = 0
+    uncached = []
     for mail in emails:
-        subject = mail.get('subject', '')
-        snippet = mail.get('snippet', '')
-        prompt = (
-            f"Classify the following email into one of these categories: urgent, newsletter, normal, spam, social, promotion.\n"
-            f"Subject: {subject}\n"
-            f"Body: {snippet}\n"
-            f"Return only the category name."
-        )
-        try:
-            loop = asyncio.get_event_loop()
-            category = await loop.run_in_executor(None, lambda: llm.invoke(prompt))
-            mail['category'] = category.strip().lower()
-        except Exception as e:
-            mail['category'] = f"[LLM Error: {e}]"
-    return emails
+        if BULK_HEADER_RULES and mail.get('rule_category'):
+            mail['category'] = mail['rule_category']
+            rule_hits += 1
+            continue
+        category = llm_cache.get(cache_key(mail))
+        if category is None:
+            uncached.append(mail)
+        else:
+            mail['category'] = category
+    if not batch:
+        for mail in uncached:
+            await categorize_one(mail)
+            llm_calls += 1
+    else:
+        for indexes in make_batches(uncached, token_budget):
+            group = [uncached[i] for i in indexes]
+            prompt = build_batch_prompt(group)
+            try:
+                response = await llm_client.ainvoke(prompt, "categorize_batch")
+                labels = parse_batch_labels(response, len(group))
+            except Exception:
+                labels = [None] * len(group)
+            llm_calls += 1
+            for mail, label in zip(group, labels):
+                if label is None:
+                    await categorize_one(mail)
+                    llm_calls += 1
+                    fallbacks += 1
+                else:
+                    mail['category'] = label
+                    llm_cache.put(cache_key(mail), label)
 
-async def categorize_emails_ai(emails: List[Dict]) -> List[Dict]:
-    """
-    Categorizes emails by priority or topic using AI (LangChain/LLM).
-    Returns a list of emails with added 'category' field.
-    """
-    # TODO: Implement categorization logic
-    return emails 
\ No newline at end of file
+    elapsed = time.perf_counter() - start
+    cache_hits = len(emails) - len(uncached) - rule_hits
+    stats = run_stats("categorize", emails=len(emails), rule_hits=rule_hits, cache_hits=cache_hits,
+                      llm_calls=llm_calls, fallbacks=fallbacks, seconds=elapsed)
+    stats["mode"] = "batch" if batch else "per_item"
+    stats["seconds"] = round(stats["seconds"], 4)
+    stats["emails_per_second"] = round(stats["emails"] / stats["seconds"], 2) if stats["seconds"] > 0 else 0.0
+    stats["llm_calls_per_email"] = round(stats["llm_calls"] / stats["emails"], 3) if stats["emails"] else 0.0
+    # The run's totals so far: the pipeline categorizes a run's mail a group at a time.
+    print(f"[CATEGORIZE] {stats['mode']}: {stats['emails']} emails ({stats['rule_hits']} by header rules, {stats['cache_hits']} cached), "
+          f"{stats['llm_calls']} LLM calls, {stats['emails_per_second']} emails/s, {stats['llm_calls_per_email']} calls/email")
+    return emails
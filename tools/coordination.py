@@ -0,0 +1,184 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from config import IMAP_PROVIDER_MAX_CONNECTIONS, SMTP_PROVIDER_MAX_CONNECTIONS
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "listeners")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.listeners: List[Callable[[Dict], None]] = []
+
+    def broadcast(self, event: Dict):
+        for listener in list(self.listeners):
+            listener(event)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution whose result every caller receives.
+
+    The first caller starts fn(broadcast); callers arriving while it is still running wait for the same
+    task instead of starting another. Each caller may pass a listener that receives the broadcast events
+    emitted from the moment it joined. The execution is cancelled only if every waiting caller is cancelled.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.executions = 0
+        self.shared = 0
+
+    def _bind_loop(self):
+        # In-flight tasks belong to one event loop; asyncio.run() in scripts creates a new one each time.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._flights = {}
+            self._loop = loop
+
+    async def do(self, key: Hashable, fn: Callable[[Callable[[Dict], None]], Awaitable],
+                 listener: Optional[Callable[[Dict], None]] = None):
+        self._bind_loop()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(fn(flight.broadcast))
+            flight.task.add_done_callback(lambda _: self._flights.pop(key, None) if self._flights.get(key) is flight else None)
+            self.executions += 1
+        else:
+            self.shared += 1
+        if listener is not None:
+            flight.listeners.append(listener)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+            if listener is not None:
+                flight.listeners.remove(listener)
+
+    def stats(self) -> Dict:
+        return {"executions": self.executions, "shared": self.shared, "in_flight": len(self._flights)}
+
+
+class MailboxLocks:
+    """One asyncio.Lock per (purpose, server, account, mailbox), created on first use."""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self, purpose: str, imap_server: str, email_address: str, mailbox: str = 'Inbox') -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._locks = {}
+            self._loop = loop
+        return self._locks.setdefault((purpose, imap_server, email_address, mailbox.upper()), asyncio.Lock())
+
+
+def server_host(server: str) -> str:
+    """The host of an IMAP/SMTP server setting ("imaps://host:993", "smtp://host:25" or a bare host)."""
+    _, _, rest = server.rpartition("://")
+    return rest.partition(":")[0].lower()
+
+
+class ProviderLimits:
+    """
+    Caps connections open at once to each server host, shared by every account on that host
+    (mailboxes on one provider count against the same cap). max_connections=0 counts without capping.
+    Pools that keep idle connections open register with add_idle_pool(): when a host is at its cap,
+    they are asked to close an idle connection to it before anyone waits for a slot, and should close
+    rather than idle a connection to a host someone is waiting for (waiting()).
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._in_use: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle_pools: "weakref.WeakSet" = weakref.WeakSet()
+        self.max_in_use: Dict[str, int] = {}
+        self.waits = 0
+        self.reclaimed = 0
+
+    def _bind_loop(self):
+        # Semaphores belong to one event loop; asyncio.run() in scripts creates a new one each time.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._limits = {}
+            self._in_use = {}
+            self._waiting = {}
+            self._loop = loop
+
+    def add_idle_pool(self, pool):
+        """Registers a pool with an async reclaim_idle(host) -> bool that closes one of its idle connections."""
+        self._idle_pools.add(pool)
+
+    async def acquire(self, server: str) -> Callable[[], None]:
+        """
+        Takes one of server's connection slots, waiting for one if needed, and returns the function that
+        gives it back. For connections that outlive a block, e.g. pooled sessions; otherwise use connection().
+        """
+        self._bind_loop()
+        host = server_host(server)
+        limit = None
+        if self.max_connections > 0:
+            limit = self._limits.setdefault(host, asyncio.Semaphore(self.max_connections))
+            if limit.locked():
+                for pool in list(self._idle_pools):
+                    if await pool.reclaim_idle(host):
+                        self.reclaimed += 1
+                        break
+            if limit.locked():
+                self.waits += 1
+            waiting = self._waiting
+            waiting[host] = waiting.get(host, 0) + 1
+            try:
+                await limit.acquire()
+            finally:
+                waiting[host] -= 1
+        # The counts of the loop the slot was taken on, should a new loop replace them before release.
+        in_use = self._in_use
+        in_use[host] = in_use.get(host, 0) + 1
+        self.max_in_use[host] = max(self.max_in_use.get(host, 0), in_use[host])
+
+        def release():
+            in_use[host] -= 1
+            if limit is not None:
+                limit.release()
+        return release
+
+    def waiting(self, server: str) -> int:
+        """How many connections to server's host are waiting for a slot."""
+        return self._waiting.get(server_host(server), 0) if self._loop is asyncio.get_running_loop() else 0
+
+    @asynccontextmanager
+    async def connection(self, server: str):
+        """Holds one of server's connection slots for the duration of the block, waiting for one if needed."""
+        release = await self.acquire(server)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> Dict:
+        return {"max_connections": self.max_connections, "waits": self.waits, "reclaimed": self.reclaimed,
+                "in_use": dict(self._in_use), "max_in_use": dict(self.max_in_use)}
+
+
+# Shared by every run_workflow call in the process
+workflow_flights = SingleFlight()
+mailbox_locks = MailboxLocks()
+# IMAP reads run on the server's loop and SMTP sends on the scheduler thread's, so each has its own.
+imap_provider_limits = ProviderLimits(IMAP_PROVIDER_MAX_CONNECTIONS)
+smtp_provider_limits = ProviderLimits(SMTP_PROVIDER_MAX_CONNECTIONS)
@@ -1,10 +1,38 @@
-from typing import Dict
-from langchain_ollama.llms import OllamaLLM
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from contextlib import aclosing
 import asyncio
 import re
+import time
 
-# Initialize Ollama LLM (assumes Ollama is running locally)
-llm = OllamaLLM(model="llama3.2")  # You can change the model name if needed
+from config import DRAFT_STREAMING, DRAFT_MAX_CHARS, MAIL_INDEX_ENABLED
+from tools.llm_cache import llm_cache
+from tools.llm_client import llm_client
+from tools.metrics import DRAFT_EARLY_STOPS, DRAFT_TOKENS, METRICS_ENABLED, run_stats
+from tools.records import EmailRecord
+
+# Called with (draft so far, done) while a reply streams in; done=True carries the final draft.
+PartialCallback = Callable[[str, bool], None]
+
+# Partial drafts are forwarded at most this often, so a 300-token reply is a handful of events, not 300.
+PARTIAL_INTERVAL_SECONDS = 0.1
+
+# Bump when the draft prompt changes so cached drafts from the old prompt are not reused
+PROMPT_VERSION = "draft-v2"
+
+def draft_template(tone: str = "polite") -> str:
+    """
+    The draft prompt for tone, with {name}, {sender}, {subject}, {body} and {context} left to fill in per email.
+    Rendered once per run (see draft_email_responses) rather than rebuilt for every reply.
+    """
+    tone = tone.replace('{', '{{').replace('}', '}}')
+    return (
+        f"Draft a {tone} reply to this email. Start the reply with 'Dear {{name}},' and end it with "
+        f"'Best regards,' and 'Sridhar Prajwal'; no placeholders such as [Your Name].\n"
+        "From: {sender}\n"
+        "Subject: {subject}\n"
+        "Body: {body}\n"
+        "{context}"
+    )
 
 def extract_sender_name(sender: str) -> str:
     """
@@ -34,10 +62,76 @@ def extract_sender_name(sender: str) -> str:
     # If it's a single word, use it as is
     return sender_clean
 
-async def draft_email_response(email: Dict, tone: str = "polite") -> str:
+def partial_draft_event(index: int, mail: EmailRecord, text: str, done: bool) -> Dict:
+    """The progress event for a growing draft; index is the email's position in the run, like "email" events."""
+    return {"type": "draft", "index": index, "message_id": mail.get('message_id'), "draft": text, "done": done}
+
+def trim_draft(text: str, max_chars: int) -> str:
+    """Cuts text to max_chars, backing up to the last sentence or line end when one is in the second half."""
+    text = text[:max_chars]
+    end = max(text.rfind(mark) for mark in (".", "!", "?", "\n"))
+    if end >= max_chars // 2:
+        return text[:end + 1].rstrip()
+    return text.rsplit(" ", 1)[0] if " " in text else text
+
+async def stream_draft(prompt: str, max_chars: int = DRAFT_MAX_CHARS, on_partial: Optional[PartialCallback] = None,
+                       timeout: Optional[float] = None) -> str:
+    """
+    Generates a draft token by token, calling on_partial with the text so far every
+    PARTIAL_INTERVAL_SECONDS, and stops the generation once the draft reaches max_chars (0 = no limit).
+    timeout bounds the model call once it has an LLM slot (see LLMClient.astream).
+    """
+    parts: List[str] = []
+    length = 0
+    tokens = 0
+    stopped = False
+    last_partial = 0.0  # the first token is forwarded right away
+    async with aclosing(llm_client.astream(prompt, "draft", timeout)) as stream:
+        async for chunk in stream:
+            parts.append(chunk)
+            length += len(chunk)
+            tokens += 1
+            if max_chars and length >= max_chars:
+                stopped = True
+                break
+            if on_partial is not None and time.monotonic() - last_partial >= PARTIAL_INTERVAL_SECONDS:
+                on_partial("".join(parts), False)
+                last_partial = time.monotonic()
+    draft = "".join(parts)
+    if stopped:
+        draft = trim_draft(draft, max_chars)
+    if METRICS_ENABLED:
+        DRAFT_TOKENS.observe(tokens)
+        if stopped:
+            DRAFT_EARLY_STOPS.inc()
+    return draft
+
+async def related_context(email: EmailRecord) -> str:
+    """
+    Prompt lines about related earlier mail and replies from the context index (tools/mail_index.py),
+    or "" when there are none. The lookup runs in a thread: at a million messages it scans 1 GB of vectors.
+    """
+    # Imported here so NumPy is only loaded when the index is on.
+    from tools.mail_index import get_mail_index
+    try:
+        return await asyncio.to_thread(get_mail_index().context_for, email)
+    except Exception as e:
+        print(f"[INDEX] Context lookup failed: {e}")
+        return ""
+
+async def draft_email_response(email: EmailRecord, tone: str = "polite", on_partial: Optional[PartialCallback] = None,
+                               streaming: bool = DRAFT_STREAMING, max_chars: int = DRAFT_MAX_CHARS,
+                               template: Optional[str] = None, timeout: Optional[float] = None) -> Optional[str]:
     """
     Drafts a response to the given email using Ollama LLM, with optional tone adjustment.
-    Returns the draft email body as a string.
+    Returns the draft email body as a string, or None when the LLM call failed: an error is never a reply.
+    Failures are logged and counted in the run's "drafting" stats (see metrics.run_stats).
+    With streaming, the reply is read as it is generated (see stream_draft): on_partial sees it grow
+    and generation stops at max_chars. on_partial is always called once with the final draft (None if it failed).
+    With MAIL_INDEX_ENABLED the prompt also gets related earlier messages (see related_context).
+    template is draft_template(tone), for callers drafting many replies in the same tone.
+    A model call that takes longer than timeout seconds once it has an LLM slot (None: no limit)
+    fails like any other LLM error.
     """
     sender = email.get('from', 'Sender')
     subject = email.get('subject', 'your email')
@@ -45,19 +139,64 @@ async def draft_email_response(email: Dict, tone: str = "polite") -> str:
     
     # Extract the sender's name
     sender_name = extract_sender_name(sender)
+    context = await related_context(email) if MAIL_INDEX_ENABLED else ""
     
-    prompt = (
-        f"Draft a {tone} reply to the following email. Use the sender's actual name '{sender_name}' in the greeting instead of generic placeholders like [Your Name] or [Sender's Name].\n"
-        f"From: {sender}\n"
-        f"Subject: {subject}\n"
-        f"Body: {snippet}\n"
-        f"Important: Start the reply with 'Dear {sender_name},' and end with 'Best regards,' followed by 'Sridhar Prajwal' (not [Your Name])."
-    )
+    prompt = (template or draft_template(tone)).format(
+        name=sender_name, sender=sender, subject=subject, body=snippet,
+        context=f"Related earlier messages (for context only; do not quote them):\n{context}\n" if context else "")
+    # The sender is part of the key as well: the greeting is personalised with their name.
+    # A length limit changes the draft, so streamed drafts cut at max_chars are cached under their own key.
+    limit = (max_chars,) if streaming and max_chars else ()
+    # So does the retrieved context; without any, the key (and cached drafts) stay as before.
+    extra = limit + ((context,) if context else ())
+    key = llm_cache.make_key(llm_client.model_name, PROMPT_VERSION, tone, subject, snippet, sender, *extra)
+    response = llm_cache.get(key)
+    if response is None:
+        try:
+            # The shared client uses Ollama's async API, so in-flight drafts do not each hold a thread
+            if streaming:
+                response = await stream_draft(prompt, max_chars, on_partial, timeout)
+            else:
+                response = await llm_client.ainvoke(prompt, "draft", timeout)
+            llm_cache.put(key, response)
+        except Exception as e:
+            error = f"timed out after {timeout}s" if isinstance(e, asyncio.TimeoutError) else e
+            print(f"[DRAFT] No reply drafted for '{subject}': {error}")
+            run_stats("drafting", failed=1)
+    run_stats("drafting", drafted=int(response is not None))
+    if on_partial is not None:
+        on_partial(response, True)
+    return response
+
+async def draft_with_timeout(email: EmailRecord, tone: str = "polite", timeout: float = 120,
+                             on_partial: Optional[PartialCallback] = None, template: Optional[str] = None) -> Optional[str]:
+    """
+    draft_email_response with a deadline on the model call; waiting for an LLM slot (the limiter's
+    concurrency limit and token bucket) does not count, so a busy limiter does not time drafts out.
+    """
+    return await draft_email_response(email, tone, on_partial, template=template, timeout=timeout)
+
+async def draft_email_responses(emails: List[EmailRecord], tone: str = "polite", max_concurrency: int = 4, timeout: float = 120,
+                                on_partial: Optional[Callable[[int, str, bool], None]] = None) -> AsyncIterator[Tuple[int, Optional[str]]]:
+    """
+    Drafts replies for many emails with at most max_concurrency LLM calls in flight.
+    Yields (index, draft) pairs in completion order; index refers to the position in emails, and draft
+    is None when drafting failed.
+    Each draft is bounded by timeout seconds (see draft_with_timeout).
+    on_partial, if given, is called with (index, draft so far, done) as streamed drafts grow.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    template = draft_template(tone)
+
+    async def draft_one(index: int, mail: EmailRecord) -> Tuple[int, Optional[str]]:
+        partial = (lambda text, done: on_partial(index, text, done)) if on_partial is not None else None
+        async with semaphore:
+            return index, await draft_with_timeout(mail, tone, timeout, partial, template)
+
+    tasks = [asyncio.ensure_future(draft_one(index, mail)) for index, mail in enumerate(emails)]
     try:
-        # OllamaLLM is synchronous, so run in a thread executor for async compatibility
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(None, lambda: llm.invoke(prompt))
-        return response
-    except Exception as e:
-        return f"[LLM Error: {e}]"
-    # TODO: Integrate LangChain/LLM for smarter, context-aware drafting 
\ No newline at end of file
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
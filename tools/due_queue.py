@@ -0,0 +1,85 @@
+import heapq
+import threading
+import time
+from typing import Callable, List, Optional
+
+from tools.outbox import OutboxBackend, get_outbox
+
+# Delay before retrying messages that were still due after a send pass (e.g. SMTP failures).
+RETRY_SECONDS = 60
+# Upper bound on any single sleep, so messages added by another process are eventually noticed.
+RESYNC_SECONDS = 300
+
+
+class DueQueueScheduler:
+    """
+    Runs process() exactly when the next scheduled message becomes due instead of polling.
+
+    Send times live in a min-heap. The thread sleeps until the earliest one, and
+    notify() wakes it early when a message is scheduled sooner than anything queued.
+    Each wake-up calls process(), which claims only due records through the outbox index.
+    The heap holds only timestamps: the outbox stays the source of truth for what is due.
+    """
+
+    def __init__(self, process: Callable[[], None], outbox: Optional[OutboxBackend] = None):
+        self.process = process
+        self.outbox = outbox
+        self.wakeups = 0
+        self._heap: List[float] = []
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _outbox(self) -> OutboxBackend:
+        return self.outbox or get_outbox()
+
+    def notify(self, scheduled_ts: float):
+        """Called when a message is scheduled for scheduled_ts (epoch seconds)."""
+        with self._condition:
+            earliest = self._heap[0] if self._heap else None
+            heapq.heappush(self._heap, scheduled_ts)
+            if earliest is None or scheduled_ts < earliest:
+                self._condition.notify()
+
+    def _resync(self, after_send_pass: bool = False):
+        next_ts = self._outbox().next_due_time()
+        if next_ts is None:
+            return
+        now = time.time()
+        if after_send_pass and next_ts <= now:
+            # Still due right after a send pass means the send failed; retry later rather than spin.
+            next_ts = now + RETRY_SECONDS
+        self.notify(next_ts)
+
+    def _run(self):
+        self._resync()
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                now = time.time()
+                if not self._heap or self._heap[0] > now:
+                    timeout = min(self._heap[0] - now, RESYNC_SECONDS) if self._heap else RESYNC_SECONDS
+                    if not self._condition.wait(timeout) and timeout >= RESYNC_SECONDS:
+                        self._resync()
+                    continue
+                while self._heap and self._heap[0] <= now:
+                    heapq.heappop(self._heap)
+            self.wakeups += 1
+            try:
+                self.process()
+            except Exception as e:
+                print(f"[SCHEDULER] Send pass failed: {e}")
+            self._resync(after_send_pass=True)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="mail-due-queue", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, wait: bool = True):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if wait and self._thread is not None:
+            self._thread.join()
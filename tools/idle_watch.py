@@ -0,0 +1,299 @@
+"""
+IMAP IDLE push mode (IMAP_IDLE_ENABLED): one long-lived IDLE session per configured mailbox, feeding only
+newly arrived mail into the workflow.
+
+Each MailboxWatcher logs in on a connection of its own (it holds one IMAP_PROVIDER_MAX_CONNECTIONS slot for as
+long as it runs), selects its folder and idles. An EXISTS push starts a micro-batch: the watcher keeps idling
+until no more mail has arrived for IMAP_IDLE_DEBOUNCE_SECONDS (or IMAP_IDLE_MAX_DELAY_SECONDS have passed since
+the first push), then leaves IDLE, fetches everything above the mailbox's last seen UID with the same
+incremental sync state as IMAP_INCREMENTAL_SYNC runs, and idles again while the batch is processed.
+
+A dropped connection is retried with exponential backoff. The last UID is saved per mailbox and UIDVALIDITY
+only once its batch has been processed, so mail that arrived while the watcher was away, or that was fetched
+but not yet processed when it stopped, is picked up on reconnect (or restart). A batch that keeps failing is
+retried BATCH_RETRIES times, then the watcher goes back to the last saved UID and fetches it again later.
+A mailbox without saved state starts from the mail arriving after the first connection.
+"""
+
+import asyncio
+import datetime
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aioimaplib
+
+from config import (IMAP_IDLE_DEBOUNCE_SECONDS, IMAP_IDLE_MAX_DELAY_SECONDS, IMAP_IDLE_MAX_BATCH, IMAP_IDLE_SEND_DELAY_SECONDS,
+                    IMAP_IDLE_TONE, IMAP_IDLE_RENEW_SECONDS, IMAP_IDLE_RECONNECT_MAX_SECONDS)
+from tools.accounts import Account, select_mailboxes
+from tools.coordination import imap_provider_limits, mailbox_locks
+from tools.read_mail import (connect_imap, imap_command, index_fetched, load_sync_state, mark_mailbox_seen,
+                             read_new_emails, save_processed_uid, sync_state_key)
+from tools.records import EmailRecord
+
+# While idling with nothing pending, how often to check that the connection is still up: aioimaplib
+# does not wake a pending wait for pushes when the server goes away.
+LIVENESS_CHECK_SECONDS = 5.0
+# New mail fetched per round trip while catching up; a larger backlog takes several.
+CATCH_UP_FETCH = 500
+RECONNECT_MIN_SECONDS = 1.0
+# Attempts after a batch fails, RECONNECT_MIN_SECONDS apart and doubling, before its mail is fetched again.
+BATCH_RETRIES = 3
+
+BatchHandler = Callable[[Account, str, List[EmailRecord]], Awaitable]
+
+
+def is_connected(client: aioimaplib.IMAP4) -> bool:
+    transport = client.protocol.transport if client.protocol is not None else None
+    return transport is not None and not transport.is_closing()
+
+
+class MailboxWatcher:
+    def __init__(self, account: Account, folder: str, on_batch: BatchHandler,
+                 debounce_seconds: float = IMAP_IDLE_DEBOUNCE_SECONDS, max_delay_seconds: float = IMAP_IDLE_MAX_DELAY_SECONDS,
+                 max_batch: int = IMAP_IDLE_MAX_BATCH, renew_seconds: float = IMAP_IDLE_RENEW_SECONDS,
+                 reconnect_max_seconds: float = IMAP_IDLE_RECONNECT_MAX_SECONDS):
+        self.account = account
+        self.folder = folder
+        self.on_batch = on_batch
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_batch = max(1, max_batch)
+        self.renew_seconds = renew_seconds
+        self.reconnect_max_seconds = reconnect_max_seconds
+        self.check_seconds = LIVENESS_CHECK_SECONDS
+        self.sync_key = sync_state_key(account.imap_server, account.email, folder)
+        self._batches: Optional[asyncio.Queue] = None
+        # Fetched and queued up to fetched_uid; processed and saved up to last_uid. A rewind (a batch given up
+        # on) bumps the generation, so a fetch that was in flight meanwhile does not queue past the gap.
+        self.fetched_uid: Optional[int] = None
+        self.uidvalidity: Optional[int] = None
+        self._generation = 0
+        self._rewound = False
+        self.connected = False
+        self.connections = 0
+        self.reconnects = 0
+        self.pushes = 0
+        self.fetches = 0
+        self.emails = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.retried_batches = 0
+        self.last_uid: Optional[int] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.account.email}/{self.folder}"
+
+    async def run(self):
+        """Watches the mailbox until cancelled, reconnecting after any failure."""
+        self._batches = asyncio.Queue()
+        processor = asyncio.ensure_future(self._process())
+        delay = RECONNECT_MIN_SECONDS
+        try:
+            while True:
+                try:
+                    await self._session()
+                except Exception as e:
+                    self.last_error = str(e) or type(e).__name__
+                if self.connected:
+                    # The session got as far as idling: start the backoff over.
+                    delay = RECONNECT_MIN_SECONDS
+                self.connected = False
+                self.reconnects += 1
+                print(f"[IDLE] {self.name}: session ended ({self.last_error}); reconnecting in {delay:g}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max_seconds)
+        finally:
+            processor.cancel()
+
+    async def _session(self):
+        async with imap_provider_limits.connection(self.account.imap_server):
+            client = connect_imap(self.account.imap_server)
+            try:
+                await client.wait_hello_from_server()
+                resp = await imap_command(client.login(self.account.email, self.account.password))
+                if resp.result != 'OK':
+                    raise aioimaplib.Abort(f"login failed for {self.account.email}")
+                self.connections += 1
+                async with mailbox_locks.get("read", self.account.imap_server, self.account.email, self.folder):
+                    self.last_uid = await mark_mailbox_seen(client, self.sync_key, self.folder)
+                uidvalidity = load_sync_state().get(self.sync_key, {}).get('uidvalidity')
+                if uidvalidity != self.uidvalidity or self.fetched_uid is None:
+                    # First session, or the UIDs changed meaning: whatever is still queued cannot be saved.
+                    self._reset(self.last_uid)
+                    self.uidvalidity = uidvalidity
+                # Mail that arrived while disconnected; its UIDs are above the saved state.
+                await self._catch_up(client)
+                self.connected = True
+                self.last_error = None
+                while True:
+                    if await self._idle(client):
+                        await self._catch_up(client)
+            finally:
+                if is_connected(client):
+                    try:
+                        await client.logout()
+                    except Exception:
+                        pass
+
+    async def _idle(self, client: aioimaplib.IMAP4) -> bool:
+        """
+        Idles until a micro-batch of new mail is complete (True) or it is time to renew IDLE (False).
+        Raises Abort if the connection drops meanwhile.
+        """
+        idle = await client.idle_start(timeout=self.renew_seconds)
+        first_push = None
+        last_push = None
+        try:
+            while client.has_pending_idle():
+                if first_push is None:
+                    timeout = self.check_seconds
+                else:
+                    now = time.monotonic()
+                    timeout = min(last_push + self.debounce_seconds, first_push + self.max_delay_seconds) - now
+                    if timeout <= 0:
+                        break
+                try:
+                    push = await client.wait_server_push(timeout=timeout)
+                except asyncio.TimeoutError:
+                    if first_push is not None:
+                        continue
+                    if not is_connected(client):
+                        raise aioimaplib.Abort("connection closed while idling")
+                    if self._rewound:
+                        # A batch was given up on: fetch its mail again.
+                        first_push = time.monotonic()
+                        break
+                    continue
+                if push == aioimaplib.STOP_WAIT_SERVER_PUSH:
+                    break
+                if any(isinstance(line, bytes) and line.endswith(b'EXISTS') for line in push):
+                    self.pushes += 1
+                    last_push = time.monotonic()
+                    first_push = first_push or last_push
+        finally:
+            if client.has_pending_idle() and is_connected(client):
+                client.idle_done()
+                await asyncio.wait_for(idle, client.timeout)
+            else:
+                idle.cancel()
+        return first_push is not None
+
+    def _reset(self, uid: int):
+        """Forgets everything fetched after uid: queued batches are dropped and fetched again."""
+        self._generation += 1
+        self.fetched_uid = uid
+        while not self._batches.empty():
+            self._batches.get_nowait()
+
+    async def _catch_up(self, client: aioimaplib.IMAP4):
+        self._rewound = False
+        while True:
+            generation = self._generation
+            async with mailbox_locks.get("read", self.account.imap_server, self.account.email, self.folder):
+                # The saved UID moves only once a batch is processed (_process); fetching goes on from fetched_uid.
+                emails = await read_new_emails(client, self.sync_key, CATCH_UP_FETCH, self.folder, oldest_first=True,
+                                               since_uid=self.fetched_uid, save=False)
+            self.fetches += 1
+            if generation != self._generation:
+                continue
+            if emails:
+                self.fetched_uid = emails[-1].uid
+                self.emails += len(emails)
+                await index_fetched(emails, self.account.email)
+                for start in range(0, len(emails), self.max_batch):
+                    self._batches.put_nowait((generation, emails[start:start + self.max_batch]))
+            if len(emails) < CATCH_UP_FETCH:
+                return
+
+    async def _process(self):
+        # One batch at a time per mailbox, in arrival order, while the session goes back to idling.
+        while True:
+            generation, emails = await self._batches.get()
+            delay = RECONNECT_MIN_SECONDS
+            for attempt in range(BATCH_RETRIES + 1):
+                if generation != self._generation:
+                    break
+                try:
+                    await self.on_batch(self.account, self.folder, emails)
+                except Exception as e:
+                    print(f"[IDLE] {self.name}: failed to process {len(emails)} new email(s): {e}")
+                    if attempt < BATCH_RETRIES:
+                        self.retried_batches += 1
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, self.reconnect_max_seconds)
+                        continue
+                    # Given up for now: nothing past the saved UID is lost, the session fetches it again.
+                    self.failed_batches += 1
+                    self._reset(self.last_uid)
+                    self._rewound = True
+                    break
+                self.batches += 1
+                if save_processed_uid(self.sync_key, self.uidvalidity, emails[-1].uid):
+                    self.last_uid = emails[-1].uid
+                break
+
+    def stats(self) -> Dict:
+        return {
+            "connected": self.connected,
+            "connections": self.connections,
+            "reconnects": self.reconnects,
+            "pushes": self.pushes,
+            "fetches": self.fetches,
+            "emails": self.emails,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "retried_batches": self.retried_batches,
+            "queued_batches": self._batches.qsize() if self._batches is not None else 0,
+            "last_uid": self.last_uid,
+            "fetched_uid": self.fetched_uid,
+            "last_error": self.last_error,
+        }
+
+
+async def process_new_mail(account: Account, folder: str, emails: List[EmailRecord]):
+    """Runs the workflow on mail that just arrived, scheduling replies IMAP_IDLE_SEND_DELAY_SECONDS from now."""
+    # Imported here: langgraph_flow imports the workflow nodes, which the watcher itself does not need.
+    from langgraph_flow import run_workflow
+
+    send_time = (datetime.datetime.now(datetime.timezone.utc)
+                 + datetime.timedelta(seconds=IMAP_IDLE_SEND_DELAY_SECONDS)).replace(microsecond=0).isoformat()
+    processed = await run_workflow(account.imap_server, account.smtp_server, account.email, account.password, send_time,
+                                   IMAP_IDLE_TONE, len(emails), mailbox=folder, emails=emails)
+    scheduled = sum(bool(mail.scheduled) for mail in processed)
+    print(f"[IDLE] {account.email}/{folder}: {len(emails)} new email(s), {scheduled} scheduled repl{'y' if scheduled == 1 else 'ies'}")
+    return processed
+
+
+class IdleWatcher:
+    """The MailboxWatchers of the server process, one task each."""
+
+    def __init__(self, on_batch: BatchHandler = process_new_mail):
+        self.on_batch = on_batch
+        self.watchers: Dict[Tuple[str, str], MailboxWatcher] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, mailboxes: Optional[List[Tuple[Account, str]]] = None, **options) -> List[MailboxWatcher]:
+        """Starts watching mailboxes (default: every configured account and folder); options go to MailboxWatcher."""
+        for account, folder in mailboxes or select_mailboxes():
+            key = (account.email, folder)
+            if key in self.watchers:
+                continue
+            watcher = self.watchers[key] = MailboxWatcher(account, folder, self.on_batch, **options)
+            self._tasks.append(asyncio.ensure_future(watcher.run()))
+            print(f"[IDLE] Watching {watcher.name} for new mail")
+        return list(self.watchers.values())
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.watchers = {}
+
+    def stats(self) -> Dict:
+        return {watcher.name: watcher.stats() for watcher in self.watchers.values()}
+
+
+idle_watcher = IdleWatcher()
@@ -0,0 +1,269 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aioimaplib
+
+from config import IMAP_POOL_MAX_SESSIONS, IMAP_POOL_KEEPALIVE_SECONDS, IMAP_POOL_MAX_IDLE_SECONDS
+from tools.coordination import imap_provider_limits, server_host
+from tools.read_mail import connect_imap, imap_command
+
+# Errors that mean the session itself is unusable, as opposed to a failed command.
+CONNECTION_ERRORS = (aioimaplib.Abort, aioimaplib.CommandTimeout, ConnectionError, asyncio.TimeoutError, OSError)
+
+
+class PooledSession:
+    __slots__ = ("client", "last_used", "release_slot")
+
+    def __init__(self, client: aioimaplib.IMAP4, release_slot: Optional[Callable[[], None]] = None):
+        self.client = client
+        self.last_used = time.monotonic()
+        # Gives back the provider connection slot this session holds for as long as it is open.
+        self.release_slot = release_slot
+
+    def drop(self):
+        """Closes the connection without a LOGOUT round trip, for when awaiting is not an option."""
+        transport = self.client.protocol.transport if self.client.protocol is not None else None
+        if transport is not None and not transport.is_closing():
+            transport.close()
+        if self.release_slot is not None:
+            self.release_slot()
+            self.release_slot = None
+
+    def is_alive(self) -> bool:
+        transport = self.client.protocol.transport
+        return (
+            transport is not None and not transport.is_closing()
+            and self.client.get_state() in (aioimaplib.AUTH, aioimaplib.SELECTED)
+        )
+
+
+class ImapPool:
+    """
+    Async pool of logged-in IMAP sessions keyed by (server, account).
+    Idle sessions are kept alive with NOOP, dropped sessions are replaced on the next borrow,
+    and a per-account semaphore caps concurrent sessions (providers limit connections per account).
+    Every open session, borrowed or idle, holds a slot of its host's IMAP_PROVIDER_MAX_CONNECTIONS cap
+    until it is closed; when the host is at its cap, idle sessions to it are logged out to make room.
+    """
+
+    def __init__(self, max_sessions: int = IMAP_POOL_MAX_SESSIONS,
+                 keepalive_seconds: float = IMAP_POOL_KEEPALIVE_SECONDS,
+                 max_idle_seconds: float = IMAP_POOL_MAX_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.keepalive_seconds = keepalive_seconds
+        self.max_idle_seconds = max_idle_seconds
+        self._idle: Dict[Tuple[str, str], List[PooledSession]] = {}
+        self._limits: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+        self._in_use = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.reconnects = 0
+        self.reclaimed = 0
+        imap_provider_limits.add_idle_pool(self)
+
+    def _bind_loop(self):
+        # Sessions and semaphores belong to one event loop; asyncio.run() in scripts creates a new one each time.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._idle = {}
+            self._limits = {}
+            self._in_use = 0
+            self._loop = loop
+            self._keepalive_task = None
+        if (self._keepalive_task is None or self._keepalive_task.done()) and self.keepalive_seconds > 0:
+            self._keepalive_task = loop.create_task(self._keepalive())
+
+    async def _connect(self, imap_server: str, email_address: str, password: str) -> PooledSession:
+        release_slot = await imap_provider_limits.acquire(imap_server)
+        try:
+            session = PooledSession(connect_imap(imap_server), release_slot)
+        except BaseException:
+            release_slot()
+            raise
+        try:
+            await session.client.wait_hello_from_server()
+            resp = await imap_command(session.client.login(email_address, password))
+            if resp.result != 'OK':
+                raise aioimaplib.Abort(f"login failed for {email_address}: {resp.lines}")
+        except BaseException:
+            session.drop()
+            raise
+        return session
+
+    async def _checkout(self, key: Tuple[str, str], password: str) -> PooledSession:
+        idle = self._idle.setdefault(key, [])
+        while idle:
+            session = idle.pop()
+            if not session.is_alive():
+                self.reconnects += 1
+                session.drop()
+                continue
+            if time.monotonic() - session.last_used > self.keepalive_seconds:
+                # Possibly stale: prove the connection with a NOOP before handing it out.
+                try:
+                    await imap_command(session.client.noop())
+                except CONNECTION_ERRORS:
+                    self.reconnects += 1
+                    session.drop()
+                    continue
+                except BaseException:
+                    session.drop()
+                    raise
+            self.hits += 1
+            return session
+        self.misses += 1
+        return await self._connect(key[0], key[1], password)
+
+    @asynccontextmanager
+    async def session(self, imap_server: str, email_address: str, password: str):
+        """
+        Borrows a logged-in client for (imap_server, email_address), waiting if the account is at its cap.
+        A session whose user raised is closed instead of being returned to the pool: logged out after an
+        error, dropped outright when cancelled or closed early (e.g. an abandoned stream_inbox_emails).
+        """
+        self._bind_loop()
+        key = (imap_server, email_address)
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.max_sessions))
+        start = time.monotonic()
+        if limit.locked():
+            self.waits += 1
+        await limit.acquire()
+        waited = time.monotonic() - start
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        try:
+            session = await self._checkout(key, password)
+            self._in_use += 1
+            try:
+                yield session.client
+            except Exception:
+                # Dropped, or a command failed part way: the connection may be mid-response.
+                await self._close(session)
+                raise
+            except BaseException:
+                session.drop()
+                raise
+            finally:
+                self._in_use -= 1
+            session.last_used = time.monotonic()
+            await self._release(session, self._idle[key], imap_server)
+        finally:
+            limit.release()
+
+    async def run(self, imap_server: str, email_address: str, password: str,
+                  operation: Callable[[aioimaplib.IMAP4], Awaitable]):
+        """
+        Runs operation(client) on a pooled session, retrying once on a fresh connection
+        if the borrowed session turns out to have been dropped by the server.
+        """
+        try:
+            async with self.session(imap_server, email_address, password) as client:
+                return await operation(client)
+        except CONNECTION_ERRORS:
+            self.reconnects += 1
+            async with self.session(imap_server, email_address, password) as client:
+                return await operation(client)
+
+    async def _close(self, session: PooledSession):
+        try:
+            if session.is_alive():
+                await session.client.logout()
+        except Exception:
+            pass
+        finally:
+            session.drop()
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_seconds)
+            try:
+                await self._keepalive_pass()
+            except Exception as e:
+                # One bad pass must not end the task: idle sessions would never be pinged or expired again.
+                print(f"[IMAP] Pool keepalive pass failed: {e!r}")
+
+    async def _keepalive_pass(self):
+        now = time.monotonic()
+        # A copy: borrowing for a new account adds a key while a NOOP below is awaited.
+        for idle in list(self._idle.values()):
+            for session in list(idle):
+                if session not in idle:
+                    continue  # borrowed while we were awaiting a previous NOOP
+                # Take the session out while pinging so it is never borrowed mid-NOOP.
+                idle.remove(session)
+                if not session.is_alive():
+                    session.drop()
+                    continue
+                if now - session.last_used > self.max_idle_seconds:
+                    await self._close(session)
+                    continue
+                try:
+                    await imap_command(session.client.noop())
+                except CONNECTION_ERRORS:
+                    session.drop()
+                    continue
+                except BaseException:
+                    session.drop()
+                    raise
+                await self._release(session, idle, key[0])
+
+    async def _release(self, session: PooledSession, idle: List[PooledSession], imap_server: str):
+        """Puts a session back in its idle list, unless it is dead or another connection is waiting for its provider slot."""
+        if not session.is_alive():
+            session.drop()
+        elif imap_provider_limits.waiting(imap_server):
+            # Idle, it would hold the slot until it expires: hand the slot to the waiting connection instead.
+            self.reclaimed += 1
+            await self._close(session)
+        else:
+            idle.append(session)
+
+    async def reclaim_idle(self, host: str) -> bool:
+        """Logs out the least recently used idle session to host, freeing its provider slot for another connection."""
+        if self._loop is not asyncio.get_running_loop():
+            return False  # sessions of an earlier loop hold slots of that loop's semaphores
+        candidates = [(session.last_used, key) for key, idle in self._idle.items()
+                      if server_host(key[0]) == host for session in idle]
+        if not candidates:
+            return False
+        last_used, key = min(candidates)
+        idle = self._idle[key]
+        session = next(session for session in idle if session.last_used == last_used)
+        idle.remove(session)
+        self.reclaimed += 1
+        await self._close(session)
+        return True
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        for idle in list(self._idle.values()):
+            while idle:
+                await self._close(idle.pop())
+
+    def stats(self) -> Dict:
+        borrows = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / borrows, 4) if borrows else 0.0,
+            "waits": self.waits,
+            "wait_time_total_seconds": round(self.wait_time_total, 6),
+            "wait_time_max_seconds": round(self.wait_time_max, 6),
+            "reconnects": self.reconnects,
+            "reclaimed": self.reclaimed,
+            "idle_sessions": sum(len(idle) for idle in self._idle.values()),
+            "in_use_sessions": self._in_use,
+            "max_sessions_per_account": self.max_sessions,
+        }
+
+
+imap_pool = ImapPool()
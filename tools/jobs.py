@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import JOBS_MAX_CONCURRENCY, JOBS_MAX_HISTORY
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+# A job body: receives a progress callback for per-email events and returns the job's result.
+JobRunner = Callable[[Callable[[Dict], None]], Awaitable]
+
+
+class Job:
+    """
+    One background workflow run: its status, the progress events emitted so far and, once finished, its result.
+    A partial draft event (type "draft", not done) carries the whole draft so far, so only the latest one per
+    email is kept: it replaces the previous one, which stays in the log as None to keep event ids as positions.
+    Once the job finishes, partial drafts are dropped altogether; the final (done) draft events remain.
+    """
+
+    def __init__(self, job_id: str, name: str, arguments: Dict):
+        self.id = job_id
+        self.name = name
+        self.arguments = arguments
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events: List[Optional[Dict]] = []
+        self._partials: Dict[Tuple, int] = {}
+        self.result = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def emit(self, event: Dict):
+        event = {"id": len(self.events), **event}
+        if event.get("type") == "draft":
+            # The draft so far supersedes the previous partial one for the same email.
+            previous = self._partials.pop((event.get("message_id"), event.get("index")), None)
+            if previous is not None:
+                self.events[previous] = None
+            if not event.get("done"):
+                self._partials[(event.get("message_id"), event.get("index"))] = event["id"]
+        self.events.append(event)
+        # Wake every waiting subscriber, then hand out a fresh event for the next change.
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def set_status(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        if status == "running":
+            self.started_at = time.time()
+        elif status in FINISHED:
+            self.finished_at = time.time()
+            for position in self._partials.values():
+                self.events[position] = None
+            self._partials = {}
+        self.emit({"type": "status", "status": status, **({"error": error} if error else {})})
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    async def stream(self, after: int = -1) -> AsyncIterator[Dict]:
+        """Yields events with id > after, including ones emitted later, until the job has finished."""
+        cursor = after + 1
+        while True:
+            changed = self._changed
+            while cursor < len(self.events):
+                event = self.events[cursor]
+                cursor += 1
+                if event is not None:
+                    yield event
+            if self.finished:
+                return
+            await changed.wait()
+
+    def info(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": len(self.events),
+            "emails_done": sum(1 for event in self.events if event is not None and event.get("stage") == "schedule_mail"),
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs submitted jobs as background tasks, at most max_concurrency at a time; the rest wait
+    in submission order with status "queued". Finished jobs are kept (oldest dropped first)
+    up to max_history so their status, events and result can still be fetched.
+    """
+
+    def __init__(self, max_concurrency: int = JOBS_MAX_CONCURRENCY, max_history: int = JOBS_MAX_HISTORY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_history = max_history
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._counter = itertools.count(1)
+
+    def submit(self, name: str, arguments: Dict, runner: JobRunner) -> Job:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        job = Job(f"{next(self._counter)}-{uuid.uuid4().hex[:8]}", name, arguments)
+        self.jobs[job.id] = job
+        job.set_status("queued")
+        job.task = asyncio.ensure_future(self._run(job, runner))
+        # A task cancelled before it first runs never enters _run, so record that here.
+        job.task.add_done_callback(lambda task: job.finished or job.set_status("cancelled"))
+        self._prune()
+        return job
+
+    async def _run(self, job: Job, runner: JobRunner):
+        try:
+            async with self._slots:
+                job.set_status("running")
+                job.result = await runner(job.emit)
+            job.set_status("succeeded")
+        except asyncio.CancelledError:
+            job.set_status("cancelled")
+        except Exception as e:
+            job.set_status("failed", str(e))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancels a queued or running job. Replies already scheduled by a running job stay in the outbox."""
+        job = self.jobs.get(job_id)
+        if job is not None and not job.finished and job.task is not None:
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job_id]
+
+    async def shutdown(self):
+        tasks = [job.task for job in self.jobs.values() if job.task is not None and not job.finished]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"max_concurrency": self.max_concurrency, "jobs": len(self.jobs), **counts}
+
+
+job_manager = JobManager()
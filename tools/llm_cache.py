@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from config import LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS
+
+LLM_CACHE_FILE = os.path.join(os.path.dirname(__file__), "llm_cache.sqlite3")
+# Hits whose accessed_at update is held back before it is written; a put writes them all sooner.
+TOUCH_FLUSH_HITS = 64
+
+
+class LLMCache:
+    """
+    Persistent cache of LLM completions keyed by a content hash of everything that shapes the prompt
+    (model name, prompt template version, tone, email fields). Backed by SQLite so it survives restarts;
+    entries expire after ttl_seconds and the least recently used ones are evicted beyond max_entries.
+    A hit only records its access time in memory; those are written in one transaction on the next put or
+    every TOUCH_FLUSH_HITS hits, so lookups do not commit. Losing them on exit only blurs the LRU order.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_FILE, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = LLM_CACHE_TTL_SECONDS, enabled: bool = LLM_CACHE_ENABLED):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._entries = 0
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only syncs at checkpoints: a crash can lose the last commits, never corrupt the file.
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_FLUSH_HITS:
+                self._flush_touched(conn)
+                conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            self._touched.pop(key, None)
+            self._flush_touched(conn)
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if cursor.rowcount:
+                self._entries += 1
+            else:
+                conn.execute(
+                    "UPDATE llm_cache SET value = ?, created_at = ?, accessed_at = ? WHERE key = ?",
+                    (value, now, now, key),
+                )
+            if self._entries > self.max_entries:
+                self._evict(conn, now)
+            conn.commit()
+
+    def _flush_touched(self, conn: sqlite3.Connection):
+        """Writes the access times of the hits since the last flush; the caller commits."""
+        if self._touched:
+            conn.executemany("UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                             [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched = {}
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        # Trim to 90% so eviction runs once per batch of inserts, not on every put.
+        excess = count - int(self.max_entries * 0.9)
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            count -= excess
+        self.evictions += expired + max(excess, 0)
+        self._entries = count
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._entries = 0
+            self._touched = {}
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": self._entries,
+            "evictions": self.evictions,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,214 @@
+"""
+One Ollama client shared by categorization and drafting.
+
+The model, server and keep_alive come from config.py, so both tools hit the same loaded model and
+Ollama keeps it in memory between runs instead of unloading it after its 5-minute default.
+The OllamaLLM is only built (and langchain_ollama imported) on the first call.
+warm_up() loads the model ahead of the first real request (the MCP server calls it at startup).
+Calls use the client's native async path (one httpx request per call, no thread); an LLM without
+one, or LLM_NATIVE_ASYNC=False, runs on a dedicated, bounded executor instead of asyncio's default.
+At most LLM_MAX_CONCURRENCY calls are in flight at once across the whole process, however many runs
+and mailboxes are drafting; the rest wait their turn here rather than in Ollama's queue. The limit
+adapts below that (tools/rate_limit.py) when calls fail or take longer than LLM_LATENCY_TARGET_SECONDS,
+and LLM_CALLS_PER_MINUTE caps the call rate. A call's timeout starts once it has its slot, so time spent
+queued behind the limiter never counts against it.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, Optional
+
+from config import (OLLAMA_MODEL, OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, LLM_NATIVE_ASYNC, LLM_EXECUTOR_WORKERS,
+                    LLM_MAX_CONCURRENCY, LLM_CALLS_PER_MINUTE, LLM_CALL_BURST, LLM_LATENCY_TARGET_SECONDS, METRICS_ENABLED)
+from tools.metrics import (LLM_SECONDS, LLM_ERRORS, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS, LLM_FIRST_TOKEN_SECONDS,
+                           estimate_tokens, observe)
+from tools.rate_limit import Limiter
+
+
+class LLMClient:
+    def __init__(self, model: str = OLLAMA_MODEL, base_url: Optional[str] = OLLAMA_BASE_URL,
+                 keep_alive=OLLAMA_KEEP_ALIVE, native_async: bool = LLM_NATIVE_ASYNC,
+                 executor_workers: int = LLM_EXECUTOR_WORKERS, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.model = model
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.native_async = native_async
+        self.executor_workers = executor_workers
+        self.limiter = Limiter("llm", LLM_CALLS_PER_MINUTE, LLM_CALL_BURST, max_concurrency,
+                               latency_target=LLM_LATENCY_TARGET_SECONDS)
+        self._llm = None
+        self._owned = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.calls = 0
+        self.executor_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.warmup_seconds: Optional[float] = None
+        self.warmup_error: Optional[str] = None
+
+    def _build(self):
+        # Imported here: langchain_ollama is most of the import time, and only needed once a model is called.
+        from langchain_ollama.llms import OllamaLLM
+        return OllamaLLM(model=self.model, base_url=self.base_url, keep_alive=self.keep_alive)
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = self._build()
+            self._owned = True
+        return self._llm
+
+    def set_llm(self, llm):
+        """Uses llm (anything with invoke, and optionally ainvoke) for every call; the benchmarks pass a stub here."""
+        self._llm = llm
+        self._owned = False
+        self._loop = None
+
+    @property
+    def max_concurrency(self) -> int:
+        return self.limiter.max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, value: int):
+        self.limiter.max_concurrency = value
+
+    @property
+    def model_name(self) -> str:
+        """Model name for cache keys: the configured model, or the injected LLM's own."""
+        return getattr(self._llm, "model", self.model) if self._llm is not None else self.model
+
+    def _bind_loop(self):
+        # OllamaLLM's async httpx client keeps connections tied to the loop that opened them;
+        # asyncio.run() in scripts creates a new loop each time, so rebuild the client when it changes.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._owned:
+                self._llm = None
+            self._loop = loop
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, self.executor_workers), thread_name_prefix="llm")
+        return self._executor
+
+    async def _call(self, prompt: str) -> str:
+        llm = self.llm
+        if self.native_async and hasattr(llm, "ainvoke"):
+            return await llm.ainvoke(prompt)
+        self.executor_calls += 1
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), llm.invoke, prompt)
+
+    async def ainvoke(self, prompt: str, purpose: str, timeout: Optional[float] = None) -> str:
+        """
+        Runs prompt through the shared LLM, timed and token-counted under purpose. A call that takes longer
+        than timeout seconds (None: no limit) once it has a slot raises TimeoutError.
+        """
+        self._bind_loop()
+        # Loading the model is slow by nature, and says nothing about how loaded Ollama is.
+        async with self.limiter.slot(feedback=purpose != "warmup"):
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                with observe(LLM_SECONDS, span=f"llm.{purpose}", errors=LLM_ERRORS, purpose=purpose):
+                    async with asyncio.timeout(timeout):
+                        response = await self._call(prompt)
+            finally:
+                self.in_flight -= 1
+        if METRICS_ENABLED:
+            LLM_PROMPT_TOKENS.inc(estimate_tokens(prompt), purpose=purpose)
+            LLM_COMPLETION_TOKENS.inc(estimate_tokens(response), purpose=purpose)
+        return response
+
+    async def astream(self, prompt: str, purpose: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Yields the reply to prompt as it is generated (one chunk per token from Ollama), timing the
+        first chunk into LLM_FIRST_TOKEN_SECONDS. Closing the generator early (contextlib.aclosing)
+        closes the HTTP stream, and Ollama stops generating. An LLM without astream, or
+        LLM_NATIVE_ASYNC=False, yields the whole reply as one chunk. Waiting for a chunk past timeout
+        seconds (None: no limit) from when the slot was granted raises TimeoutError.
+        """
+        self._bind_loop()
+        parts = []
+        try:
+            async with self.limiter.slot():
+                self.calls += 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                llm = self.llm
+                start = time.perf_counter()
+                deadline = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+                try:
+                    with observe(LLM_SECONDS, span=f"llm.{purpose}", errors=LLM_ERRORS, purpose=purpose):
+                        if self.native_async and hasattr(llm, "astream"):
+                            chunks = llm.astream(prompt)
+                        else:
+                            chunks = self._whole(prompt)
+                        async with aclosing(chunks):
+                            while True:
+                                # Only the wait for the model is under the deadline, never the consumer's turn.
+                                async with asyncio.timeout_at(deadline):
+                                    try:
+                                        chunk = await anext(chunks)
+                                    except StopAsyncIteration:
+                                        break
+                                if not parts and METRICS_ENABLED:
+                                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, purpose=purpose)
+                                parts.append(chunk)
+                                yield chunk
+                finally:
+                    self.in_flight -= 1
+        finally:
+            if METRICS_ENABLED:
+                LLM_PROMPT_TOKENS.inc(estimate_tokens(prompt), purpose=purpose)
+                LLM_COMPLETION_TOKENS.inc(estimate_tokens("".join(parts)), purpose=purpose)
+
+    async def _whole(self, prompt: str) -> AsyncIterator[str]:
+        yield await self._call(prompt)
+
+    async def warm_up(self) -> Optional[float]:
+        """
+        Loads the model with an empty prompt (Ollama loads it and returns without generating) and
+        returns the seconds it took. Failures are recorded in stats() rather than raised, so a server
+        can start before Ollama does; the first real request then pays the load instead.
+        """
+        start = time.perf_counter()
+        try:
+            await self.ainvoke("", "warmup")
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"[LLM] Warm-up of {self.model_name} failed: {e}")
+            return None
+        self.warmup_seconds = time.perf_counter() - start
+        self.warmup_error = None
+        print(f"[LLM] {self.model_name} warmed up in {self.warmup_seconds:.2f}s (keep_alive={self.keep_alive})")
+        return self.warmup_seconds
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "keep_alive": self.keep_alive,
+            "native_async": self.native_async,
+            "executor_workers": self.executor_workers,
+            "calls": self.calls,
+            "executor_calls": self.executor_calls,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.limiter.waiting,
+            "waits": self.limiter.waits,
+            "limiter": self.limiter.stats(),
+            "warmup_seconds": round(self.warmup_seconds, 4) if self.warmup_seconds is not None else None,
+            "warmup_error": self.warmup_error,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+llm_client = LLMClient()
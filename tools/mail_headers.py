@@ -0,0 +1,61 @@
+"""
+Message-ID, In-Reply-To and References handling: reading them from fetched mail, and building the
+threading headers of a reply (RFC 5322 section 3.6.4) so mail clients file it in the right conversation.
+"""
+
+import re
+from email.utils import make_msgid
+from typing import Dict, List, Optional
+
+MSG_ID_RE = re.compile(r"<[^<>\s]+>")
+# References kept on a reply: the thread root plus the most recent ones, as most mail clients trim it.
+MAX_REFERENCES = 20
+
+
+def normalize_message_id(value: Optional[str]) -> str:
+    """A Message-ID in its <...> form without surrounding whitespace, or "" for none."""
+    value = (value or "").strip()
+    if not value:
+        return ""
+    match = MSG_ID_RE.search(value)
+    if match:
+        return match.group(0)
+    return f"<{value.strip('<>')}>"
+
+
+def parse_references(value: Optional[str]) -> List[str]:
+    """The Message-IDs in a References (or In-Reply-To) header, oldest first."""
+    return MSG_ID_RE.findall(value or "")
+
+
+def reply_references(email: Dict) -> str:
+    """
+    References header for a reply to email: its References (or In-Reply-To when it has none)
+    followed by its own Message-ID, trimmed to the root and the last MAX_REFERENCES - 1 entries.
+    """
+    references = parse_references(email.get("references")) or parse_references(email.get("in_reply_to"))
+    message_id = normalize_message_id(email.get("message_id"))
+    if message_id and message_id not in references:
+        references.append(message_id)
+    if len(references) > MAX_REFERENCES:
+        references = references[:1] + references[-(MAX_REFERENCES - 1):]
+    return " ".join(references)
+
+
+def thread_root(email: Dict) -> str:
+    """
+    The Message-ID that starts email's conversation: the first References entry, else In-Reply-To,
+    else its own Message-ID ("" when it has none of them).
+    """
+    for header in ("references", "in_reply_to"):
+        references = parse_references(email.get(header))
+        if references:
+            return references[0]
+    return normalize_message_id(email.get("message_id"))
+
+
+def new_message_id(address: Optional[str]) -> str:
+    """A fresh Message-ID in the sending address's domain."""
+    # make_msgid() without a domain looks up the host's FQDN, which can block on DNS.
+    domain = address.rpartition("@")[2].strip(" >") if address and "@" in address else "localhost"
+    return make_msgid(domain=domain)
@@ -0,0 +1,334 @@
+"""
+Local embedding index over emails read and replies sent, for context-aware drafting.
+
+Each message becomes a hashed bag-of-words vector (the "hashing trick": no model, no vocabulary, so
+embedding costs microseconds and never touches Ollama). Vectors live in a memory-mapped float32 matrix
+on disk (vectors.f32, one row per message, grown by doubling), and what a row is (Message-ID, thread,
+account, a short text) lives next to it in SQLite (meta.sqlite3). A thread is named by the Message-ID
+it starts with (from References / In-Reply-To), or by the subject for mail without those headers.
+Adding mail appends rows; a message already indexed under its Message-ID is skipped, so re-reading
+a mailbox costs nothing.
+
+search() scores every row with one matrix-vector product per chunk of rows, so a query touches
+dim * 4 bytes per indexed message and never loads the matrix into memory at once. Rows from the same
+thread get a bonus. context_for() turns the best hits into a few prompt lines within a token budget.
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from config import MAIL_INDEX_DIR, MAIL_INDEX_DIM, MAIL_INDEX_TOP_K, MAIL_INDEX_TOKEN_BUDGET
+from tools.mail_headers import thread_root
+from tools.metrics import estimate_tokens
+
+DEFAULT_INDEX_DIR = MAIL_INDEX_DIR or os.path.join(os.path.dirname(__file__), "mail_index")
+
+# Text kept per message for the prompt; the vector is built from the same text.
+TEXT_CHARS = 300
+# Rows scored per matrix-vector product: bounds the float32 scores buffer, not the index size.
+CHUNK_ROWS = 1 << 18
+INITIAL_CAPACITY = 4096
+# Added to the similarity of messages in the same thread as the query, so the conversation comes first.
+THREAD_BONUS = 0.5
+# Hits below this cosine similarity are noise for hashed bag-of-words vectors.
+MIN_SCORE = 0.15
+
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9'_-]+")
+REPLY_PREFIX_RE = re.compile(r"^\s*((re|fw|fwd|aw|sv)\s*(\[\d+\])?\s*:\s*)+", re.I)
+STOPWORDS = frozenset(
+    "the and for you your with this that have from are was were will would can could our has had not but "
+    "all any been its it's just about into than then them they their there what when which who how also "
+    "please thanks thank regards dear hi hello best".split()
+)
+
+
+def thread_key(subject: Optional[str]) -> str:
+    """Conversation key from a subject alone: without Re:/Fwd: prefixes, lowercased."""
+    return REPLY_PREFIX_RE.sub("", subject or "").strip().lower()
+
+
+def mail_thread(mail: Dict) -> str:
+    """Conversation key of a message: the Message-ID its thread starts with, or its subject without any."""
+    return thread_root(mail) or thread_key(mail.get("subject"))
+
+
+@lru_cache(maxsize=1 << 16)
+def _feature(token: str, dim: int):
+    # crc32 rather than hash(): string hashes are salted per process, and the vectors persist.
+    h = zlib.crc32(token.encode())
+    return h % dim, 1.0 if h & 0x80000000 else -1.0
+
+
+def _features(text: str, dim: int) -> Dict[int, float]:
+    counts: Dict[str, int] = {}
+    for word in WORD_RE.findall(text.lower()):
+        if word not in STOPWORDS:
+            counts[word] = counts.get(word, 0) + 1
+    weights: Dict[int, float] = {}
+    for word, count in counts.items():
+        bucket, sign = _feature(word, dim)
+        weights[bucket] = weights.get(bucket, 0.0) + sign * (1.0 + math.log(count))
+    return weights
+
+
+def embed(texts: Sequence[str], dim: int) -> np.ndarray:
+    """L2-normalized hashed bag-of-words vectors, one row per text (an all-zero row for a text with no words)."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        weights = _features(text, dim)
+        if weights:
+            vectors[row, list(weights)] = list(weights.values())
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class MailIndex:
+    def __init__(self, path: str = DEFAULT_INDEX_DIR, dim: int = MAIL_INDEX_DIM):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._vectors: Optional[np.memmap] = None
+        self._count = 0
+        self.added = 0
+        self.skipped = 0
+        self.queries = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.path, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.path, "meta.sqlite3"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS entries (
+                    row INTEGER PRIMARY KEY,
+                    message_id TEXT NOT NULL UNIQUE,
+                    thread TEXT,
+                    kind TEXT NOT NULL,
+                    account TEXT,
+                    sender TEXT,
+                    subject TEXT,
+                    text TEXT
+                );
+                CREATE INDEX IF NOT EXISTS entries_thread ON entries (thread);
+            """)
+            conn.execute("INSERT OR IGNORE INTO settings VALUES ('dim', ?)", (str(self.dim),))
+            stored_dim = int(conn.execute("SELECT value FROM settings WHERE key = 'dim'").fetchone()[0])
+            if stored_dim != self.dim:
+                raise ValueError(f"{self.path} holds {stored_dim}-dimensional vectors, not {self.dim}; "
+                                 f"set MAIL_INDEX_DIM={stored_dim} or use another MAIL_INDEX_DIR")
+            self._count = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM entries").fetchone()[0]
+            self._conn = conn
+            self._open_vectors(max(INITIAL_CAPACITY, self._count))
+        return self._conn
+
+    def _open_vectors(self, capacity: int):
+        file = os.path.join(self.path, "vectors.f32")
+        row_bytes = self.dim * 4
+        size = os.path.getsize(file) if os.path.exists(file) else 0
+        if size < capacity * row_bytes:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            with open(file, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            size = capacity * row_bytes
+        self._vectors = np.memmap(file, dtype=np.float32, mode="r+", shape=(size // row_bytes, self.dim))
+
+    def add(self, entries: Iterable[Dict]) -> int:
+        """
+        Indexes entries ({"message_id", "thread", "kind", "account", "sender", "subject", "text"}),
+        skipping Message-IDs already in the index. Returns the number of rows added.
+        """
+        with self._lock:
+            conn = self._connect()
+            fresh, seen = [], set()
+            for entry in entries:
+                message_id = entry.get("message_id")
+                if not message_id or message_id in seen:
+                    continue
+                seen.add(message_id)
+                fresh.append(entry)
+            if fresh:
+                known = set()
+                ids = [entry["message_id"] for entry in fresh]
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    known.update(row[0] for row in conn.execute(
+                        f"SELECT message_id FROM entries WHERE message_id IN ({','.join('?' * len(batch))})", batch))
+                self.skipped += len(known)
+                fresh = [entry for entry in fresh if entry["message_id"] not in known]
+            if not fresh:
+                return 0
+            texts = [f"{entry.get('subject') or ''}\n{entry.get('text') or ''}" for entry in fresh]
+            first = self._count
+            if first + len(fresh) > self._vectors.shape[0]:
+                self._open_vectors(max(first + len(fresh), 2 * self._vectors.shape[0]))
+            self._vectors[first:first + len(fresh)] = embed(texts, self.dim)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO entries (row, message_id, thread, kind, account, sender, subject, text)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(first + offset, entry["message_id"], entry.get("thread"), entry.get("kind", "received"),
+                      entry.get("account"), entry.get("sender"), entry.get("subject"), (entry.get("text") or "")[:TEXT_CHARS])
+                     for offset, entry in enumerate(fresh)],
+                )
+            self._count += len(fresh)
+            self.added += len(fresh)
+            return len(fresh)
+
+    def add_emails(self, emails: Iterable[Dict], account: Optional[str] = None) -> int:
+        """Indexes fetched emails (records or dicts with message_id, from, subject, snippet)."""
+        return self.add({
+            "message_id": mail.get("message_id"),
+            "thread": mail_thread(mail),
+            "kind": "received",
+            "account": account or mail.get("account"),
+            "sender": mail.get("from"),
+            "subject": mail.get("subject"),
+            "text": mail.get("snippet"),
+        } for mail in emails)
+
+    def add_replies(self, messages: Iterable, account: Optional[str] = None) -> int:
+        """Indexes sent outbox messages (ScheduledMessage), keyed by their Message-ID (or outbox id without one)."""
+        return self.add({
+            "message_id": message.message_id or f"<sent-{message.id}@outbox>",
+            "thread": mail_thread({"message_id": message.message_id, "in_reply_to": message.in_reply_to,
+                                   "references": message.references, "subject": message.subject}),
+            "kind": "sent",
+            "account": message.account or account,
+            "sender": account,
+            "subject": message.subject,
+            "text": message.body,
+        } for message in messages)
+
+    @staticmethod
+    def _top_rows(vectors: np.ndarray, count: int, query: np.ndarray, candidates: int) -> Dict[int, float]:
+        best: Dict[int, float] = {}
+        for start in range(0, count, CHUNK_ROWS):
+            scores = vectors[start:min(start + CHUNK_ROWS, count)] @ query
+            take = min(candidates, len(scores))
+            top = np.argpartition(scores, -take)[-take:]
+            best.update((start + int(row), float(scores[row])) for row in top)
+        if len(best) > candidates:
+            best = dict(sorted(best.items(), key=lambda item: -item[1])[:candidates])
+        return best
+
+    def search(self, text: str, k: int = MAIL_INDEX_TOP_K, thread: Optional[str] = None,
+               account: Optional[str] = None, exclude: Sequence[str] = ()) -> List[Dict]:
+        """
+        The k entries most similar to text, best first, as dicts with their stored fields and "score".
+        With account, only that account's entries are returned; thread entries get THREAD_BONUS.
+        The vector scan runs outside the lock, over the rows there were when it started, so adds
+        (and other searches) are not held up by it.
+        """
+        with self._lock:
+            self._connect()
+            self.queries += 1
+            count, vectors = self._count, self._vectors
+        if not count or k <= 0:
+            return []
+        query = embed([text], self.dim)[0]
+        # Extra candidates so filtering by account and exclude still leaves k.
+        scores = self._top_rows(vectors, count, query, 4 * k + len(exclude))
+        with self._lock:
+            conn = self._connect()
+            if thread:
+                rows = [row for (row,) in conn.execute("SELECT row FROM entries WHERE thread = ? ORDER BY row DESC LIMIT 50", (thread,))]
+                if rows:
+                    for row, score in zip(rows, self._vectors[rows] @ query):
+                        scores[row] = float(score) + THREAD_BONUS
+            rows = list(scores)
+            hits = []
+            for start in range(0, len(rows), 500):
+                batch = rows[start:start + 500]
+                for row, message_id, thread_, kind, account_, sender, subject, body in conn.execute(
+                        f"SELECT row, message_id, thread, kind, account, sender, subject, text FROM entries"
+                        f" WHERE row IN ({','.join('?' * len(batch))})", batch):
+                    if message_id in exclude or (account and account_ != account) or scores[row] < MIN_SCORE:
+                        continue
+                    hits.append({"message_id": message_id, "thread": thread_, "kind": kind, "account": account_,
+                                 "sender": sender, "subject": subject, "text": body, "score": round(scores[row], 4)})
+        hits.sort(key=lambda hit: -hit["score"])
+        return hits[:k]
+
+    def context_for(self, email: Dict, k: int = MAIL_INDEX_TOP_K, token_budget: int = MAIL_INDEX_TOKEN_BUDGET) -> str:
+        """Prompt lines for the messages most related to email, best first, within token_budget tokens."""
+        hits = self.search(f"{email.get('subject') or ''}\n{email.get('snippet') or ''}", k,
+                           thread=mail_thread(email), account=email.get("account"),
+                           exclude=[email.get("message_id")] if email.get("message_id") else [])
+        lines, used = [], 0
+        for hit in hits:
+            who = "You replied" if hit["kind"] == "sent" else f"From {hit['sender']}"
+            line = f"- {who}, subject '{hit['subject']}': {' '.join((hit['text'] or '').split())}"
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._connect()
+            return self._count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._connect()
+            return {"entries": self._count, "dim": self.dim, "capacity": self._vectors.shape[0],
+                    "bytes": self._vectors.shape[0] * self.dim * 4, "added": self.added,
+                    "skipped": self.skipped, "queries": self.queries}
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_mail_index: Optional[MailIndex] = None
+
+
+def get_mail_index() -> MailIndex:
+    """The process-wide index under MAIL_INDEX_DIR."""
+    global _mail_index
+    if _mail_index is None:
+        _mail_index = MailIndex()
+    return _mail_index
+
+
+def set_mail_index(index: Optional[MailIndex]):
+    """Replaces the process-wide index (None opens MAIL_INDEX_DIR again on next use)."""
+    global _mail_index
+    _mail_index = index
+
+
+def index_emails(emails: Iterable[Dict], account: Optional[str] = None):
+    """Adds fetched emails to the index; a failure is logged, never raised into the read path."""
+    try:
+        get_mail_index().add_emails(emails, account)
+    except Exception as e:
+        print(f"[INDEX] Failed to index fetched emails: {e}")
+
+
+def index_replies(messages: Iterable, account: Optional[str] = None):
+    """Adds sent replies to the index; a failure is logged, never raised into the send path."""
+    try:
+        get_mail_index().add_replies(messages, account)
+    except Exception as e:
+        print(f"[INDEX] Failed to index sent replies: {e}")
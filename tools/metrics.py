@@ -0,0 +1,251 @@
+"""
+Latency histograms and counters for the workflow's hot paths, exported in the Prometheus text format.
+
+Each LangGraph node, LLM call (see tools.llm_client), IMAP FETCH and SMTP send is timed with observe(), which also records
+a span on the current Trace when one is active (see tracing()), so a single tool call can report where
+its time went. GET /metrics on the FastAPI app serves registry.render().
+The steps also report per-run stats (emails, LLM calls, cache hits, ...) with run_stats(); a workflow run
+collects them in its own dict (see collecting_stats()), so overlapping runs never overwrite each other's.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import METRICS_ENABLED
+
+# Seconds; wide enough for sub-millisecond IMAP round trips and multi-minute Ollama drafts.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text with llama-family tokenizers
+    return len(text) // 4 + 1
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # Per label set: [count per bucket (non-cumulative, last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labels))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels(self.labels, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        # A single dict assignment: no lock needed for last-writer-wins.
+        self._values[tuple(str(labels.get(name, "")) for name in self.labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.metrics.setdefault(name, Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+NODE_SECONDS = registry.histogram("email_workflow_node_seconds", "Time spent in each LangGraph node", ("node",))
+NODE_ERRORS = registry.counter("email_workflow_node_errors_total", "LangGraph node runs that raised", ("node",))
+RUN_SECONDS = registry.histogram("email_workflow_run_seconds", "Whole workflow executions", ("mode",))
+RUN_EMAILS = registry.counter("email_workflow_emails_total", "Emails processed, by routing action", ("action",))
+LLM_SECONDS = registry.histogram("email_llm_request_seconds", "Ollama LLM calls (to the last token when streamed)", ("purpose",))
+LLM_ERRORS = registry.counter("email_llm_errors_total", "LLM calls that raised", ("purpose",))
+LLM_PROMPT_TOKENS = registry.counter("email_llm_prompt_tokens_total", "Prompt tokens sent (estimated, ~4 chars/token)", ("purpose",))
+LLM_FIRST_TOKEN_SECONDS = registry.histogram("email_llm_first_token_seconds", "Time to the first streamed token", ("purpose",))
+LLM_COMPLETION_TOKENS = registry.counter("email_llm_completion_tokens_total", "Completion tokens received (estimated, ~4 chars/token)", ("purpose",))
+DRAFT_TOKENS = registry.histogram("email_draft_tokens", "Tokens generated per streamed draft", (),
+                                  (16, 32, 64, 128, 256, 512, 1024, 2048))
+DRAFT_EARLY_STOPS = registry.counter("email_draft_early_stops_total", "Drafts cut off at DRAFT_MAX_CHARS")
+IMAP_FETCH_SECONDS = registry.histogram("email_imap_fetch_seconds", "IMAP FETCH round trips", ("mode",))
+IMAP_FETCH_BYTES = registry.counter("email_imap_fetch_bytes_total", "Bytes received in FETCH responses", ("mode",))
+IMAP_FETCH_ERRORS = registry.counter("email_imap_fetch_errors_total", "FETCH commands that raised", ("mode",))
+SMTP_SEND_SECONDS = registry.histogram("email_smtp_send_seconds", "SMTP sends, one message each", ("path",))
+SMTP_SENDS = registry.counter("email_smtp_sends_total", "SMTP send outcomes", ("path", "result"))
+LIMITER_LIMIT = registry.gauge("email_limiter_concurrency_limit", "Adaptive concurrency limit (0 = none)", ("dependency",))
+LIMITER_IN_FLIGHT = registry.gauge("email_limiter_in_flight", "Calls holding a limiter slot", ("dependency",))
+LIMITER_CALLS = registry.counter("email_limiter_calls_total", "Calls through a limiter, by outcome", ("dependency", "outcome"))
+LIMITER_THROTTLED_SECONDS = registry.counter("email_limiter_throttled_seconds_total", "Time calls waited for a rate-limit token", ("dependency",))
+
+
+class Trace:
+    """Spans recorded during one workflow run: name, offset from the start and duration in milliseconds."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Dict] = []
+
+    def add(self, name: str, start: float, seconds: float, labels: Dict):
+        self.spans.append({"name": name, "start_ms": round((start - self.start) * 1000, 3),
+                           "duration_ms": round(seconds * 1000, 3), **labels})
+
+    def summary(self) -> Dict[str, Dict]:
+        """Count and total milliseconds per span name."""
+        totals: Dict[str, Dict] = {}
+        for span in self.spans:
+            entry = totals.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + span["duration_ms"], 3)
+        return totals
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def tracing(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Makes trace the active trace for this task and the tasks it starts; None leaves tracing off."""
+    if trace is None:
+        yield None
+        return
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+current_run_stats: ContextVar[Optional[Dict[str, Dict]]] = ContextVar("current_run_stats", default=None)
+
+
+@contextmanager
+def collecting_stats() -> Iterator[Dict[str, Dict]]:
+    """Yields a fresh dict that collects, per step, the stats reported in this task and the tasks it starts."""
+    stats: Dict[str, Dict] = {}
+    token = current_run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_run_stats.reset(token)
+
+
+def run_stats(step: str, **counts) -> Dict:
+    """
+    The current run's stats for step, with counts added to them: a step called once per batch (categorizing
+    in the streaming pipeline) adds up over the run. Outside collecting_stats() the dict is the call's own.
+    """
+    collected = current_run_stats.get()
+    stats = collected.setdefault(step, {}) if collected is not None else {}
+    for name, value in counts.items():
+        stats[name] = stats.get(name, 0) + value
+    return stats
+
+
+@contextmanager
+def observe(histogram: Histogram, span: Optional[str] = None, errors: Optional[Counter] = None, **labels):
+    """Times the block into histogram (and into the active trace as span), counting exceptions in errors."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.inc(**labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(span or histogram.name, start, elapsed, labels)
+
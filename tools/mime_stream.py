@@ -0,0 +1,219 @@
+import binascii
+import html
+import quopri
+import re
+from email.message import Message
+from email.parser import BytesFeedParser
+from typing import List, Optional
+
+from config import PROMPT_PREPROCESS, PROMPT_RAW_TEXT_BYTES
+
+# Per-message retention caps: header block and the encoded bytes of the one text part kept for the snippet.
+MAX_HEADER_BYTES = 64 * 1024
+MAX_TEXT_BYTES = 8 * 1024
+# Longer lines (e.g. binary junk without newlines) are dropped as they stream past; boundaries are short.
+MAX_LINE_BYTES = 8 * 1024
+# With prompt preprocessing the snippet is the raw text it cleans and trims (tools/preprocess_mail.py).
+SNIPPET_BYTES = PROMPT_RAW_TEXT_BYTES if PROMPT_PREPROCESS else 200
+
+HTML_TAG_RE = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]+>', re.IGNORECASE | re.DOTALL)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def parse_headers(block: bytes) -> Message:
+    parser = BytesFeedParser()
+    parser.feed(block)
+    return parser.close()
+
+
+def html_to_text(markup: str) -> str:
+    return WHITESPACE_RE.sub(' ', html.unescape(HTML_TAG_RE.sub(' ', markup))).strip()
+
+
+def decode_part(data: bytes, encoding: str) -> bytes:
+    encoding = encoding.strip().lower()
+    if encoding == 'base64':
+        data = b''.join(data.split())
+        # A capped capture can end mid-quantum; decode the complete 4-byte groups only.
+        return binascii.a2b_base64(data[:len(data) - len(data) % 4])
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+
+class SnippetExtractor:
+    """
+    Incremental MIME scanner that keeps only what the workflow needs from a message.
+
+    feed() takes the raw message in chunks of any size and returns True as soon as the top-level
+    headers and the first text/plain part (or, failing that, a finished text/html part) have been
+    seen, so the caller can stop downloading. Header blocks are parsed with BytesFeedParser; part
+    bodies are scanned line by line for MIME boundaries and discarded, except for the first
+    MAX_TEXT_BYTES of the chosen text part. Memory per message is bounded by the caps above,
+    whatever the size of its attachments.
+    """
+
+    def __init__(self):
+        self.headers: Optional[Message] = None
+        self.bytes_seen = 0
+        self.done = False
+        self._pending = b''
+        self._overflow = False
+        self._header_lines: List[bytes] = []
+        self._header_size = 0
+        self._boundaries: List[bytes] = []
+        # 'headers' (top-level), 'part_headers', 'skip' (ignored body or preamble), 'capture', 'capture_full' (at cap)
+        self._state = 'headers'
+        self._capture: List[bytes] = []
+        self._capture_size = 0
+        self._capture_type = ''
+        self._capture_encoding = ''
+        self._capture_charset = 'utf-8'
+        self._capture_depth = 0
+        self._plain: Optional[tuple] = None
+        self._html: Optional[tuple] = None
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.done:
+            return True
+        self.bytes_seen += len(chunk)
+        data = self._pending + chunk if self._pending else chunk
+        start = 0
+        while not self.done:
+            end = data.find(b'\n', start)
+            if end < 0:
+                break
+            if self._overflow:
+                self._overflow = False
+            else:
+                self._line(data[start:end + 1])
+            start = end + 1
+        self._pending = data[start:]
+        if len(self._pending) > MAX_LINE_BYTES:
+            self._pending = b''
+            self._overflow = True
+        return self.done
+
+    def close(self) -> bool:
+        """Flushes a final unterminated line; call once the whole message (or all of the fetched part) was fed."""
+        if self._pending and not self.done and not self._overflow:
+            self._line(self._pending)
+        self._pending = b''
+        self._finish_capture()
+        if self.headers is None and self._header_lines:
+            self.headers = parse_headers(b''.join(self._header_lines))
+        self.done = True
+        return True
+
+    def _line(self, line: bytes):
+        if self._state in ('headers', 'part_headers'):
+            if line.strip():
+                if self._header_size < MAX_HEADER_BYTES:
+                    self._header_lines.append(line)
+                    self._header_size += len(line)
+                return
+            self._start_body(parse_headers(b''.join(self._header_lines)))
+            return
+        boundary = self._match_boundary(line)
+        if boundary is not None:
+            depth, closing = boundary
+            self._finish_capture()
+            del self._boundaries[depth + 1:]
+            if closing:
+                self._boundaries.pop()
+                if self._html is not None and self._html[3] > len(self._boundaries):
+                    # The container holding the HTML part is complete without a text/plain sibling.
+                    self.done = True
+                    return
+                self._state = 'skip'
+            else:
+                self._state = 'part_headers'
+                self._header_lines = []
+                self._header_size = 0
+            return
+        if self._state == 'capture':
+            self._capture.append(line)
+            self._capture_size += len(line)
+            if self._capture_size >= MAX_TEXT_BYTES:
+                # Enough text for any snippet; a text/plain part ends the scan, an HTML one keeps looking for plain.
+                if self._capture_type == 'text/plain':
+                    self._finish_capture()
+                else:
+                    self._state = 'capture_full'
+
+
+    def _match_boundary(self, line: bytes):
+        if not self._boundaries or not line.startswith(b'--'):
+            return None
+        stripped = line.rstrip()
+        for depth in range(len(self._boundaries) - 1, -1, -1):
+            marker = b'--' + self._boundaries[depth]
+            if stripped == marker:
+                return depth, False
+            if stripped == marker + b'--':
+                return depth, True
+        return None
+
+    def _start_body(self, part: Message):
+        if self.headers is None:
+            self.headers = part
+        self._header_lines = []
+        self._header_size = 0
+        content_type = part.get_content_type()
+        if part.get_content_maintype() == 'multipart':
+            boundary = part.get_boundary()
+            if boundary:
+                self._boundaries.append(boundary.encode('latin-1', errors='ignore'))
+            self._state = 'skip'
+        elif content_type == 'text/plain' and self._plain is None and not part.get_filename():
+            self._begin_capture(part, content_type)
+        elif content_type == 'text/html' and self._html is None and self._plain is None and not part.get_filename():
+            self._begin_capture(part, content_type)
+        else:
+            self._state = 'skip'
+
+    def _begin_capture(self, part: Message, content_type: str):
+        self._state = 'capture'
+        self._capture = []
+        self._capture_size = 0
+        self._capture_type = content_type
+        self._capture_encoding = part.get('Content-Transfer-Encoding', '')
+        self._capture_charset = part.get_content_charset() or 'utf-8'
+        self._capture_depth = len(self._boundaries)
+
+    def _finish_capture(self):
+        if self._state not in ('capture', 'capture_full'):
+            return
+        self._state = 'skip'
+        data = b''.join(self._capture)
+        # The line break before a boundary belongs to the boundary, not to the part.
+        if data.endswith(b'\r\n'):
+            data = data[:-2]
+        elif data.endswith(b'\n'):
+            data = data[:-1]
+        captured = (data, self._capture_encoding, self._capture_charset, self._capture_depth)
+        self._capture = []
+        if self._capture_type == 'text/plain':
+            self._plain = captured
+            self.done = True
+        else:
+            self._html = captured
+
+    def snippet(self) -> str:
+        """First SNIPPET_BYTES of decoded text: the text/plain part, or the HTML part converted to text."""
+        for captured, is_html in ((self._plain, False), (self._html, True)):
+            if captured is None:
+                continue
+            data, encoding, charset, _ = captured
+            try:
+                payload = decode_part(data, encoding)
+            except (binascii.Error, ValueError):
+                continue
+            try:
+                ''.encode(charset)
+            except LookupError:
+                charset = 'utf-8'
+            if is_html:
+                return html_to_text(payload.decode(charset, errors='ignore'))[:SNIPPET_BYTES]
+            return payload[:SNIPPET_BYTES].decode(charset, errors='ignore')
+        return ''
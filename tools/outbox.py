@@ -0,0 +1,430 @@
+"""
+Outbox storage for scheduled replies.
+
+OutboxBackend is the interface schedule_mail.py talks to. JsonOutbox keeps the original
+scheduled_emails.json behaviour; SqliteOutbox stores messages in a WAL-mode SQLite database
+with indexes on (sent, scheduled_ts) and on a dedup key, and claims due messages atomically
+so the scheduler thread and request handlers can share it safely.
+
+A reply is a duplicate when the outbox already holds a reply to the same Message-ID (see reply_key);
+both backends check that with one hashed lookup, however long the history. Each reply gets its own
+Message-ID, In-Reply-To and References headers when it is scheduled.
+
+One-shot migration from the JSON file:
+    python -m tools.outbox migrate [json_path] [db_path]
+"""
+
+import datetime
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import EMAIL_ADDRESS, OUTBOX_BACKEND, OUTBOX_BLOOM_CAPACITY, OUTBOX_BLOOM_ERROR_RATE, OUTBOX_BLOOM_FILTER, OUTBOX_DB_FILE
+from tools.bloom import BloomFilter
+from tools.mail_headers import new_message_id, normalize_message_id, reply_references
+from tools.records import ScheduledMessage, dumps, loads
+
+SCHEDULED_MAIL_FILE = os.path.join(os.path.dirname(__file__), "scheduled_emails.json")
+DEFAULT_DB_FILE = OUTBOX_DB_FILE or os.path.join(os.path.dirname(__file__), "outbox.sqlite3")
+
+# A claimed message that is neither marked sent nor released within this many seconds
+# (e.g. the sender crashed) becomes claimable again.
+CLAIM_LEASE_SECONDS = 300
+
+
+def reply_key(in_reply_to: Optional[str], sender: Optional[str], subject: Optional[str]) -> str:
+    """
+    Dedup key of a reply: the Message-ID of the email it answers, so a second message in a thread
+    ("Re: invoice" again) gets its own reply. Without a Message-ID it falls back to sender and subject,
+    the key every reply had before.
+    """
+    if in_reply_to:
+        raw = f"id\0{in_reply_to}"
+    else:
+        raw = f"{sender or ''}\0{subject or ''}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def dedup_key(email: Dict) -> str:
+    """Key under which two scheduled replies to email count as duplicates."""
+    return reply_key(normalize_message_id(email.get("message_id")), email.get("from"), email.get("subject"))
+
+
+def legacy_key(email: Dict) -> str:
+    """
+    The sender+subject key. Replies stored without an In-Reply-To (older outboxes, emails without a
+    Message-ID) only have this one, so an email is also checked against it, but only against such replies.
+    """
+    return reply_key(None, email.get("from"), email.get("subject"))
+
+
+def reply_fields(email: Dict) -> Tuple[Optional[str], str, Optional[str]]:
+    """In-Reply-To, a new Message-ID and References for a reply to email."""
+    return (normalize_message_id(email.get("message_id")) or None,
+            new_message_id(email.get("account") or EMAIL_ADDRESS),
+            reply_references(email) or None)
+
+
+def parse_send_time(send_time: str) -> float:
+    """ISO-8601 send time to a UTC epoch timestamp; naive times are taken as UTC."""
+    scheduled = datetime.datetime.fromisoformat(send_time)
+    if scheduled.tzinfo is None:
+        scheduled = scheduled.replace(tzinfo=datetime.timezone.utc)
+    return scheduled.timestamp()
+
+
+class OutboxBackend:
+    def add(self, email: Dict, send_time: str) -> Optional[int]:
+        """Stores a reply to be sent at send_time. Returns its id, or None if it is a duplicate."""
+        raise NotImplementedError
+
+    def is_duplicate(self, email: Dict) -> bool:
+        raise NotImplementedError
+
+    def due(self, now: Optional[float] = None) -> List[ScheduledMessage]:
+        """Unsent messages whose scheduled time has passed."""
+        raise NotImplementedError
+
+    def claim_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[ScheduledMessage]:
+        """Atomically marks due messages as in-flight and returns them; no other caller gets the same ones."""
+        raise NotImplementedError
+
+    def release(self, email_ids: Iterable[int]):
+        """Returns claimed but unsent messages to the queue (e.g. after a failed send)."""
+        raise NotImplementedError
+
+    def mark_sent(self, email_ids: Iterable[int]):
+        raise NotImplementedError
+
+    def next_due_time(self) -> Optional[float]:
+        """Earliest scheduled_ts among unsent, unclaimed messages, or None if there are none."""
+        raise NotImplementedError
+
+    def all(self) -> List[ScheduledMessage]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        return len(self.all())
+
+
+class JsonOutbox(OutboxBackend):
+    """The original single-file store: every operation reads (and writes) the whole file, as compact JSON."""
+
+    def __init__(self, path: str = SCHEDULED_MAIL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # Dedup keys of the file as last read or written, and the (mtime, size) they belong to.
+        self._keys: Optional[Tuple[Set[str], Set[str]]] = None
+        self._keys_stamp = None
+
+    def _load(self) -> List[ScheduledMessage]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            return [ScheduledMessage.from_dict(record) for record in loads(f.read())]
+
+    def _save(self, emails: List[ScheduledMessage]):
+        with open(self.path, "wb") as f:
+            f.write(dumps(emails))
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _dedup_keys(self) -> Tuple[Set[str], Set[str]]:
+        """All reply keys, and the keys of replies without an In-Reply-To; re-read only when the file changed."""
+        stamp = self._stamp()
+        if self._keys is None or stamp != self._keys_stamp:
+            keys, legacy = set(), set()
+            for scheduled in self._load():
+                key = reply_key(normalize_message_id(scheduled.in_reply_to), scheduled.sender, scheduled.subject)
+                keys.add(key)
+                if not scheduled.in_reply_to:
+                    legacy.add(key)
+            self._keys, self._keys_stamp = (keys, legacy), stamp
+        return self._keys
+
+    def is_duplicate(self, email: Dict) -> bool:
+        keys, legacy = self._dedup_keys()
+        return dedup_key(email) in keys or legacy_key(email) in legacy
+
+    def add(self, email: Dict, send_time: str) -> Optional[int]:
+        with self._lock:
+            if self.is_duplicate(email):
+                return None
+            emails = self._load()
+            email_id = len(emails) + 1
+            in_reply_to, message_id, references = reply_fields(email)
+            emails.append(ScheduledMessage(
+                id=email_id,
+                to=email.get("to"),
+                sender=email.get("from"),
+                subject=email.get("subject"),
+                body=email.get("draft"),
+                scheduled_time=send_time,
+                in_reply_to=in_reply_to,
+                account=email.get("account"),
+                message_id=message_id,
+                references=references
+            ))
+            self._save(emails)
+            # is_duplicate() above brought the keys up to date; record this reply without re-reading the file.
+            keys, legacy = self._keys
+            key = dedup_key(email)
+            keys.add(key)
+            if not in_reply_to:
+                legacy.add(key)
+            self._keys_stamp = self._stamp()
+            return email_id
+
+    def due(self, now: Optional[float] = None) -> List[ScheduledMessage]:
+        now = time.time() if now is None else now
+        return [e for e in self._load() if not e.sent and parse_send_time(e.scheduled_time) <= now]
+
+    def claim_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[ScheduledMessage]:
+        # Single process only: the lock is the claim.
+        with self._lock:
+            due = self.due(now)
+            return due[:limit] if limit else due
+
+    def release(self, email_ids: Iterable[int]):
+        pass
+
+    def mark_sent(self, email_ids: Iterable[int]):
+        ids = set(email_ids)
+        with self._lock:
+            emails = self._load()
+            for email in emails:
+                if email.id in ids:
+                    email.sent = True
+            self._save(emails)
+
+    def next_due_time(self) -> Optional[float]:
+        pending = [parse_send_time(e.scheduled_time) for e in self._load() if not e.sent]
+        return min(pending) if pending else None
+
+    def all(self) -> List[ScheduledMessage]:
+        return self._load()
+
+
+class SqliteOutbox(OutboxBackend):
+    COLUMNS = "id, to_addr, from_addr, subject, body, scheduled_time, sent, in_reply_to, account, message_id, reference_ids"
+
+    def __init__(self, path: str = DEFAULT_DB_FILE, bloom_capacity: int = 0):
+        """
+        With bloom_capacity, the dedup keys are also kept in a Bloom filter sized for that many replies,
+        so is_duplicate() answers for new mail without a query. The filter only knows replies scheduled
+        through this process (and those present when it opened); add() always checks the database.
+        """
+        self.path = path
+        self._local = threading.local()
+        self._create()
+        self.bloom: Optional[BloomFilter] = None
+        if bloom_capacity:
+            self.bloom = BloomFilter(bloom_capacity, OUTBOX_BLOOM_ERROR_RATE)
+            self.bloom.update(key for (key,) in self._conn().execute("SELECT dedup_key FROM scheduled_emails"))
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread: the APScheduler thread and the event loop each get their own.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create(self):
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS scheduled_emails (
+                id INTEGER PRIMARY KEY,
+                to_addr TEXT,
+                from_addr TEXT,
+                subject TEXT,
+                body TEXT,
+                scheduled_time TEXT NOT NULL,
+                scheduled_ts REAL NOT NULL,
+                sent INTEGER NOT NULL DEFAULT 0,
+                claimed_at REAL,
+                sent_at REAL,
+                dedup_key TEXT NOT NULL UNIQUE,
+                in_reply_to TEXT,
+                account TEXT,
+                message_id TEXT,
+                reference_ids TEXT
+            );
+            CREATE INDEX IF NOT EXISTS scheduled_emails_due ON scheduled_emails (sent, scheduled_ts);
+        """)
+        columns = {row[1] for row in self._conn().execute("PRAGMA table_info(scheduled_emails)")}
+        if "in_reply_to" not in columns:
+            # Databases created before replies recorded the Message-ID they answer.
+            self._conn().execute("ALTER TABLE scheduled_emails ADD COLUMN in_reply_to TEXT")
+        if "account" not in columns:
+            # Databases created before replies recorded the account they are sent from.
+            self._conn().execute("ALTER TABLE scheduled_emails ADD COLUMN account TEXT")
+        if "message_id" not in columns:
+            # Databases created before replies had threading headers and dedup used Message-IDs:
+            # replies that know their In-Reply-To are rekeyed, the rest keep their sender+subject key.
+            conn = self._conn()
+            conn.execute("BEGIN")
+            conn.execute("ALTER TABLE scheduled_emails ADD COLUMN message_id TEXT")
+            conn.execute("ALTER TABLE scheduled_emails ADD COLUMN reference_ids TEXT")
+            rows = conn.execute("SELECT id, in_reply_to FROM scheduled_emails WHERE in_reply_to IS NOT NULL").fetchall()
+            conn.executemany("UPDATE OR IGNORE scheduled_emails SET dedup_key = ? WHERE id = ?",
+                             [(reply_key(normalize_message_id(in_reply_to), None, None), email_id)
+                              for email_id, in_reply_to in rows])
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_message(row) -> ScheduledMessage:
+        return ScheduledMessage(row[0], row[1], row[2], row[3], row[4], row[5], bool(row[6]), row[7], row[8],
+                                row[9], row[10])
+
+    def add(self, email: Dict, send_time: str) -> Optional[int]:
+        # The UNIQUE dedup_key makes check-and-insert a single atomic statement; NOT EXISTS adds the
+        # check against replies stored without an In-Reply-To to the same statement.
+        key = dedup_key(email)
+        in_reply_to, message_id, references = reply_fields(email)
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO scheduled_emails"
+            " (to_addr, from_addr, subject, body, scheduled_time, scheduled_ts, dedup_key, in_reply_to, account,"
+            "  message_id, reference_ids)"
+            " SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?"
+            " WHERE NOT EXISTS (SELECT 1 FROM scheduled_emails WHERE dedup_key = ? AND in_reply_to IS NULL)",
+            (email.get("to"), email.get("from"), email.get("subject"), email.get("draft"),
+             send_time, parse_send_time(send_time), key, in_reply_to, email.get("account"),
+             message_id, references, legacy_key(email)),
+        )
+        if not cursor.rowcount:
+            return None
+        if self.bloom is not None:
+            self.bloom.add(key)
+        return cursor.lastrowid
+
+    def is_duplicate(self, email: Dict) -> bool:
+        key, legacy = dedup_key(email), legacy_key(email)
+        if self.bloom is not None and key not in self.bloom and legacy not in self.bloom:
+            return False
+        row = self._conn().execute(
+            "SELECT 1 FROM scheduled_emails WHERE dedup_key = ? OR (dedup_key = ? AND in_reply_to IS NULL) LIMIT 1",
+            (key, legacy),
+        ).fetchone()
+        return row is not None
+
+    def due(self, now: Optional[float] = None) -> List[ScheduledMessage]:
+        now = time.time() if now is None else now
+        rows = self._conn().execute(
+            f"SELECT {self.COLUMNS} FROM scheduled_emails WHERE sent = 0 AND scheduled_ts <= ? ORDER BY scheduled_ts",
+            (now,),
+        ).fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    def claim_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[ScheduledMessage]:
+        now = time.time() if now is None else now
+        rows = self._conn().execute(
+            f"UPDATE scheduled_emails SET claimed_at = ?"
+            f" WHERE id IN (SELECT id FROM scheduled_emails"
+            f"  WHERE sent = 0 AND scheduled_ts <= ? AND (claimed_at IS NULL OR claimed_at < ?)"
+            f"  ORDER BY scheduled_ts LIMIT ?)"
+            f" RETURNING {self.COLUMNS}",
+            (now, now, now - CLAIM_LEASE_SECONDS, -1 if limit is None else limit),
+        ).fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    def release(self, email_ids: Iterable[int]):
+        self._conn().executemany(
+            "UPDATE scheduled_emails SET claimed_at = NULL WHERE id = ? AND sent = 0",
+            [(email_id,) for email_id in email_ids],
+        )
+
+    def mark_sent(self, email_ids: Iterable[int]):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "UPDATE scheduled_emails SET sent = 1, sent_at = ?, claimed_at = NULL WHERE id = ?",
+            [(now, email_id) for email_id in email_ids],
+        )
+        conn.execute("COMMIT")
+
+    def next_due_time(self) -> Optional[float]:
+        # MIN over the (sent, scheduled_ts) index: a single index seek, independent of history size.
+        row = self._conn().execute(
+            "SELECT MIN(scheduled_ts) FROM scheduled_emails WHERE sent = 0 AND claimed_at IS NULL"
+        ).fetchone()
+        return row[0]
+
+    def all(self) -> List[ScheduledMessage]:
+        rows = self._conn().execute(f"SELECT {self.COLUMNS} FROM scheduled_emails ORDER BY id").fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM scheduled_emails").fetchone()[0]
+
+
+def migrate_json_to_sqlite(json_path: str = SCHEDULED_MAIL_FILE, db_path: str = DEFAULT_DB_FILE) -> int:
+    """
+    Copies every record from the JSON outbox into the SQLite outbox, keeping ids and sent flags.
+    Safe to re-run: records already present (same id or same dedup key) are skipped.
+    Returns the number of records copied.
+    """
+    source = JsonOutbox(json_path).all()
+    target = SqliteOutbox(db_path)
+    conn = target._conn()
+    copied = 0
+    conn.execute("BEGIN")
+    for record in source:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO scheduled_emails"
+            " (id, to_addr, from_addr, subject, body, scheduled_time, scheduled_ts, sent, dedup_key, in_reply_to, account,"
+            "  message_id, reference_ids)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record.id, record.to, record.sender, record.subject, record.body,
+             record.scheduled_time, parse_send_time(record.scheduled_time), int(bool(record.sent)),
+             reply_key(normalize_message_id(record.in_reply_to), record.sender, record.subject),
+             record.in_reply_to, record.account, record.message_id, record.references),
+        )
+        copied += cursor.rowcount
+    conn.execute("COMMIT")
+    return copied
+
+
+_outbox: Optional[OutboxBackend] = None
+
+
+def get_outbox() -> OutboxBackend:
+    """The process-wide outbox selected by OUTBOX_BACKEND ('sqlite' or 'json')."""
+    global _outbox
+    if _outbox is None:
+        if OUTBOX_BACKEND == "json":
+            _outbox = JsonOutbox()
+        else:
+            if not os.path.exists(DEFAULT_DB_FILE) and os.path.exists(SCHEDULED_MAIL_FILE):
+                copied = migrate_json_to_sqlite(SCHEDULED_MAIL_FILE, DEFAULT_DB_FILE)
+                if copied:
+                    print(f"[OUTBOX] Migrated {copied} scheduled emails from {SCHEDULED_MAIL_FILE}")
+            # Opened after the migration, so the Bloom filter is loaded with the migrated replies' keys too.
+            _outbox = SqliteOutbox(DEFAULT_DB_FILE, bloom_capacity=OUTBOX_BLOOM_CAPACITY if OUTBOX_BLOOM_FILTER else 0)
+    return _outbox
+
+
+def set_outbox(outbox: Optional[OutboxBackend]):
+    """Replaces the process-wide outbox (None re-reads OUTBOX_BACKEND on next use)."""
+    global _outbox
+    _outbox = outbox
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print(__doc__)
+        sys.exit(1)
+    json_path = sys.argv[2] if len(sys.argv) > 2 else SCHEDULED_MAIL_FILE
+    db_path = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_DB_FILE
+    print(f"[OUTBOX] Migrated {migrate_json_to_sqlite(json_path, db_path)} records from {json_path} to {db_path}")
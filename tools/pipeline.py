@@ -0,0 +1,195 @@
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from config import PIPELINE_QUEUE_SIZE, PIPELINE_CATEGORIZE_WORKERS, PIPELINE_DRAFT_WORKERS, DRAFT_TIMEOUT_SECONDS, PROMPT_PREPROCESS
+from tools.categorize_mail import categorize_emails
+from tools.draft_mail import draft_template, draft_with_timeout, partial_draft_event
+from tools.preprocess_mail import preprocess_emails
+from tools.route_mail import route_email, summarize_routing
+from tools.records import EmailRecord
+from tools.metrics import run_stats
+from tools.schedule_mail import schedule_email_send
+
+
+class EmailPipeline:
+    """
+    Streams emails through categorize -> draft -> schedule instead of running each stage over the whole list.
+
+    The reader feeds a bounded queue per stage, each drained by its own workers, so IMAP fetches, LLM calls
+    and scheduling overlap. Categorize workers take whatever has queued up (at most queue_size emails),
+    classify it with one categorize_emails call, so CATEGORIZE_BATCH_MODE still packs prompts, and route each
+    email by CATEGORY_POLICY; only emails routed to "draft" visit the draft workers, which handle one each.
+    Scheduling is a single worker that schedules emails in the order they were read, holding back early
+    finishers, so duplicate detection and the returned list match the batch graph exactly.
+    After each run, stats holds its timings (seconds from start, e.g. to the first scheduled reply); they are
+    also the run's "pipeline" stats (see metrics.run_stats).
+    """
+
+    def __init__(self, tone: str = "polite", send_time: str = None, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 categorize_workers: int = PIPELINE_CATEGORIZE_WORKERS, draft_workers: int = PIPELINE_DRAFT_WORKERS,
+                 draft_timeout: float = DRAFT_TIMEOUT_SECONDS, progress: Optional[Callable[[Dict], None]] = None,
+                 schedule_lock: Optional[asyncio.Lock] = None):
+        self.tone = tone
+        self.draft_template = draft_template(tone)
+        self.progress = progress
+        self.schedule_lock = schedule_lock or asyncio.Lock()
+        self.send_time = send_time
+        self.queue_size = max(1, queue_size)
+        self.categorize_workers = max(1, categorize_workers)
+        self.draft_workers = max(1, draft_workers)
+        self.draft_timeout = draft_timeout
+        self._start = 0.0
+        self._first_read: Optional[float] = None
+        self._first_scheduled: Optional[float] = None
+        self._error: Optional[Exception] = None
+        self.stats: Dict = {}
+
+    def _emit(self, stage: str, index: int, mail: EmailRecord):
+        if self.progress is not None:
+            self.progress({"type": "email", "stage": stage, "index": index, "email": mail.to_dict()})
+
+    def _failed(self, stage: str, index: int, error: Exception):
+        # The email carries on (unscheduled, if it gets that far); run() raises the first error once drained.
+        print(f"[PIPELINE] {stage} failed for email {index}: {error}")
+        if self._error is None:
+            self._error = error
+
+    async def _categorize_worker(self, inbox: asyncio.Queue, outbox: asyncio.Queue, bypass: asyncio.Queue):
+        while True:
+            group = [await inbox.get()]
+            while len(group) < self.queue_size and not inbox.empty():
+                group.append(inbox.get_nowait())
+            try:
+                await categorize_emails([mail for _, mail in group])
+            except Exception as e:
+                for _, mail in group:
+                    if mail.category is None:
+                        mail.category = f"[LLM Error: {e}]"
+            for item in group:
+                try:
+                    action = None
+                    try:
+                        action = route_email(item[1])
+                        self._emit("route_mail", *item)
+                    except Exception as e:
+                        self._failed("route_mail", item[0], e)
+                    # Emails not routed to "draft" go straight to the scheduling stage, which passes them through.
+                    await (outbox if action == "draft" else bypass).put(item)
+                finally:
+                    inbox.task_done()
+
+    async def _draft_worker(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        while True:
+            index, mail = await inbox.get()
+            try:
+                on_partial = None
+                if self.progress is not None:
+                    on_partial = lambda text, done, index=index, mail=mail: self.progress(partial_draft_event(index, mail, text, done))
+                try:
+                    mail.draft = await draft_with_timeout(mail, self.tone, self.draft_timeout, on_partial, self.draft_template)
+                except Exception as e:
+                    # Left without a draft, so it is never scheduled (see schedule_email_send).
+                    print(f"[PIPELINE] draft_mail failed for email {index}: {e}")
+                    run_stats("drafting", failed=1)
+                    mail.draft = None
+                try:
+                    self._emit("draft_mail", index, mail)
+                except Exception as e:
+                    self._failed("draft_mail", index, e)
+                await outbox.put((index, mail))
+            finally:
+                inbox.task_done()
+
+    async def _schedule_worker(self, inbox: asyncio.Queue):
+        pending: Dict[int, EmailRecord] = {}
+        next_index = 0
+        while True:
+            index, mail = await inbox.get()
+            try:
+                pending[index] = mail
+                while next_index in pending:
+                    ready = pending.pop(next_index)
+                    try:
+                        if ready.action != "draft":
+                            ready.scheduled = False
+                        else:
+                            ready.to = ready.sender
+                            async with self.schedule_lock:
+                                ready.scheduled = schedule_email_send(ready, self.send_time)
+                            if self._first_scheduled is None:
+                                self._first_scheduled = time.perf_counter() - self._start
+                        self._emit("schedule_mail", next_index, ready)
+                    except Exception as e:
+                        if ready.scheduled is None:
+                            ready.scheduled = False
+                        self._failed("schedule_mail", next_index, e)
+                    next_index += 1
+            finally:
+                inbox.task_done()
+
+    @staticmethod
+    async def _unless_stopped(awaitable: Awaitable, workers: List[asyncio.Task]):
+        """Awaits awaitable, raising instead if a worker dies first (its queue would never drain)."""
+        waiting = asyncio.ensure_future(awaitable)
+        try:
+            done, _ = await asyncio.wait([waiting, *workers], return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            waiting.cancel()
+            raise
+        if waiting not in done:
+            waiting.cancel()
+            for worker in done:
+                worker.result()
+            raise RuntimeError("pipeline worker stopped")
+        return waiting.result()
+
+    async def run(self, source: AsyncIterator[EmailRecord]) -> List[EmailRecord]:
+        """
+        Consumes source and returns the processed emails in the order they were read.
+        An error in a later step (e.g. an invalid send_time) is raised once every email has gone through.
+        """
+        self._start = time.perf_counter()
+        self._first_read = self._first_scheduled = None
+        self._error = None
+        to_categorize: asyncio.Queue = asyncio.Queue(self.queue_size)
+        to_draft: asyncio.Queue = asyncio.Queue(self.queue_size)
+        to_schedule: asyncio.Queue = asyncio.Queue(self.queue_size)
+        workers = (
+            [asyncio.ensure_future(self._categorize_worker(to_categorize, to_draft, to_schedule)) for _ in range(self.categorize_workers)]
+            + [asyncio.ensure_future(self._draft_worker(to_draft, to_schedule)) for _ in range(self.draft_workers)]
+            + [asyncio.ensure_future(self._schedule_worker(to_schedule))]
+        )
+        emails: List[EmailRecord] = []
+        try:
+            async for mail in source:
+                if self._first_read is None:
+                    self._first_read = time.perf_counter() - self._start
+                if PROMPT_PREPROCESS:
+                    preprocess_emails([mail], log=False)
+                self._emit("read_mail", len(emails), mail)
+                await self._unless_stopped(to_categorize.put((len(emails), mail)), workers)
+                emails.append(mail)
+            # Each stage is drained before the next is waited on, so no item is still in flight upstream.
+            for queue in (to_categorize, to_draft, to_schedule):
+                await self._unless_stopped(queue.join(), workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if self._error is not None:
+            raise self._error
+
+        summarize_routing(emails)
+        elapsed = time.perf_counter() - self._start
+        self.stats = run_stats("pipeline")
+        self.stats.update({
+            "emails": len(emails),
+            "seconds": round(elapsed, 4),
+            "first_read_seconds": round(self._first_read, 4) if self._first_read is not None else None,
+            "first_scheduled_seconds": round(self._first_scheduled, 4) if self._first_scheduled is not None else None,
+        })
+        first_scheduled = self.stats['first_scheduled_seconds']
+        print(f"[PIPELINE] {len(emails)} emails in {self.stats['seconds']}s, "
+              + (f"first reply scheduled after {first_scheduled}s" if first_scheduled is not None else "no replies scheduled"))
+        return emails
@@ -0,0 +1,139 @@
+"""
+Prompt preprocessing: cuts each email's text down to what its sender actually wrote before it reaches an
+LLM prompt. Quoted replies (">" lines and everything after an "On ... wrote:" or Outlook header), signatures,
+disclaimers, tracking links and newsletter boilerplate are dropped, whitespace is collapsed, and the result
+is trimmed to a token budget.
+"""
+
+import re
+import time
+from typing import List
+
+from config import PROMPT_BODY_TOKENS
+from tools.metrics import estimate_tokens, run_stats
+
+# A reply's attribution line; it can wrap, so it is matched against a line joined with the next one.
+ATTRIBUTION_RE = re.compile(
+    r'^(on\b.{5,200}\b(wrote|writes)|le\b.{5,200}\ba écrit|am\b.{5,200}\bschrieb|el\b.{5,200}\bescribió)\s*:\s*$',
+    re.IGNORECASE)
+# Separators that start a forwarded or Outlook-style quoted message; everything below is history.
+SEPARATOR_RE = re.compile(r'^(-{2,}\s*(original message|forwarded message)\s*-{2,}|_{10,}|-{10,}|begin forwarded message:)',
+                          re.IGNORECASE)
+OUTLOOK_HEADER_RE = re.compile(r'^\*?(from|von|de):\*?\s', re.IGNORECASE)
+OUTLOOK_FIELD_RE = re.compile(r'^\*?(sent|date|to|subject|gesendet|envoyé):\*?\s', re.IGNORECASE)
+# The RFC 3676 signature delimiter, client footers and legal disclaimers: the message ends before them.
+SIGNATURE_RE = re.compile(
+    r'^(--\s*$|sent from my\b|sent from (mail|outlook) for\b|get outlook for\b|'
+    r'(confidentiality|privileged)( and confidentiality)? notice|this (e-?mail|message)( and any attachments)? (is|are|may be) confidential)',
+    re.IGNORECASE)
+# Sign-offs: when one is among the last few lines, the name and title lines below it are dropped with it.
+CLOSING_RE = re.compile(r'^(best|kind|warm|many thanks|thanks|thank you|regards|cheers|sincerely|best wishes|yours)\b[\w ,.!]{0,30}$',
+                        re.IGNORECASE)
+CLOSING_WINDOW_LINES = 6
+# A salutation on the first line says nothing the From header does not.
+GREETING_RE = re.compile(r'^(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^.!?]{0,40}[,!:]?$', re.IGNORECASE)
+# Newsletter and tracking boilerplate lines.
+BOILERPLATE_RE = re.compile(
+    r'(view (this email )?in (your )?browser|unsubscribe|update your (email )?preferences|manage (your )?subscription|'
+    r'you are receiving this|you received this (email|message) because|add us to your address book)',
+    re.IGNORECASE)
+URL_RE = re.compile(r'https?://([^/\s<>"\')]+)[^\s<>"\')]*', re.IGNORECASE)
+IMAGE_RE = re.compile(r'\[(image|cid):[^\]]*\]', re.IGNORECASE)
+# Zero-width and other invisible characters that marketing mail pads its preview text with.
+INVISIBLE_RE = re.compile('[\u00ad\u034f\u200b-\u200f\u2060-\u2064\ufeff]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def strip_quoted(lines: List[str]) -> List[str]:
+    """The lines before the quoted history: ">" lines are dropped, and an attribution or separator ends the message."""
+    kept = []
+    skip = 0
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if skip or stripped.startswith('>'):
+            skip = max(0, skip - 1)
+            continue
+        joined = f"{stripped} {lines[index + 1].strip()}" if index + 1 < len(lines) else stripped
+        span = 1 if ATTRIBUTION_RE.match(stripped) else 2 if ATTRIBUTION_RE.match(joined) else 0
+        if span:
+            # Interleaved replies quote with ">" and answer below; "wrote:" over unmarked history ends the message.
+            following = next((rest.strip() for rest in lines[index + span:] if rest.strip()), "")
+            if following.startswith('>'):
+                skip = span - 1
+                continue
+            break
+        if SEPARATOR_RE.match(stripped):
+            break
+        if OUTLOOK_HEADER_RE.match(stripped) and any(OUTLOOK_FIELD_RE.match(rest.strip()) for rest in lines[index + 1:index + 4]):
+            break
+        kept.append(line)
+    return kept
+
+
+def strip_signature(lines: List[str]) -> List[str]:
+    """The lines before the signature, client footer or disclaimer, without a trailing sign-off block."""
+    for index, line in enumerate(lines):
+        if SIGNATURE_RE.match(line.strip()):
+            lines = lines[:index]
+            break
+    content = [index for index, line in enumerate(lines) if line.strip()]
+    for index in content[-CLOSING_WINDOW_LINES:]:
+        # Only a sign-off with something above it: "Thanks!" on its own is the message.
+        if CLOSING_RE.match(lines[index].strip()) and index > content[0]:
+            return lines[:index]
+    return lines
+
+
+def strip_tracking(text: str) -> str:
+    """Links shortened to their host, image placeholders and invisible padding removed."""
+    text = INVISIBLE_RE.sub('', text.replace('\u00a0', ' '))
+    text = IMAGE_RE.sub(' ', text)
+    return URL_RE.sub(lambda match: match.group(1).lower(), text)
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """text cut to about budget tokens (see estimate_tokens), at a word boundary; budget 0 means no limit."""
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return text
+    cut = text[:budget * 4]
+    space = cut.rfind(' ')
+    return (cut[:space] if space > len(cut) // 2 else cut).rstrip(' ,;:') + '…'
+
+
+def clean_text(text: str, token_budget: int = PROMPT_BODY_TOKENS) -> str:
+    """What the sender wrote, on one line and within token_budget tokens."""
+    if not text:
+        return ''
+    lines = strip_tracking(text).replace('\r\n', '\n').split('\n')
+    lines = [line for line in strip_signature(strip_quoted(lines)) if not BOILERPLATE_RE.search(line)]
+    content = [index for index, line in enumerate(lines) if line.strip()]
+    if len(content) > 1 and GREETING_RE.match(lines[content[0]].strip()):
+        del lines[content[0]]
+    cleaned = WHITESPACE_RE.sub(' ', ' '.join(lines)).strip()
+    if not cleaned:
+        # All of it looked like history or boilerplate: better the tidied original than nothing.
+        cleaned = WHITESPACE_RE.sub(' ', strip_tracking(text)).strip()
+    return truncate_tokens(cleaned, token_budget)
+
+
+def preprocess_emails(emails: List, token_budget: int = PROMPT_BODY_TOKENS, log: bool = True) -> List:
+    """
+    Replaces each email's snippet with clean_text(snippet) and adds the token savings to the run's "preprocess" stats.
+    log=False leaves out the [PREPROCESS] line, for callers that go one email at a time (the streaming pipeline).
+    """
+    start = time.perf_counter()
+    before = after = 0
+    for mail in emails:
+        snippet = mail.get('snippet') or ''
+        cleaned = clean_text(snippet, token_budget)
+        before += estimate_tokens(snippet)
+        after += estimate_tokens(cleaned)
+        mail['snippet'] = cleaned
+    stats = run_stats("preprocess", emails=len(emails), tokens_before=before, tokens_after=after,
+                      seconds=time.perf_counter() - start)
+    stats["seconds"] = round(stats["seconds"], 4)
+    stats["tokens_per_email"] = round(stats["tokens_after"] / stats["emails"], 1) if stats["emails"] else 0.0
+    if log and emails:
+        print(f"[PREPROCESS] {len(emails)} emails: body tokens {before} -> {after} "
+              f"({round(after / len(emails), 1)} per email)")
+    return emails
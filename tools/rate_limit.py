@@ -0,0 +1,235 @@
+"""
+Rate limits and adaptive concurrency for the external dependencies: IMAP commands, LLM calls, SMTP sends.
+
+Every call to a dependency runs inside `async with limiter.slot():` of that dependency's Limiter
+(imap_limiter, smtp_limiter, and llm_client.limiter). A slot first takes a token from a token bucket
+that refills at rate_per_minute up to burst tokens (0: no rate limit), then waits until fewer than
+`limit` calls are in flight. The limit adapts by AIMD: a call that returns within latency_target
+seconds adds 1/limit (one more slot per round of successful calls), up to max_concurrency; an error or
+a slower call halves it, down to min_concurrency. Only calls that started after the last cut can cut
+it again, so one burst of failures halves the limit once rather than once per failed call.
+
+These limits are per dependency and process-wide; the per-host connection caps in tools/coordination.py
+still apply underneath. GET /limiter_stats and the email_limiter_* metrics show their state.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from config import (IMAP_COMMANDS_PER_MINUTE, IMAP_COMMAND_BURST, IMAP_MAX_CONCURRENT_COMMANDS, IMAP_LATENCY_TARGET_SECONDS,
+                    SMTP_SENDS_PER_MINUTE, SMTP_SEND_BURST, SMTP_MAX_CONCURRENT_SENDS, SMTP_LATENCY_TARGET_SECONDS,
+                    RATE_LIMIT_ADAPTIVE, METRICS_ENABLED)
+from tools.metrics import LIMITER_CALLS, LIMITER_IN_FLIGHT, LIMITER_LIMIT, LIMITER_THROTTLED_SECONDS
+
+# Multiplicative decrease applied to the concurrency limit on an error or a slow call.
+DECREASE_FACTOR = 0.5
+# Weight of the newest call in the latency moving average reported by stats().
+LATENCY_EWMA_WEIGHT = 0.2
+
+
+class TokenBucket:
+    """
+    rate_per_minute tokens per minute, at most burst at once. reserve() takes a token and returns how
+    long to wait before using it; reservations past the balance queue up behind each other.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate_per_minute = rate_per_minute
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        # Plain arithmetic under a thread lock, so one bucket can serve callers on several event loops.
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate_per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate_per_minute / 60
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= 1
+            # A negative balance is the reservations ahead of this one.
+            return 0.0 if self._tokens >= 0 else -self._tokens / rate
+
+    @property
+    def tokens(self) -> float:
+        if self.rate_per_minute <= 0:
+            return float(self.burst)
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return min(self.burst, self._tokens + elapsed * self.rate_per_minute / 60)
+
+
+class Limiter:
+    def __init__(self, name: str, rate_per_minute: float = 0, burst: int = 1, max_concurrency: int = 0,
+                 min_concurrency: int = 1, latency_target: float = 0, adaptive: bool = RATE_LIMIT_ADAPTIVE):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.min_concurrency = max(1, min_concurrency)
+        self.latency_target = latency_target
+        self.adaptive = adaptive
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.errors = 0
+        self.slow = 0
+        self.waits = 0
+        self.decreases = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.max_concurrency = max_concurrency
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, value: int):
+        # 0 means no concurrency limit; setting it starts the adaptive limit over from the top.
+        self._max_concurrency = value
+        self.limit = float(max(value, self.min_concurrency)) if value > 0 else 0.0
+        self._publish()
+
+    def _bind_loop(self):
+        # Waiters are futures of one event loop; asyncio.run() in scripts creates a new one each time.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._waiters = deque()
+            self.in_flight = 0
+            self.waiting = 0
+            self._loop = loop
+
+    def _capacity(self) -> int:
+        return max(self.min_concurrency, int(self.limit))
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self._capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Counted here, so a caller arriving meanwhile cannot take the slot first.
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def _acquire(self):
+        if self._max_concurrency <= 0 or (not self._waiters and self.in_flight < self._capacity()):
+            self.in_flight += 1
+            return
+        self.waits += 1
+        self.waiting += 1
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as it was cancelled: hand the slot on.
+                self.in_flight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+        finally:
+            self.waiting -= 1
+
+    def _finish(self, start: float, outcome: str):
+        self.in_flight -= 1
+        now = time.monotonic()
+        elapsed = now - start
+        self.calls += 1
+        if outcome == "cancelled":
+            # Cut short by the caller (a timeout, an early stop): no signal about the dependency.
+            self._wake()
+            self._publish(outcome)
+            return
+        self.latency_ewma = elapsed if self.latency_ewma is None else (
+            LATENCY_EWMA_WEIGHT * elapsed + (1 - LATENCY_EWMA_WEIGHT) * self.latency_ewma)
+        slow = self.latency_target > 0 and elapsed > self.latency_target
+        if outcome == "error":
+            self.errors += 1
+        elif slow:
+            self.slow += 1
+        if self.adaptive and self._max_concurrency > 0:
+            if outcome == "error" or slow:
+                if start >= self._last_decrease:
+                    self.limit = max(float(self.min_concurrency), self.limit * DECREASE_FACTOR)
+                    self._last_decrease = now
+                    self.decreases += 1
+            else:
+                self.limit = min(float(self._max_concurrency), self.limit + 1 / self.limit)
+        self._wake()
+        self._publish(outcome)
+
+    @asynccontextmanager
+    async def slot(self, feedback: bool = True):
+        """
+        Holds one call's slot: waits for a token and for the concurrency limit, and feeds the outcome
+        back into the limit (unless feedback is False, e.g. for a model load that is slow by nature).
+        """
+        self._bind_loop()
+        delay = self.bucket.reserve()
+        if delay > 0:
+            self.throttled += 1
+            self.throttled_seconds += delay
+            if METRICS_ENABLED:
+                LIMITER_THROTTLED_SECONDS.inc(delay, dependency=self.name)
+            await asyncio.sleep(delay)
+        await self._acquire()
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.monotonic()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            self._finish(start, outcome if feedback else "cancelled")
+
+    def _publish(self, outcome: Optional[str] = None):
+        if METRICS_ENABLED:
+            LIMITER_LIMIT.set(self._capacity() if self._max_concurrency > 0 else 0, dependency=self.name)
+            LIMITER_IN_FLIGHT.set(self.in_flight, dependency=self.name)
+            if outcome is not None:
+                LIMITER_CALLS.inc(dependency=self.name, outcome=outcome)
+
+    def stats(self) -> Dict:
+        return {
+            "rate_per_minute": self.bucket.rate_per_minute,
+            "burst": self.bucket.burst,
+            "tokens": round(self.bucket.tokens, 2),
+            "max_concurrency": self._max_concurrency,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "errors": self.errors,
+            "slow": self.slow,
+            "waits": self.waits,
+            "decreases": self.decreases,
+            "throttled": self.throttled,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "latency_ewma": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+        }
+
+
+# The LLM limiter belongs to the shared client (llm_client.limiter), since it sets its maximum.
+imap_limiter = Limiter("imap", IMAP_COMMANDS_PER_MINUTE, IMAP_COMMAND_BURST, IMAP_MAX_CONCURRENT_COMMANDS,
+                       latency_target=IMAP_LATENCY_TARGET_SECONDS)
+smtp_limiter = Limiter("smtp", SMTP_SENDS_PER_MINUTE, SMTP_SEND_BURST, SMTP_MAX_CONCURRENT_SENDS,
+                       latency_target=SMTP_LATENCY_TARGET_SECONDS)
@@ -1,7 +1,33 @@
 import aioimaplib
-from typing import List, Dict
+import asyncio
+from typing import AsyncIterator, Awaitable, List, Dict, Optional, Tuple
 import email
 from email.header import decode_header
+from email.message import Message
+import json
+import os
+import re
+
+from config import MIME_STREAMING, MIME_FETCH_CHUNK_BYTES, MAIL_INDEX_ENABLED
+from tools.coordination import imap_provider_limits
+from tools.rate_limit import imap_limiter
+from tools.mail_headers import normalize_message_id, parse_references
+from tools.metrics import IMAP_FETCH_BYTES, IMAP_FETCH_ERRORS, IMAP_FETCH_SECONDS, observe
+from tools.mime_stream import SNIPPET_BYTES, SnippetExtractor
+from tools.records import EmailRecord
+
+SYNC_STATE_FILE = os.path.join(os.path.dirname(__file__), "imap_sync_state.json")
+
+# Only these headers are pulled in incremental mode; everything else stays on the server.
+HEADER_FIELDS = "FROM SUBJECT DATE MESSAGE-ID IN-REPLY-TO REFERENCES CONTENT-TYPE CONTENT-TRANSFER-ENCODING LIST-UNSUBSCRIBE LIST-ID PRECEDENCE"
+# Bytes of BODY[TEXT] fetched per message: enough to get past MIME part headers to the SNIPPET_BYTES snippet.
+SNIPPET_FETCH_BYTES = max(2048, 2 * SNIPPET_BYTES)
+
+UIDVALIDITY_RE = re.compile(rb'\[UIDVALIDITY (\d+)\]')
+UIDNEXT_RE = re.compile(rb'\[UIDNEXT (\d+)\]')
+FETCH_START_RE = re.compile(rb'^\d+ FETCH \(')
+FETCH_UID_RE = re.compile(rb'UID (\d+)')
+FETCH_SECTION_RE = re.compile(rb'(BODY\[[^\]]*\](?:<\d+>)?) \{\d+\}$')
 
 def decode_mime_words(s):
     if not s:
@@ -12,77 +38,500 @@ def decode_mime_words(s):
         for part, encoding in decoded
     )
 
-async def read_inbox_emails(imap_server: str, email_address: str, password: str, max_emails: int = 10) -> List[Dict]:
+def connect_imap(imap_server: str) -> aioimaplib.IMAP4:
+    """
+    Creates an IMAP client for the given server.
+    Accepts a bare host (implicit TLS on 993), "imaps://host:port" or "imap://host:port" (plain, for local test servers).
+    """
+    use_ssl = True
+    if imap_server.startswith("imap://"):
+        use_ssl = False
+        imap_server = imap_server[len("imap://"):]
+    elif imap_server.startswith("imaps://"):
+        imap_server = imap_server[len("imaps://"):]
+    host, _, port = imap_server.partition(":")
+    if use_ssl:
+        return aioimaplib.IMAP4_SSL(host, int(port) if port else aioimaplib.IMAP4_SSL_PORT)
+    return aioimaplib.IMAP4(host, int(port) if port else aioimaplib.IMAP4_PORT)
+
+def load_sync_state(state_file: Optional[str] = None) -> Dict:
+    state_file = state_file or SYNC_STATE_FILE
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r") as f:
+        return json.load(f)
+
+def save_sync_state(state: Dict, state_file: Optional[str] = None):
+    state_file = state_file or SYNC_STATE_FILE
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, state_file)
+
+def sync_state_key(imap_server: str, email_address: str, mailbox: str) -> str:
+    return f"{email_address}@{imap_server}/{mailbox}"
+
+def parse_select_response(lines: List) -> Tuple[Optional[int], int]:
+    """
+    Extracts (UIDVALIDITY, EXISTS) from the untagged lines of a SELECT response.
+    """
+    uidvalidity = None
+    exists = 0
+    for line in lines:
+        if not isinstance(line, bytes):
+            continue
+        match = UIDVALIDITY_RE.search(line)
+        if match:
+            uidvalidity = int(match.group(1))
+        elif line.endswith(b' EXISTS'):
+            exists = int(line.split()[0])
+    return uidvalidity, exists
+
+def parse_uidnext(lines: List) -> Optional[int]:
+    """UIDNEXT from the untagged lines of a SELECT response, or None if the server sent none."""
+    for line in lines:
+        if isinstance(line, bytes):
+            match = UIDNEXT_RE.search(line)
+            if match:
+                return int(match.group(1))
+    return None
+
+def parse_fetch_response(lines: List) -> List[Dict]:
+    """
+    Groups the lines of a multi-message FETCH response into one dict per message:
+    {'uid': int, 'sections': {b'BODY[...]': bytes}}.
+    aioimaplib returns literals as bytearray items following the line that announced them.
+    """
+    messages = []
+    current = None
+    pending_section = None
+    for line in lines:
+        if isinstance(line, bytearray):
+            if current is not None and pending_section is not None:
+                current['sections'][pending_section] = bytes(line)
+            pending_section = None
+            continue
+        if FETCH_START_RE.match(line):
+            current = {'uid': None, 'sections': {}}
+            messages.append(current)
+        if current is None:
+            continue
+        uid_match = FETCH_UID_RE.search(line)
+        if uid_match and current['uid'] is None:
+            current['uid'] = int(uid_match.group(1))
+        section_match = FETCH_SECTION_RE.search(line)
+        pending_section = section_match.group(1) if section_match else None
+    return messages
+
+async def imap_command(command: Awaitable):
+    """Awaits one IMAP command (a not yet awaited client call) within the IMAP rate and concurrency limits."""
+    async with imap_limiter.slot():
+        return await command
+
+async def timed_fetch(client: aioimaplib.IMAP4, mode: str, *args, uid: bool = False):
+    """client.fetch(*args), or client.uid('fetch', *args), timed under mode and counted in received bytes."""
+    with observe(IMAP_FETCH_SECONDS, span=f"imap.fetch.{mode}", errors=IMAP_FETCH_ERRORS, mode=mode):
+        response = await imap_command(client.uid('fetch', *args) if uid else client.fetch(*args))
+    IMAP_FETCH_BYTES.inc(sum(len(line) for line in response.lines), mode=mode)
+    return response
+
+def bulk_category(msg: Message) -> Optional[str]:
+    """
+    Header rules for obvious bulk mail, checked before any LLM call.
+    Precedence: junk is treated as spam; mailing-list headers or Precedence: bulk/list as a newsletter.
+    """
+    precedence = msg.get('Precedence', '').strip().lower()
+    if precedence == 'junk':
+        return 'spam'
+    if precedence in ('bulk', 'list') or msg.get('List-Unsubscribe') or msg.get('List-Id'):
+        return 'newsletter'
+    return None
+
+def record_from_headers(msg: Message, uid: Optional[int], snippet: str) -> EmailRecord:
+    """The EmailRecord for a message's headers (decoded, rule-labelled, threading ids normalized) and its snippet."""
+    return EmailRecord(
+        uid=uid,
+        message_id=msg.get('Message-ID', '').strip(),
+        sender=decode_mime_words(msg.get('From', '')),
+        subject=decode_mime_words(msg.get('Subject', '')),
+        snippet=snippet,
+        rule_category=bulk_category(msg),
+        in_reply_to=normalize_message_id(msg.get('In-Reply-To')) or None,
+        references=' '.join(parse_references(msg.get('References'))) or None
+    )
+
+def email_from_message(msg: Message, uid: Optional[int] = None) -> EmailRecord:
+    return record_from_headers(msg, uid, extract_snippet(msg))
+
+def record_from_extractor(uid: Optional[int], extractor: SnippetExtractor) -> EmailRecord:
+    msg = extractor.headers if extractor.headers is not None else Message()
+    return record_from_headers(msg, uid, extractor.snippet())
+
+def extract_snippet(msg: Message) -> str:
+    payload = None
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == 'text/plain':
+                payload = part.get_payload(decode=True)
+                break
+    else:
+        payload = msg.get_payload(decode=True)
+    if not payload:
+        return ''
+    return payload[:SNIPPET_BYTES].decode(errors='ignore')
+
+def build_email_from_sections(uid: int, sections: Dict[bytes, bytes]) -> Optional[EmailRecord]:
+    header_bytes = b''
+    text_bytes = b''
+    for name, data in sections.items():
+        if name.startswith(b'BODY[HEADER'):
+            header_bytes = data
+        elif name.startswith(b'BODY[TEXT]'):
+            text_bytes = data
+    if not header_bytes:
+        return None
+    if not header_bytes.endswith(b'\r\n\r\n'):
+        header_bytes = header_bytes.rstrip(b'\r\n') + b'\r\n\r\n'
+    extractor = SnippetExtractor()
+    extractor.feed(header_bytes)
+    extractor.feed(text_bytes)
+    extractor.close()
+    return record_from_extractor(uid, extractor)
+
+async def read_new_emails(client: aioimaplib.IMAP4, sync_key: str, max_emails: int = 10, mailbox: str = 'Inbox', state_file: Optional[str] = None, oldest_first: bool = False,
+                          since_uid: Optional[int] = None, save: bool = True, position: Optional[Dict] = None) -> List[EmailRecord]:
+    """
+    Incremental sync on an authenticated client: fetches only messages with a UID above the
+    last one seen for this mailbox, as UID FETCHes of headers plus a partial body.
+    A UIDVALIDITY change (or no saved state) falls back to the newest max_emails by sequence number.
+    When more than max_emails messages are new, the oldest max_emails are returned and the saved UID
+    stops after them, so the rest come with the next call. They are returned newest first, or oldest
+    first with oldest_first.
+    A caller that saves the UID itself once the mail is processed (see save_processed_uid) passes
+    save=False and, as since_uid, the last UID it has already fetched. position, if given, is filled with
+    the {'uidvalidity', 'last_uid'} to save instead, for save_sync_position once the mail is processed.
+    """
+    select_resp = await imap_command(client.select(mailbox))
+    if select_resp.result != 'OK':
+        return []
+    uidvalidity, exists = parse_select_response(select_resp.lines)
+    if not exists:
+        return []
+
+    state = load_sync_state(state_file)
+    mailbox_state = state.get(sync_key)
+    fetch_items = f'(UID BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})] BODY.PEEK[TEXT]<0.{SNIPPET_FETCH_BYTES}>)'
+    if mailbox_state and mailbox_state.get('uidvalidity') == uidvalidity:
+        after = mailbox_state['last_uid'] if since_uid is None else since_uid
+        fetched, last_uid = await fetch_after_uid(client, after, parse_uidnext(select_resp.lines),
+                                                  max_emails, fetch_items)
+        if fetched is None:
+            return []
+    elif since_uid is not None:
+        # The caller's position belongs to the old UIDVALIDITY: let it start over (mark_mailbox_seen).
+        raise aioimaplib.Abort(f"UIDVALIDITY of {mailbox} changed")
+    else:
+        first = max(1, exists - max_emails + 1)
+        fetch_resp = await timed_fetch(client, 'incremental', f'{first}:{exists}', fetch_items)
+        if fetch_resp.result != 'OK':
+            return []
+        fetched = sorted((m for m in parse_fetch_response(fetch_resp.lines) if m['uid']), key=lambda m: m['uid'])
+        last_uid = fetched[-1]['uid'] if fetched else 0
+
+    emails = []
+    for message in fetched if oldest_first else reversed(fetched):
+        try:
+            mail = build_email_from_sections(message['uid'], message['sections'])
+        except Exception:
+            continue
+        if mail:
+            emails.append(mail)
+
+    if position is not None:
+        position.update(uidvalidity=uidvalidity, last_uid=last_uid)
+    elif save and last_uid and {'uidvalidity': uidvalidity, 'last_uid': last_uid} != mailbox_state:
+        state[sync_key] = {'uidvalidity': uidvalidity, 'last_uid': last_uid}
+        save_sync_state(state, state_file)
+    return emails
+
+def save_sync_position(sync_key: str, position: Dict, state_file: Optional[str] = None) -> bool:
+    """
+    Saves a position filled in by read_new_emails, once the mail it covers has been processed. Unlike
+    save_processed_uid it also starts over after a UIDVALIDITY change; under the same UIDVALIDITY the
+    saved UID only moves forward. Returns whether anything was saved.
+    """
+    if not position.get('last_uid'):
+        return False
+    state = load_sync_state(state_file)
+    mailbox_state = state.get(sync_key)
+    if (mailbox_state and mailbox_state.get('uidvalidity') == position['uidvalidity']
+            and mailbox_state['last_uid'] >= position['last_uid']):
+        return False
+    state[sync_key] = {'uidvalidity': position['uidvalidity'], 'last_uid': position['last_uid']}
+    save_sync_state(state, state_file)
+    return True
+
+def save_processed_uid(sync_key: str, uidvalidity: Optional[int], uid: int, state_file: Optional[str] = None) -> bool:
+    """
+    Moves the mailbox's saved UID forward to uid, unless UIDVALIDITY has changed since or the saved
+    UID is already past it. Returns whether it moved.
+    """
+    state = load_sync_state(state_file)
+    mailbox_state = state.get(sync_key)
+    if not mailbox_state or mailbox_state.get('uidvalidity') != uidvalidity or mailbox_state['last_uid'] >= uid:
+        return False
+    mailbox_state['last_uid'] = uid
+    save_sync_state(state, state_file)
+    return True
+
+async def fetch_after_uid(client: aioimaplib.IMAP4, last_uid: int, uidnext: Optional[int], max_emails: int,
+                          fetch_items: str) -> Tuple[Optional[List[Dict]], int]:
+    """
+    The oldest max_emails messages with a UID above last_uid, oldest first, and the UID everything up to
+    which has now been seen (None instead of the messages if a fetch failed). With UIDNEXT the fetch asks
+    for UIDs last_uid+1 .. last_uid+max_emails only, moving on past gaps left by deleted mail; nothing is
+    fetched when UIDNEXT says there is no new mail.
+    """
+    if uidnext is None:
+        # Without UIDNEXT the newest UID is unknown: fetch all new mail and keep the oldest max_emails.
+        fetch_resp = await timed_fetch(client, 'incremental', f'{last_uid + 1}:*', fetch_items, uid=True)
+        if fetch_resp.result != 'OK':
+            return None, last_uid
+        # "N:*" always matches the highest UID, even when it is below N, so filter again here.
+        fetched = sorted((m for m in parse_fetch_response(fetch_resp.lines) if m['uid'] and m['uid'] > last_uid),
+                         key=lambda m: m['uid'])[:max_emails]
+        return fetched, fetched[-1]['uid'] if fetched else last_uid
+    fetched: List[Dict] = []
+    seen = last_uid
+    while len(fetched) < max_emails and seen < uidnext - 1:
+        end = min(seen + max_emails - len(fetched), uidnext - 1)
+        fetch_resp = await timed_fetch(client, 'incremental', f'{seen + 1}:{end}', fetch_items, uid=True)
+        if fetch_resp.result != 'OK':
+            return (fetched or None), seen
+        fetched += sorted((m for m in parse_fetch_response(fetch_resp.lines) if m['uid'] and seen < m['uid'] <= end),
+                          key=lambda m: m['uid'])
+        seen = end
+    return fetched, seen
+
+async def mark_mailbox_seen(client: aioimaplib.IMAP4, sync_key: str, mailbox: str = 'Inbox', state_file: Optional[str] = None) -> int:
+    """
+    Selects mailbox and, unless it already has sync state with the current UIDVALIDITY, records everything
+    in it as seen, so the next read_new_emails only returns mail arriving from now on.
+    Returns the last UID seen.
+    """
+    select_resp = await imap_command(client.select(mailbox))
+    if select_resp.result != 'OK':
+        raise aioimaplib.Abort(f"cannot select {mailbox}: {select_resp.lines}")
+    uidvalidity, exists = parse_select_response(select_resp.lines)
+    state = load_sync_state(state_file)
+    mailbox_state = state.get(sync_key)
+    if mailbox_state and mailbox_state.get('uidvalidity') == uidvalidity:
+        return mailbox_state['last_uid']
+    uidnext = parse_uidnext(select_resp.lines)
+    if uidnext is not None:
+        last_uid = uidnext - 1
+    elif exists:
+        # No UIDNEXT in the SELECT response: ask for the UID of the last message instead.
+        fetch_resp = await timed_fetch(client, 'incremental', str(exists), '(UID)')
+        fetched = parse_fetch_response(fetch_resp.lines) if fetch_resp.result == 'OK' else []
+        last_uid = fetched[0]['uid'] if fetched and fetched[0]['uid'] else 0
+    else:
+        last_uid = 0
+    state[sync_key] = {'uidvalidity': uidvalidity, 'last_uid': last_uid}
+    save_sync_state(state, state_file)
+    return last_uid
+
+async def fetch_message_record(client: aioimaplib.IMAP4, num: str, chunk_bytes: int = MIME_FETCH_CHUNK_BYTES) -> Optional[EmailRecord]:
+    """
+    Downloads message num in chunk_bytes pieces (BODY.PEEK[]<offset.size>) into a SnippetExtractor and stops
+    as soon as it has the headers and the first text part, so attachments after the text are never transferred
+    and no more than one chunk plus the extractor's caps is held in memory.
+    """
+    extractor = SnippetExtractor()
+    uid = None
+    offset = 0
+    while True:
+        fetch_resp = await timed_fetch(client, 'chunk', num, f'(UID BODY.PEEK[]<{offset}.{chunk_bytes}>)')
+        if fetch_resp.result != 'OK':
+            return None
+        messages = parse_fetch_response(fetch_resp.lines)
+        if not messages:
+            return None
+        uid = uid or messages[0]['uid']
+        chunk = next(iter(messages[0]['sections'].values()), b'')
+        offset += len(chunk)
+        if extractor.feed(chunk) or len(chunk) < chunk_bytes:
+            break
+    extractor.close()
+    return record_from_extractor(uid, extractor)
+
+async def iter_latest_emails(client: aioimaplib.IMAP4, max_emails: int = 10, mailbox: str = 'Inbox') -> AsyncIterator[EmailRecord]:
+    """
+    Yields the latest max_emails messages, newest first, as each one is fetched (SEARCH ALL, then one
+    chunked streaming fetch per message with MIME_STREAMING, or one full RFC822 fetch each without).
+    """
+    select_resp = await imap_command(client.select(mailbox))
+    resp = await imap_command(client.search('ALL'))
+
+    if resp.result != 'OK':
+        return
+
+    if not resp.lines:
+        return
+
+    msg_nums = resp.lines[0].decode().split()
+    emails_to_fetch = msg_nums[-max_emails:] if len(msg_nums) > max_emails else msg_nums
+
+    for num in reversed(emails_to_fetch):
+        try:
+            if MIME_STREAMING:
+                record = await fetch_message_record(client, num)
+                if record is not None:
+                    yield record
+                continue
+            fetch_resp = await timed_fetch(client, 'rfc822', num, '(RFC822)')
+
+            if fetch_resp.result == 'OK':
+                # Find the actual email content in fetch_resp.lines
+                email_bytes = None
+                for line in fetch_resp.lines:
+                    if isinstance(line, (bytes, bytearray)) and b'From:' in line:
+                        email_bytes = bytes(line)
+                        break
+                if not email_bytes:
+                    # Fallback: try the second element if it exists and is bytes/bytearray
+                    if len(fetch_resp.lines) > 1 and isinstance(fetch_resp.lines[1], (bytes, bytearray)):
+                        email_bytes = bytes(fetch_resp.lines[1])
+                if not email_bytes:
+                    continue
+                try:
+                    msg = email.message_from_bytes(email_bytes)
+                    mail = email_from_message(msg)
+                except Exception:
+                    continue
+                yield mail
+        except (aioimaplib.Abort, aioimaplib.CommandTimeout):
+            # Connection-level failure: let the caller (or the session pool) reconnect
+            raise
+        except Exception:
+            continue
+
+async def fetch_latest_emails(client: aioimaplib.IMAP4, max_emails: int = 10, mailbox: str = 'Inbox') -> List[EmailRecord]:
+    """
+    Fetches the latest max_emails messages (see iter_latest_emails) on an authenticated client.
+    """
+    return [mail async for mail in iter_latest_emails(client, max_emails, mailbox)]
+
+async def read_mailbox(client: aioimaplib.IMAP4, imap_server: str, email_address: str, max_emails: int = 10, incremental: bool = False, mailbox: str = 'Inbox',
+                       position: Optional[Dict] = None) -> List[EmailRecord]:
+    if incremental:
+        sync_key = sync_state_key(imap_server, email_address, mailbox)
+        return await read_new_emails(client, sync_key, max_emails, mailbox, position=position)
+    return await fetch_latest_emails(client, max_emails, mailbox)
+
+async def iter_mailbox(client: aioimaplib.IMAP4, imap_server: str, email_address: str, max_emails: int = 10, incremental: bool = False, mailbox: str = 'Inbox') -> AsyncIterator[EmailRecord]:
+    """
+    Streaming form of read_mailbox. The legacy path yields each message as soon as its FETCH returns;
+    incremental sync already fetches everything in one round trip, so its messages are yielded together.
+    """
+    if incremental:
+        for mail in await read_mailbox(client, imap_server, email_address, max_emails, incremental, mailbox):
+            yield mail
+        return
+    async for mail in iter_latest_emails(client, max_emails, mailbox):
+        yield mail
+
+async def index_fetched(emails: List[EmailRecord], email_address: str):
+    """
+    Adds fetched emails to the drafting context index (MAIL_INDEX_ENABLED); already indexed ones are skipped.
+    Runs in a thread, since adding waits for the index lock and writes to SQLite.
+    """
+    if MAIL_INDEX_ENABLED and emails:
+        # Imported here so NumPy is only loaded when the index is on.
+        from tools.mail_index import index_emails
+        # Copies, so later steps (e.g. preprocessing the snippet) do not race the thread.
+        await asyncio.to_thread(index_emails, [mail.to_dict() for mail in emails], email_address)
+
+async def read_inbox_emails(imap_server: str, email_address: str, password: str, max_emails: int = 10, incremental: bool = False, mailbox: str = 'Inbox',
+                            position: Optional[Dict] = None) -> List[EmailRecord]:
     """
     Connects to the IMAP server and fetches the latest emails from the inbox.
-    Returns a list of email metadata dicts: sender, subject, snippet.
+    Returns them as EmailRecords (sender, subject, snippet, message id, ...), which also allow dict-style access.
+    With incremental=True only messages not seen by a previous run are returned (see read_new_emails);
+    given position, the new UID is left for the caller to save once they are processed (save_sync_position).
     """
     emails = []
     try:
-        client = aioimaplib.IMAP4_SSL(imap_server)
-        await client.wait_hello_from_server()
-        await client.login(email_address, password)
-        print(f"✅ Connected to Gmail successfully! ({email_address})")
-        select_resp = await client.select('Inbox')
-        resp = await client.search('ALL')
-        
-        if resp.result != 'OK':
-            await client.logout()
-            return emails
-            
-        if not resp.lines:
+        async with imap_provider_limits.connection(imap_server):
+            client = connect_imap(imap_server)
+            await client.wait_hello_from_server()
+            await imap_command(client.login(email_address, password))
+            print(f"✅ Connected to Gmail successfully! ({email_address})")
+            emails = await read_mailbox(client, imap_server, email_address, max_emails, incremental, mailbox, position)
             await client.logout()
-            return emails
-            
-        msg_nums = resp.lines[0].decode().split()
-        emails_to_fetch = msg_nums[-max_emails:] if len(msg_nums) > max_emails else msg_nums
-        
-        for num in reversed(emails_to_fetch):
-            try:
-                fetch_resp = await client.fetch(num, '(RFC822)')
-                
-                if fetch_resp.result == 'OK':
-                    # Find the actual email content in fetch_resp.lines
-                    email_bytes = None
-                    for line in fetch_resp.lines:
-                        if isinstance(line, (bytes, bytearray)) and b'From:' in line:
-                            email_bytes = bytes(line)
-                            break
-                    if not email_bytes:
-                        # Fallback: try the second element if it exists and is bytes/bytearray
-                        if len(fetch_resp.lines) > 1 and isinstance(fetch_resp.lines[1], (bytes, bytearray)):
-                            email_bytes = bytes(fetch_resp.lines[1])
-                    if not email_bytes:
-                        continue
-                    try:
-                        msg = email.message_from_bytes(email_bytes)
-                        sender = decode_mime_words(msg.get('From', ''))
-                        subject = decode_mime_words(msg.get('Subject', ''))
-                        snippet = ''
-                        if msg.is_multipart():
-                            for part in msg.walk():
-                                if part.get_content_type() == 'text/plain':
-                                    payload = part.get_payload(decode=True)
-                                    if payload:
-                                        snippet = payload[:200].decode(errors='ignore')
-                                    break
-                        else:
-                            payload = msg.get_payload(decode=True)
-                            if payload:
-                                snippet = payload[:200].decode(errors='ignore')
-                        emails.append({
-                            'from': sender,
-                            'subject': subject,
-                            'snippet': snippet
-                        })
-                    except Exception:
-                        continue
-            except Exception:
-                continue
-                
-        await client.logout()
-        
+        await index_fetched(emails, email_address)
+
     except Exception:
         # Log or handle error as needed
         pass
-    return emails 
\ No newline at end of file
+    return emails
+
+async def read_inbox_emails_pooled(imap_server: str, email_address: str, password: str, max_emails: int = 10, incremental: bool = False, mailbox: str = 'Inbox',
+                                   position: Optional[Dict] = None) -> List[EmailRecord]:
+    """
+    Same as read_inbox_emails, but borrows a logged-in session from the shared IMAP pool
+    instead of paying TLS + LOGIN on every run.
+    """
+    from tools.imap_pool import imap_pool
+
+    try:
+        emails = await imap_pool.run(
+            imap_server, email_address, password,
+            lambda client: read_mailbox(client, imap_server, email_address, max_emails, incremental, mailbox, position)
+        )
+    except Exception as e:
+        print(f"[IMAP] Failed to read {mailbox} for {email_address}: {e}")
+        return []
+    await index_fetched(emails, email_address)
+    return emails
+
+async def stream_inbox_emails(imap_server: str, email_address: str, password: str, max_emails: int = 10, incremental: bool = False, mailbox: str = 'Inbox', pooled: bool = True) -> AsyncIterator[EmailRecord]:
+    """
+    Yields the same emails as read_inbox_emails / read_inbox_emails_pooled, one at a time as they are fetched,
+    so later stages can start on the first message while the rest are still downloading.
+    A dropped pooled session is retried once on a fresh connection, but only if nothing was yielded yet.
+    """
+    fetched: List[EmailRecord] = []
+    try:
+        if not pooled:
+            async with imap_provider_limits.connection(imap_server):
+                client = connect_imap(imap_server)
+                await client.wait_hello_from_server()
+                await imap_command(client.login(email_address, password))
+                try:
+                    async for mail in iter_mailbox(client, imap_server, email_address, max_emails, incremental, mailbox):
+                        fetched.append(mail)
+                        yield mail
+                finally:
+                    await client.logout()
+            return
+
+        from tools.imap_pool import imap_pool, CONNECTION_ERRORS
+
+        for attempt in range(2):
+            yielded = False
+            try:
+                async with imap_pool.session(imap_server, email_address, password) as client:
+                    async for mail in iter_mailbox(client, imap_server, email_address, max_emails, incremental, mailbox):
+                        yielded = True
+                        fetched.append(mail)
+                        yield mail
+                return
+            except CONNECTION_ERRORS:
+                if yielded or attempt:
+                    raise
+                imap_pool.reconnects += 1
+    except Exception as e:
+        print(f"[IMAP] Failed to read {mailbox} for {email_address}: {e}")
+    finally:
+        await index_fetched(fetched, email_address)
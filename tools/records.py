@@ -0,0 +1,168 @@
+"""
+Compact record types for emails moving through the workflow and replies waiting in the outbox.
+
+Both are slotted dataclasses: no per-instance __dict__, attribute access for the graph nodes,
+and dict-style access (mail['from'], mail.get('draft')) so tools written against plain dicts keep
+working. dumps()/loads() serialize them with orjson when it is installed, and json otherwise.
+"""
+
+import dataclasses
+import json
+import operator
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # optional: the standard json module is used instead
+    orjson = None
+
+
+class _Record:
+    """Dict-style access on top of a slotted dataclass, using the wire names in ALIASES."""
+
+    __slots__ = ()
+    # Wire name -> attribute name, for keys that are not valid identifiers.
+    ALIASES: Dict[str, str] = {}
+    # Optional fields left out of to_dict() while they are unset, so results keep their old shape.
+    OPTIONAL = ()
+
+    def _attribute(self, key: str) -> str:
+        name = self.ALIASES.get(key, key)
+        if name not in self.__slots__:
+            raise KeyError(key)
+        return name
+
+    def __getitem__(self, key: str) -> Any:
+        value = getattr(self, self._attribute(key))
+        if value is None and key in self.OPTIONAL:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        setattr(self, self._attribute(key), value)
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def copy(self):
+        return self.__class__(*self._values(self))
+
+    def to_dict(self) -> Dict:
+        optional = self.OPTIONAL
+        return {key: value for key, value in zip(self._keys, self._values(self))
+                if value is not None or key not in optional}
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        names = cls._names
+        values = ((cls.ALIASES.get(key, key), value) for key, value in data.items())
+        return cls(**{name: value for name, value in values if name in names})
+
+
+def _record(cls):
+    """Caches the field layout that _Record's copy/to_dict/from_dict use (set once, after @dataclass)."""
+    names = tuple(field.name for field in dataclasses.fields(cls))
+    wire_names = {name: key for key, name in cls.ALIASES.items()}
+    cls._names = frozenset(names)
+    cls._keys = tuple(wire_names.get(name, name) for name in names)
+    cls._values = operator.attrgetter(*names)
+    return cls
+
+
+@_record
+@dataclass(slots=True)
+class EmailRecord(_Record):
+    """
+    What the workflow keeps of a fetched message: identifiers, the decoded From/Subject,
+    a short text snippet and the header-rule label, but none of the raw MIME.
+    The nodes fill in category, action, draft, to and scheduled as the email moves through the graph;
+    account and mailbox say where it was read from when a run covers several mailboxes.
+    in_reply_to and references hold the threading headers (space-separated Message-IDs) when present.
+    """
+    uid: Optional[int]
+    message_id: str
+    sender: str
+    subject: str
+    snippet: str
+    rule_category: Optional[str] = None
+    category: Optional[str] = None
+    action: Optional[str] = None
+    draft: Optional[str] = None
+    to: Optional[str] = None
+    scheduled: Optional[bool] = None
+    account: Optional[str] = None
+    mailbox: Optional[str] = None
+    in_reply_to: Optional[str] = None
+    references: Optional[str] = None
+
+    ALIASES = {"from": "sender"}
+    OPTIONAL = ("rule_category", "category", "action", "draft", "to", "scheduled", "account", "mailbox",
+                "in_reply_to", "references")
+
+
+@_record
+@dataclass(slots=True)
+class ScheduledMessage(_Record):
+    """
+    A reply in the outbox. in_reply_to is the Message-ID of the email it answers, when known;
+    account is the address it is sent from (None: the default EMAIL_ADDRESS account).
+    message_id and references are the reply's own threading headers, fixed when it is scheduled
+    so a retried send keeps its Message-ID.
+    """
+    id: Optional[int]
+    to: Optional[str]
+    sender: Optional[str]
+    subject: Optional[str]
+    body: Optional[str]
+    scheduled_time: str
+    sent: bool = False
+    in_reply_to: Optional[str] = None
+    account: Optional[str] = None
+    message_id: Optional[str] = None
+    references: Optional[str] = None
+
+    ALIASES = {"from": "sender"}
+    OPTIONAL = ("in_reply_to", "account", "message_id", "references")
+
+
+def as_dict(value: Any) -> Any:
+    """Plain-dict form of a record (or a list of them); anything else is returned unchanged."""
+    if isinstance(value, _Record):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [as_dict(item) for item in value]
+    return value
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, _Record):
+        return value.to_dict()
+    return str(value)
+
+
+if orjson is not None:
+    # Records go through _default rather than orjson's own dataclass support, which would emit 'sender' for 'from'.
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+
+    def loads(data) -> Any:
+        return orjson.loads(data)
+else:
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def loads(data) -> Any:
+        return json.loads(data)
@@ -0,0 +1,45 @@
+from typing import Dict, List
+
+from config import CATEGORY_POLICY, CATEGORY_DEFAULT_ACTION, BULK_HEADER_RULES
+from tools.metrics import run_stats
+from tools.records import EmailRecord
+
+ACTIONS = ("draft", "archive", "skip")
+
+def action_for(category: str) -> str:
+    """
+    Looks up what to do with an email of this category in CATEGORY_POLICY:
+    'draft' replies and schedules, 'archive' keeps it in the results without a reply, 'skip' drops it.
+    Unknown categories and LLM errors fall back to CATEGORY_DEFAULT_ACTION.
+    """
+    action = CATEGORY_POLICY.get((category or '').strip().lower(), CATEGORY_DEFAULT_ACTION)
+    return action if action in ACTIONS else "draft"
+
+def route_email(mail: EmailRecord) -> str:
+    mail['action'] = action_for(mail.get('category', ''))
+    return mail['action']
+
+def summarize_routing(emails: List[EmailRecord]) -> Dict:
+    """
+    Counts routing decisions and the LLM calls they avoided, against a baseline of one
+    classification and one draft per email: a header-rule label saves the classification,
+    an archived or skipped email saves the draft. Returns the counts, which are also the run's
+    "routing" stats (see metrics.run_stats).
+    """
+    counts = {action: 0 for action in ACTIONS}
+    for mail in emails:
+        counts[mail.get('action', 'draft')] += 1
+    rule_labelled = sum(1 for mail in emails if mail.get('rule_category')) if BULK_HEADER_RULES else 0
+    avoided = rule_labelled + counts['archive'] + counts['skip']
+    baseline = 2 * len(emails)
+    stats = run_stats("routing")
+    stats.update({
+        "emails": len(emails),
+        **counts,
+        "rule_labelled": rule_labelled,
+        "llm_calls_avoided": avoided,
+        "llm_calls_avoided_share": round(avoided / baseline, 3) if baseline else 0.0,
+    })
+    print(f"[ROUTE] draft={counts['draft']} archive={counts['archive']} skip={counts['skip']} "
+          f"(header rules: {rule_labelled}); avoided {avoided}/{baseline} LLM calls ({stats['llm_calls_avoided_share']:.0%})")
+    return stats
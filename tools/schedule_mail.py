@@ -1,12 +1,22 @@
-from typing import Dict, List
-import datetime
+from typing import Callable, Dict, List, Optional
+import asyncio
 import re
-import json
-import os
 import smtplib
-from email.mime.text import MIMEText
+import time
 
-SCHEDULED_MAIL_FILE = os.path.join(os.path.dirname(__file__), "scheduled_emails.json")
+from config import SMTP_ASYNC_DISPATCH, MAIL_INDEX_ENABLED
+from tools.accounts import Account, find_account
+from tools.metrics import SMTP_SEND_SECONDS, SMTP_SENDS, observe, run_stats
+from tools.outbox import get_outbox, parse_send_time
+from tools.rate_limit import smtp_limiter
+from tools.records import EmailRecord, ScheduledMessage
+from tools.smtp_dispatch import build_message, dispatch_due_emails, parse_smtp_server
+
+# Called with the send time (epoch seconds) of every newly scheduled email, e.g. to wake the due queue.
+_schedule_listeners: List[Callable[[float], None]] = []
+
+def add_schedule_listener(listener: Callable[[float], None]):
+    _schedule_listeners.append(listener)
 
 def extract_sender_name(sender: str) -> str:
     """
@@ -36,95 +46,102 @@ def extract_sender_name(sender: str) -> str:
     # If it's a single word, use it as is
     return sender_clean
 
-def load_scheduled_emails() -> List[Dict]:
-    if not os.path.exists(SCHEDULED_MAIL_FILE):
-        return []
-    with open(SCHEDULED_MAIL_FILE, "r") as f:
-        return json.load(f)
-
-def save_scheduled_emails(emails: List[Dict]):
-    with open(SCHEDULED_MAIL_FILE, "w") as f:
-        json.dump(emails, f, indent=2, default=str)
+def load_scheduled_emails() -> List[ScheduledMessage]:
+    return get_outbox().all()
 
-def is_duplicate_email(email: Dict, send_time: str) -> bool:
-    emails = load_scheduled_emails()
-    for scheduled in emails:
-        if (
-            scheduled.get('from') == email.get('from') and
-            scheduled.get('subject') == email.get('subject')
-        ):
-            return True
-    return False
+def is_duplicate_email(email: EmailRecord, send_time: str) -> bool:
+    return get_outbox().is_duplicate(email)
 
-def schedule_email_send(email: Dict, send_time: str) -> bool:
+def schedule_email_send(email: EmailRecord, send_time: str) -> bool:
     """
     Schedules the given email to be sent at the specified time.
-    Persists the scheduled email in a JSON file.
-    Returns True if scheduled successfully, False if duplicate.
+    Persists the scheduled email in the outbox (see tools/outbox.py).
+    Returns True if scheduled successfully, False if duplicate or if there is no draft to send
+    (drafting failed); such an email is left unscheduled, so a later run can still reply to it.
     """
-    if is_duplicate_email(email, send_time):
+    if not email.get('draft'):
+        print(f"[SKIP] No draft to schedule: {email.get('subject')} from {email.get('from')}")
+        run_stats("scheduling", no_draft=1)
+        return False
+    # add() checks for duplicates and inserts in one step, so concurrent callers cannot both schedule.
+    email_id = get_outbox().add(email, send_time)
+    if email_id is None:
         print(f"[SKIP] Duplicate email not scheduled: {email.get('subject')} from {email.get('from')}")
         return False
-    emails = load_scheduled_emails()
-    # Assign a unique id
-    email_id = len(emails) + 1
-    scheduled_email = {
-        "id": email_id,
-        "to": email.get("to"),
-        "from": email.get("from"),
-        "subject": email.get("subject"),
-        "body": email.get("draft"),
-        "scheduled_time": send_time,
-        "sent": False
-    }
-    emails.append(scheduled_email)
-    save_scheduled_emails(emails)
-    print(f"[SCHEDULE] Email to: {scheduled_email['to']} at {send_time}")
+    print(f"[SCHEDULE] Email to: {email.get('to')} at {send_time}")
+    scheduled_ts = parse_send_time(send_time)
+    for listener in _schedule_listeners:
+        listener(scheduled_ts)
     return True
 
-def get_due_emails() -> List[Dict]:
+def get_due_emails() -> List[ScheduledMessage]:
     """
     Returns a list of emails whose scheduled time is <= now and not sent.
     """
-    emails = load_scheduled_emails()
-    now = datetime.datetime.now(datetime.timezone.utc)
-    due = []
-    for email in emails:
-        if not email["sent"]:
-            scheduled_time = datetime.datetime.fromisoformat(email["scheduled_time"])
-            if scheduled_time <= now:
-                due.append(email)
-    return due
+    return get_outbox().due()
 
 def mark_email_sent(email_id: int):
-    emails = load_scheduled_emails()
-    for email in emails:
-        if email["id"] == email_id:
-            email["sent"] = True
-    save_scheduled_emails(emails)
+    get_outbox().mark_sent([email_id])
 
-def send_email(smtp_server: str, email_address: str, password: str, to: str, subject: str, body: str):
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = email_address
-    msg["To"] = to
-    with smtplib.SMTP_SSL(smtp_server) as server:
-        server.login(email_address, password)
+def send_email(smtp_server: str, email_address: str, password: str, to: str, subject: str, body: str,
+               message_id: Optional[str] = None, in_reply_to: Optional[str] = None, references: Optional[str] = None):
+    msg = build_message(email_address, to, subject, body, message_id, in_reply_to, references)
+    # One send at a time on this path, so only the rate limit applies (no event loop for the adaptive limit).
+    delay = smtp_limiter.bucket.reserve()
+    if delay > 0:
+        time.sleep(delay)
+    host, port, use_tls = parse_smtp_server(smtp_server)
+    smtp_class = smtplib.SMTP_SSL if use_tls else smtplib.SMTP
+    # One session per email on this path, so the connection and login are part of the send time.
+    with observe(SMTP_SEND_SECONDS, span="smtp.send", path="sync"), smtp_class(host, port) as server:
+        if password:
+            # Same as the async dispatcher: log in whenever credentials are configured, over STARTTLS if offered.
+            server.ehlo()
+            if not use_tls and server.has_extn("starttls"):
+                server.starttls()
+                server.ehlo()
+            if server.has_extn("auth"):
+                server.login(email_address, password)
         server.sendmail(email_address, [to], msg.as_string())
 
-def process_due_emails(smtp_server: str, email_address: str, password: str):
-    due_emails = get_due_emails()
+def process_due_emails(smtp_server: str, email_address: str, password: str, accounts: Optional[List[Account]] = None):
+    """
+    Sends every due email. By default (SMTP_ASYNC_DISPATCH) they go out over a few reused
+    aiosmtplib connections with batched sent-status commits; otherwise one SMTP session per email.
+    With accounts, each reply is sent from the account its email was read from; replies without
+    one (scheduled before accounts were recorded) use the given credentials.
+    Runs on the scheduler thread, which has no event loop of its own.
+    """
+    if SMTP_ASYNC_DISPATCH:
+        asyncio.run(dispatch_due_emails(smtp_server, email_address, password, accounts=accounts))
+        return
+    outbox = get_outbox()
+    due_emails = outbox.claim_due()
+    # Sent messages by their account, which index_replies records as the sender; the default address without one.
+    sent: Dict[str, List[ScheduledMessage]] = {}
     for email in due_emails:
+        account = find_account(email.account, accounts) if accounts else None
         try:
             send_email(
-                smtp_server=smtp_server,
-                email_address=email_address,
-                password=password,
-                to=email["to"],
-                subject=email["subject"],
-                body=email["body"]
+                smtp_server=account.smtp_server if account else smtp_server,
+                email_address=account.email if account else email_address,
+                password=account.password if account else password,
+                to=email.to,
+                subject=email.subject,
+                body=email.body,
+                message_id=email.message_id,
+                in_reply_to=email.in_reply_to,
+                references=email.references
             )
-            mark_email_sent(email["id"])
-            print(f"[SENT] Email to: {email['to']} (ID: {email['id']})")
+            mark_email_sent(email.id)
+            sent.setdefault(email.account or email_address, []).append(email)
+            SMTP_SENDS.inc(path="sync", result="sent")
+            print(f"[SENT] Email to: {email.to} (ID: {email.id})")
         except Exception as e:
-            print(f"[ERROR] Failed to send scheduled email to {email['to']}: {e}") 
\ No newline at end of file
+            SMTP_SENDS.inc(path="sync", result="failed")
+            outbox.release([email.id])
+            print(f"[ERROR] Failed to send scheduled email to {email.to}: {e}")
+    if MAIL_INDEX_ENABLED and sent:
+        from tools.mail_index import index_replies
+        for sender, messages in sent.items():
+            index_replies(messages, sender)
@@ -0,0 +1,235 @@
+import asyncio
+import random
+import time
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional, Tuple
+
+import aiosmtplib
+
+from config import SMTP_MAX_CONNECTIONS, SMTP_COMMIT_BATCH, SMTP_MAX_RETRIES, SMTP_BACKOFF_SECONDS, MAIL_INDEX_ENABLED
+from tools.accounts import Account, find_account
+from tools.coordination import smtp_provider_limits
+from tools.metrics import SMTP_SEND_SECONDS, SMTP_SENDS, observe
+from tools.outbox import OutboxBackend, get_outbox
+from tools.rate_limit import smtp_limiter
+from tools.records import ScheduledMessage
+
+SMTP_SSL_PORT = 465
+SMTP_PORT = 25
+
+# Errors after which the connection is no longer trusted and is re-opened before the next message.
+CONNECTION_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+                     aiosmtplib.SMTPTimeoutError, ConnectionError, OSError, asyncio.TimeoutError)
+
+
+def parse_smtp_server(smtp_server: str) -> Tuple[str, int, bool]:
+    """
+    Splits an SMTP server setting into (host, port, use_tls).
+    Accepts a bare host (implicit TLS on 465), "smtps://host:port" or "smtp://host:port" (plain, for local test servers).
+    """
+    use_tls = True
+    if smtp_server.startswith("smtp://"):
+        use_tls = False
+        smtp_server = smtp_server[len("smtp://"):]
+    elif smtp_server.startswith("smtps://"):
+        smtp_server = smtp_server[len("smtps://"):]
+    host, _, port = smtp_server.partition(":")
+    return host, int(port) if port else (SMTP_SSL_PORT if use_tls else SMTP_PORT), use_tls
+
+
+def build_message(email_address: str, to: str, subject: str, body: str, message_id: Optional[str] = None,
+                  in_reply_to: Optional[str] = None, references: Optional[str] = None) -> MIMEText:
+    """The reply as sent; with the threading headers the recipient's client files it under the original."""
+    msg = MIMEText(body)
+    msg["Subject"] = subject
+    msg["From"] = email_address
+    msg["To"] = to
+    if message_id:
+        msg["Message-ID"] = message_id
+    if in_reply_to:
+        msg["In-Reply-To"] = in_reply_to
+    if references:
+        msg["References"] = references
+    return msg
+
+
+def is_transient(error: aiosmtplib.SMTPResponseException) -> bool:
+    # 421 "service not available" and other 4xx replies are temporary: back off and retry.
+    return 400 <= error.code < 500
+
+
+class SmtpDispatcher:
+    """
+    Sends a batch of outbox messages over a few long-lived, authenticated SMTP connections.
+
+    Up to `connections` workers each hold one session and send message after message on it, so TLS and
+    AUTH are paid once per connection rather than once per email. 4xx replies (e.g. 421 throttling) and
+    dropped connections trigger a reconnect with exponential backoff and a retry of that message; 5xx
+    replies are permanent and the message is released back to the outbox. Sent status is written to the
+    outbox in batches of commit_batch. Each worker holds a slot of its host's SMTP_PROVIDER_MAX_CONNECTIONS
+    cap, which dispatchers for other accounts on the same provider share. Every send also goes through
+    smtp_limiter: SMTP_SENDS_PER_MINUTE paces them, and 4xx replies or slow sends cut how many are in flight.
+    """
+
+    def __init__(self, smtp_server: str, email_address: str, password: str,
+                 connections: int = SMTP_MAX_CONNECTIONS, commit_batch: int = SMTP_COMMIT_BATCH,
+                 max_retries: int = SMTP_MAX_RETRIES, backoff_seconds: float = SMTP_BACKOFF_SECONDS,
+                 outbox: Optional[OutboxBackend] = None):
+        self.host, self.port, self.use_tls = parse_smtp_server(smtp_server)
+        self.email_address = email_address
+        self.password = password
+        self.connections = max(1, connections)
+        self.commit_batch = max(1, commit_batch)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.outbox = outbox or get_outbox()
+        self._sent_ids: List[int] = []
+        self.sent_messages: List[ScheduledMessage] = []
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "connections_opened": 0, "commits": 0}
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname=self.host, port=self.port, use_tls=self.use_tls,
+                               start_tls=None if self.use_tls else False)
+        await smtp.connect()
+        try:
+            if self.password:
+                # connect() sends no EHLO with start_tls=False, and AUTH is only advertised in its reply.
+                await smtp.ehlo()
+                if not self.use_tls and smtp.supports_extension("starttls"):
+                    await smtp.starttls()
+                    await smtp.ehlo()
+                if smtp.supports_extension("auth"):
+                    await smtp.login(self.email_address, self.password)
+        except Exception:
+            # e.g. rejected credentials: the connection is open and would otherwise be leaked.
+            await self._close(smtp)
+            raise
+        except BaseException:
+            smtp.close()
+            raise
+        self.stats["connections_opened"] += 1
+        return smtp
+
+    async def _close(self, smtp: Optional[aiosmtplib.SMTP]):
+        if smtp is None:
+            return
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _commit(self, force: bool = False):
+        if self._sent_ids and (force or len(self._sent_ids) >= self.commit_batch):
+            ids, self._sent_ids = self._sent_ids, []
+            self.outbox.mark_sent(ids)
+            self.stats["commits"] += 1
+
+    async def _backoff(self, attempt: int):
+        delay = self.backoff_seconds * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def _worker(self, queue: asyncio.Queue):
+        async with smtp_provider_limits.connection(self.host):
+            await self._send_all(queue)
+
+    async def _send_all(self, queue: asyncio.Queue):
+        smtp = None
+        try:
+            while True:
+                try:
+                    email, attempt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    if smtp is None or not smtp.is_connected:
+                        smtp = await self._connect()
+                    async with smtp_limiter.slot():
+                        with observe(SMTP_SEND_SECONDS, span="smtp.send", path="async"):
+                            await smtp.send_message(build_message(self.email_address, email.to, email.subject, email.body,
+                                                                  email.message_id, email.in_reply_to, email.references))
+                except aiosmtplib.SMTPResponseException as e:
+                    if is_transient(e) and attempt < self.max_retries:
+                        await self._close(smtp)
+                        smtp = None
+                        self.stats["retries"] += 1
+                        SMTP_SENDS.inc(path="async", result="retry")
+                        await self._backoff(attempt)
+                        queue.put_nowait((email, attempt + 1))
+                    else:
+                        self._fail(email, e)
+                    continue
+                except CONNECTION_ERRORS as e:
+                    await self._close(smtp)
+                    smtp = None
+                    if attempt < self.max_retries:
+                        self.stats["retries"] += 1
+                        SMTP_SENDS.inc(path="async", result="retry")
+                        await self._backoff(attempt)
+                        queue.put_nowait((email, attempt + 1))
+                    else:
+                        self._fail(email, e)
+                    continue
+                except Exception as e:
+                    self._fail(email, e)
+                    continue
+                self._sent_ids.append(email.id)
+                self.sent_messages.append(email)
+                self.stats["sent"] += 1
+                SMTP_SENDS.inc(path="async", result="sent")
+                print(f"[SENT] Email to: {email.to} (ID: {email.id})")
+                self._commit()
+        finally:
+            await self._close(smtp)
+
+    def _fail(self, email: ScheduledMessage, error: Exception):
+        self.stats["failed"] += 1
+        SMTP_SENDS.inc(path="async", result="failed")
+        self.outbox.release([email.id])
+        print(f"[ERROR] Failed to send scheduled email to {email.to}: {error}")
+
+    async def dispatch(self, emails: List[ScheduledMessage]) -> Dict:
+        """Sends the given (already claimed) outbox messages and returns send statistics."""
+        start = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue()
+        for email in emails:
+            queue.put_nowait((email, 0))
+        workers = min(self.connections, len(emails))
+        try:
+            await asyncio.gather(*(self._worker(queue) for _ in range(workers)))
+        finally:
+            self._commit(force=True)
+            if MAIL_INDEX_ENABLED and self.sent_messages:
+                # Sent replies become drafting context for later mail in the same conversation.
+                from tools.mail_index import index_replies
+                await asyncio.to_thread(index_replies, list(self.sent_messages), self.email_address)
+        elapsed = time.perf_counter() - start
+        self.stats["seconds"] = round(elapsed, 4)
+        self.stats["emails_per_second"] = round(self.stats["sent"] / elapsed, 2) if elapsed > 0 else 0.0
+        return self.stats
+
+
+async def dispatch_due_emails(smtp_server: str, email_address: str, password: str,
+                              outbox: Optional[OutboxBackend] = None, accounts: Optional[List[Account]] = None,
+                              **options) -> Dict:
+    """
+    Claims every due message in the outbox and sends them with an SmtpDispatcher.
+    With accounts, each message goes out from the account it was read from (ScheduledMessage.account),
+    one dispatcher per account, all at once; messages without a known account use the given credentials.
+    """
+    outbox = outbox or get_outbox()
+    due_emails = outbox.claim_due()
+    if not due_emails:
+        return {"sent": 0, "failed": 0}
+    groups: Dict[Tuple[str, str, str], List[ScheduledMessage]] = {}
+    for email in due_emails:
+        account = find_account(email.account, accounts) if accounts else None
+        credentials = (account.smtp_server, account.email, account.password) if account else (smtp_server, email_address, password)
+        groups.setdefault(credentials, []).append(email)
+    dispatchers = [SmtpDispatcher(*credentials, outbox=outbox, **options) for credentials in groups]
+    results = await asyncio.gather(*(dispatcher.dispatch(emails) for dispatcher, emails in zip(dispatchers, groups.values())))
+    if len(results) == 1:
+        return results[0]
+    totals = {key: sum(result[key] for result in results) for key in ("sent", "failed", "retries", "connections_opened", "commits")}
+    totals["accounts"] = len(results)
+    return totals
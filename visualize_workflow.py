@@ -1,12 +1,18 @@
-from langgraph_flow import workflow
+from langgraph_flow import build_workflow
 
 def visualize_workflow():
+    workflow = build_workflow()
     nodes = list(workflow.nodes.keys())
     edges = list(workflow.edges)
     print("Nodes:", nodes)
     print("Edges:")
     for src, tgt in edges:
         print(f"  {src} -> {tgt}")
+    print("Conditional edges:")
+    for src, branches in workflow.branches.items():
+        for name, branch in branches.items():
+            ends = branch.ends.values() if isinstance(branch.ends, dict) else branch.ends
+            print(f"  {src} -> {' | '.join(ends)} (via {name})")
 
 if __name__ == "__main__":
     visualize_workflow()
\ No newline at end of file